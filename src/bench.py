@@ -0,0 +1,849 @@
+# Benchmarks for the Blackijecky server and protocol.
+# Run from the src directory, e.g.:  python bench.py engines --sessions 100 1000 4000
+# `python bench.py suite` checks codec and loopback throughput against the
+# committed baseline, bench_baseline.json, and exits with status 1 on a
+# regression (see bench_suite).
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import timeit
+
+from utils import (
+    RESULT_WIN,
+    RESULT_LOSS,
+    RESULT_TIE,
+    DECISION_HIT,
+)
+from loadgen import STRATEGIES, raise_fd_limit, run_load, run_session
+from metrics import LatencyHistogram
+from protocol import BATCH_CARDS
+from blackijecky import (
+    new_deck,
+    shuffle_deck,
+    draw_card,
+    hand_total,
+    is_bust,
+    dealer_should_hit,
+    card_value,
+    HAND_TRANSITIONS,
+)
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Start `python server.py <args>` quietly and wait until it accepts connections.
+def start_server(port: int, *args: str) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "server.py"), "--port", str(port), *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        cwd=HERE,
+    )
+    deadline = time.monotonic() + 10.0
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"server {args} did not start on port {port}")
+
+
+# ----- Engine comparison (thread vs asyncio) -----
+
+def bench_engines(args):
+    raise_fd_limit()
+    print(f"{'engine':>8} {'sessions':>8} {'ok':>6} {'failed':>6} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'wall s':>7}")
+    for engine in args.engines:
+        port = free_port()
+        proc = start_server(port, "--engine", engine)
+        max_ok = 0
+        try:
+            for sessions in args.sessions:
+                start = time.perf_counter()
+                ok, failed, _, histogram = asyncio.run(
+                    run_load("127.0.0.1", port, sessions, args.rounds, timeout=args.timeout)
+                )
+                wall = time.perf_counter() - start
+                print(f"{engine:>8} {sessions:>8} {ok:>6} {failed:>6} "
+                      f"{histogram.percentile(50) * 1e3:>8.2f} "
+                      f"{histogram.percentile(99) * 1e3:>8.2f} {wall:>7.2f}")
+                if failed:
+                    break
+                max_ok = sessions
+        finally:
+            proc.kill()
+            proc.wait()
+        print(f"{engine:>8} max concurrent sessions without failures: {max_ok}")
+
+
+# ----- Monte Carlo simulation (scalar play_round logic vs NumPy) -----
+
+# One round with the play_round rules; the player hits while
+# hit(player_hand, dealer_up_card) is true.
+def scalar_round(hit):
+    deck = new_deck()
+    shuffle_deck(deck)
+    player_hand = [draw_card(deck), draw_card(deck)]
+    dealer_hand = [draw_card(deck), draw_card(deck)]
+
+    while hit(player_hand, dealer_hand[0]):
+        player_hand.append(draw_card(deck))
+        if is_bust(player_hand):
+            return RESULT_LOSS
+
+    while dealer_should_hit(dealer_hand):
+        dealer_hand.append(draw_card(deck))
+        if is_bust(dealer_hand):
+            return RESULT_WIN
+
+    player_total = hand_total(player_hand)
+    dealer_total = hand_total(dealer_hand)
+    if player_total > dealer_total:
+        return RESULT_WIN
+    if dealer_total > player_total:
+        return RESULT_LOSS
+    return RESULT_TIE
+
+
+# Scalar players for scalar_round, one per simulate.POLICIES entry.
+def scalar_policies():
+    from strategy import load_table
+
+    def threshold(limit):
+        return lambda player_hand, _up: hand_total(player_hand) < limit
+
+    table = load_table()
+
+    def basic(player_hand, up):
+        state = 0
+        for rank, _ in player_hand:
+            state = HAND_TRANSITIONS[state][rank]
+        return table[state][card_value(up[0])] == DECISION_HIT
+
+    return {"dealer": threshold(17), "careful": threshold(15), "risk": threshold(20),
+            "basic": basic}
+
+
+def bench_simulate(args):
+    from simulate import POLICIES, simulate_rounds
+
+    players = scalar_policies()
+    print(f"{'policy':>8} {'engine':>7} {'hands':>10} {'hands/s':>12} "
+          f"{'win':>6} {'loss':>6} {'tie':>6}")
+    for name in POLICIES:
+        start = time.perf_counter()
+        results = [scalar_round(players[name]) for _ in range(args.scalar_hands)]
+        scalar_rate = args.scalar_hands / (time.perf_counter() - start)
+        counts = [results.count(r) for r in (RESULT_WIN, RESULT_LOSS, RESULT_TIE)]
+        print(f"{name:>8} {'scalar':>7} {args.scalar_hands:>10} {scalar_rate:>12,.0f} "
+              + " ".join(f"{c / args.scalar_hands:>6.3f}" for c in counts))
+
+        start = time.perf_counter()
+        counts = simulate_rounds(args.hands, name, seed=args.seed)
+        numpy_rate = args.hands / (time.perf_counter() - start)
+        print(f"{name:>8} {'numpy':>7} {args.hands:>10} {numpy_rate:>12,.0f} "
+              + " ".join(f"{c / args.hands:>6.3f}" for c in counts)
+              + f"  ({numpy_rate / scalar_rate:.0f}x)")
+
+
+# ----- Protocol codec microbenchmark (format strings vs precompiled) -----
+
+def ns_per_op(func, number):
+    timer = timeit.Timer(func)
+    return min(timer.repeat(repeat=5, number=number)) / number * 1e9
+
+
+def bench_protocol(args):
+    import protocol
+    import protocol_reference as reference
+
+    offer = protocol.pack_offer(5000, "bench")
+    request = protocol.pack_request(10, "bench")
+    client_payload = protocol.pack_payload_client(DECISION_HIT)
+    server_payload = protocol.pack_payload_server(RESULT_WIN, 12, 3)
+    frames = bytearray(server_payload * 2)
+    view = memoryview(frames)
+
+    # (name, before, after)
+    cases = [
+        ("pack_offer",
+         lambda: reference.pack_offer(5000, "bench"),
+         lambda: protocol.pack_offer(5000, "bench")),
+        ("unpack_offer",
+         lambda: reference.unpack_offer(offer),
+         lambda: protocol.unpack_offer(offer)),
+        ("pack_request",
+         lambda: reference.pack_request(10, "bench"),
+         lambda: protocol.pack_request(10, "bench")),
+        ("unpack_request",
+         lambda: reference.unpack_request(request),
+         lambda: protocol.unpack_request(request)),
+        ("pack_payload_client",
+         lambda: reference.pack_payload_client(DECISION_HIT),
+         lambda: protocol.pack_payload_client(DECISION_HIT)),
+        ("unpack_payload_client",
+         lambda: reference.unpack_payload_client(client_payload),
+         lambda: protocol.unpack_payload_client(client_payload)),
+        ("pack_payload_server",
+         lambda: reference.pack_payload_server(RESULT_WIN, 12, 3),
+         lambda: protocol.pack_payload_server(RESULT_WIN, 12, 3)),
+        ("server card lookup",
+         lambda: reference.pack_payload_server(RESULT_WIN, 12, 3),
+         lambda: protocol.SERVER_PAYLOADS[RESULT_WIN][12 * 4 + 3]),
+        ("unpack_payload_server",
+         lambda: reference.unpack_payload_server(server_payload),
+         lambda: protocol.unpack_payload_server(server_payload)),
+        ("unpack_payload_server_from",
+         lambda: reference.unpack_payload_server(bytes(view[9:18])),
+         lambda: protocol.unpack_payload_server_from(view, 9)),
+    ]
+
+    print(f"{'operation':>28} {'before ns':>10} {'after ns':>10} {'speedup':>8}")
+    for name, before, after in cases:
+        before_ns = ns_per_op(before, args.number)
+        after_ns = ns_per_op(after, args.number)
+        print(f"{name:>28} {before_ns:>10.1f} {after_ns:>10.1f} {before_ns / after_ns:>7.2f}x")
+
+
+# ----- Regression suite: codec throughput and loopback rounds/s -----
+
+BASELINE = os.path.join(HERE, "bench_baseline.json")
+
+
+# (name, func, calls) for packing and unpacking every message type in
+# protocol.py; calls scales the number of timed calls for the slow cases.
+def codec_cases():
+    import protocol as p
+
+    table = bytes(range(p.POLICY_TABLE_SIZE))
+    frames = {
+        "offer": p.pack_offer(5000, "bench"),
+        "offer_load": p.pack_offer_load(5000, "bench", 10, 100, 5000),
+        "request": p.pack_request(10, "bench"),
+        "payload_client": p.pack_payload_client(DECISION_HIT),
+        "payload_server": p.pack_payload_server(RESULT_WIN, 12, 3),
+        "mux_request": p.pack_mux_request(7, 10, "bench"),
+        "mux_payload_client": p.pack_mux_payload_client(7, DECISION_HIT),
+        "mux_payload_server": p.pack_mux_payload_server(7, RESULT_WIN, 12, 3),
+        "stream_request": p.pack_stream_request(1000, 256, "bench"),
+        "stream_credit": p.pack_stream_credit(128),
+        "stream_end": p.pack_stream_end(1000),
+        "policy_request": p.pack_policy_request(1000, "bench", 0, table),
+        "batch_request": p.pack_batch_request(1000, "bench", 0, table, p.BATCH_CARDS),
+    }
+    results = bytes([RESULT_WIN, RESULT_LOSS, RESULT_TIE, RESULT_LOSS]) * 250
+    cards = bytes([2, 3, 4, 8, 12, 16, 20]) * 1000
+    batch = p.pack_batch_results(results, cards)
+    frames_buffer = memoryview(bytes(3) + frames["payload_server"])
+    return [
+        ("pack_offer", lambda: p.pack_offer(5000, "bench"), 1),
+        ("unpack_offer", lambda: p.unpack_offer(frames["offer"]), 1),
+        ("pack_offer_load", lambda: p.pack_offer_load(5000, "bench", 10, 100, 5000), 1),
+        ("unpack_offer_load", lambda: p.unpack_offer_load(frames["offer_load"]), 1),
+        ("pack_request", lambda: p.pack_request(10, "bench"), 1),
+        ("unpack_request", lambda: p.unpack_request(frames["request"]), 1),
+        ("pack_payload_client", lambda: p.pack_payload_client(DECISION_HIT), 1),
+        ("unpack_payload_client", lambda: p.unpack_payload_client(frames["payload_client"]), 1),
+        ("pack_payload_server", lambda: p.pack_payload_server(RESULT_WIN, 12, 3), 1),
+        ("unpack_payload_server", lambda: p.unpack_payload_server(frames["payload_server"]), 1),
+        ("unpack_payload_server_from", lambda: p.unpack_payload_server_from(frames_buffer, 3), 1),
+        ("pack_mux_request", lambda: p.pack_mux_request(7, 10, "bench"), 1),
+        ("unpack_mux_request", lambda: p.unpack_mux_request(frames["mux_request"]), 1),
+        ("pack_mux_payload_client", lambda: p.pack_mux_payload_client(7, DECISION_HIT), 1),
+        ("unpack_mux_payload_client", lambda: p.unpack_mux_payload_client(frames["mux_payload_client"]), 1),
+        ("pack_mux_payload_server", lambda: p.pack_mux_payload_server(7, RESULT_WIN, 12, 3), 1),
+        ("unpack_mux_payload_server", lambda: p.unpack_mux_payload_server(frames["mux_payload_server"]), 1),
+        ("pack_stream_request", lambda: p.pack_stream_request(1000, 256, "bench"), 1),
+        ("unpack_stream_request", lambda: p.unpack_stream_request(frames["stream_request"]), 1),
+        ("pack_stream_credit", lambda: p.pack_stream_credit(128), 1),
+        ("unpack_stream_credit", lambda: p.unpack_stream_credit(frames["stream_credit"]), 1),
+        ("pack_stream_end", lambda: p.pack_stream_end(1000), 1),
+        ("unpack_stream_end", lambda: p.unpack_stream_end(frames["stream_end"]), 1),
+        ("pack_policy_request", lambda: p.pack_policy_request(1000, "bench", 0, table), 1),
+        ("unpack_policy_request", lambda: p.unpack_policy_request(frames["policy_request"]), 1),
+        ("pack_batch_request", lambda: p.pack_batch_request(1000, "bench", 0, table, p.BATCH_CARDS), 1),
+        ("unpack_batch_request", lambda: p.unpack_batch_request(frames["batch_request"]), 1),
+        ("pack_batch_results[1000]", lambda: p.pack_batch_results(results, cards), 0.01),
+        ("unpack_batch_results", lambda: p.unpack_batch_results(batch[:p.BATCH_RESULTS_SIZE]), 1),
+        ("unpack_batch_cards[1000]", lambda: p.unpack_batch_cards(cards), 0.001),
+    ]
+
+
+# Rounds/s of legacy sessions over loopback at each concurrency level, each
+# level playing about `budget` rounds (at most 255 per session), best of
+# `passes` runs. Returns {sessions: (rounds/s, failed sessions)}.
+def loopback_rates(levels, budget, engine, passes=1):
+    raise_fd_limit()
+    port = free_port()
+    top = str(max(levels))
+    proc = start_server(port, "--coalesce", "--engine", engine,
+                        "--max-sessions", top, "--queue", top, "--backlog", top)
+    rates = {}
+    try:
+        for _ in range(passes):
+            for sessions in levels:
+                rounds = min(255, max(1, budget // sessions))
+                start = time.perf_counter()
+                _, failed, played, _ = asyncio.run(
+                    run_load("127.0.0.1", port, sessions, rounds, connect_concurrency=500)
+                )
+                rate = played / (time.perf_counter() - start)
+                best, failures = rates.get(sessions, (0.0, 0))
+                rates[sessions] = max(rate, best), failures + failed
+    finally:
+        proc.kill()
+        proc.wait()
+    return rates
+
+
+# A frozen workload timed with every run: the original codec kept unchanged
+# in protocol_reference.py. Its time tracks how fast the machine is at the
+# moment, so compare() can tell a slower codec from a slower machine.
+def calibration_case():
+    import protocol_reference as reference
+
+    frame = reference.pack_payload_server(RESULT_WIN, 12, 3)
+    return "calibration", lambda: reference.unpack_payload_server(frame), 1
+
+
+# Lines comparing results with a baseline of the same shape, and whether any
+# metric regressed by more than tolerance (a fraction). Codec times regress
+# upwards, loopback rates downwards; metrics missing from either side are
+# reported but never flagged. Changes are adjusted for machine speed by the
+# ratio of the two runs' calibration times.
+def compare(results, baseline, tolerance):
+    speed = 1.0
+    if baseline.get("calibration_ns") and results.get("calibration_ns"):
+        speed = baseline["calibration_ns"] / results["calibration_ns"]
+    lines = [f"machine speed vs baseline: {speed:.2f}x (changes below are adjusted for it)",
+             f"{'metric':>36} {'baseline':>12} {'now':>12} {'change':>8}"]
+    regressed = False
+    sections = (("codecs_ns", "ns", 1), ("loopback_rounds_per_sec", "rounds/s", -1),
+                ("mux_rounds_per_sec", "tables: rounds/s", -1))
+    for section, unit, worse in sections:
+        base_section = baseline.get(section, {})
+        for name, value in results[section].items():
+            base = base_section.get(name)
+            if not base:
+                lines.append(f"{name + ' ' + unit:>36} {'-':>12} {value:>12,.1f} {'new':>8}")
+                continue
+            change = (value * speed if worse > 0 else value / speed) / base - 1
+            flag = ""
+            if worse * change > tolerance:
+                flag = "  REGRESSION"
+                regressed = True
+            lines.append(f"{name + ' ' + unit:>36} {base:>12,.1f} {value:>12,.1f} "
+                         f"{change * 100:>+7.1f}%{flag}")
+    return lines, regressed
+
+
+def bench_suite(args):
+    regressed = False
+    results = {
+        "host": {"python": platform.python_version(), "machine": platform.machine(),
+                 "cpus": os.cpu_count()},
+        "calibration_ns": None,
+        "codecs_ns": {},
+        "loopback_rounds_per_sec": {},
+        "mux_rounds_per_sec": {},
+    }
+    # The best of several passes over all cases, so a burst of load on the
+    # machine does not land on the same case every time.
+    times = {}
+    cases = [calibration_case()] + ([] if args.skip_codecs else codec_cases())
+    for _ in range(args.passes):
+        for name, func, calls in cases:
+            ns = round(ns_per_op(func, max(1, int(args.number * calls))), 1)
+            times[name] = min(ns, times.get(name, ns))
+    results["calibration_ns"] = times.pop("calibration")
+    results["codecs_ns"] = times
+    if not args.skip_loopback:
+        with contextlib.redirect_stdout(io.StringIO()):
+            rates = loopback_rates(args.sessions, args.rounds, args.engine, args.loopback_passes)
+        results["loopback_rounds_per_sec"] = {str(n): round(rate, 1) for n, (rate, _) in rates.items()}
+        for sessions, (_, failed) in rates.items():
+            if failed:
+                print(f"loopback: {failed} of {sessions} sessions failed")
+                regressed = True
+        # Many tables on one connection of the thread engine, whose replies
+        # to a burst of decisions go out in as few writes as possible.
+        with contextlib.redirect_stdout(io.StringIO()):
+            rates = mux_rates(args.mux_tables, 5, "thread")
+        results["mux_rounds_per_sec"] = {str(n): round(rate, 1) for n, (rate, _) in rates.items()}
+        for tables, (_, failed) in rates.items():
+            if failed:
+                print(f"mux: {failed} of {tables} tables failed (thread engine)")
+                regressed = True
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    lines, worse = compare(results, baseline, args.tolerance)
+    regressed = regressed or worse
+    print("\n".join(lines))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.update:
+        # Sections skipped in this run keep their baseline values.
+        updated = {**baseline, **{key: value for key, value in results.items() if value}}
+        with open(args.baseline, "w") as f:
+            json.dump(updated, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+    elif regressed:
+        print(f"Regressions beyond {args.tolerance:.0%} of {args.baseline}, or failed sessions")
+        sys.exit(1)
+
+
+# ----- Coalesced writes (one sendall per card vs one write per turn) -----
+
+# A socket that counts the send/recv syscalls the server makes on it.
+class CountingSocket(socket.socket):
+    sends = 0
+    recvs = 0
+
+    def sendall(self, data, *args):
+        CountingSocket.sends += 1
+        return super().sendall(data, *args)
+
+    def sendmsg(self, buffers, *args):
+        CountingSocket.sends += 1
+        return super().sendmsg(buffers, *args)
+
+    def recv_into(self, buffer, *args):
+        CountingSocket.recvs += 1
+        return super().recv_into(buffer, *args)
+
+
+# Run the threaded server engine in this process, on counting sockets.
+def serve_counting(listener, coalesce):
+    import server
+
+    while True:
+        try:
+            conn, addr = listener.accept()
+        except OSError:
+            return
+        conn = CountingSocket(fileno=conn.detach())
+        threading.Thread(
+            target=server.handle_tcp_client, args=(conn, addr, coalesce), daemon=True
+        ).start()
+
+
+# Start the threaded engine in this process; returns the listener and its port.
+def start_in_process_server(coalesce):
+    listener = socket.create_server(("127.0.0.1", 0))
+    threading.Thread(target=serve_counting, args=(listener, coalesce), daemon=True).start()
+    return listener, listener.getsockname()[1]
+
+
+def bench_coalesce(args):
+    rows = []
+    with contextlib.redirect_stdout(io.StringIO()):   # silence the server's connect/close lines
+        for coalesce in (False, True):
+            listener, port = start_in_process_server(coalesce)
+            CountingSocket.sends = CountingSocket.recvs = 0
+            start = time.perf_counter()
+            ok, failed, rounds, histogram = asyncio.run(
+                run_load("127.0.0.1", port, args.sessions, args.rounds)
+            )
+            elapsed = time.perf_counter() - start
+            listener.close()
+            rows.append((coalesce, rounds, elapsed, histogram,
+                         CountingSocket.sends, CountingSocket.recvs))
+
+    print(f"{'coalesce':>8} {'rounds':>7} {'sends/rnd':>9} {'recvs/rnd':>9} "
+          f"{'rnd ms':>8} {'p99 msg ms':>10} {'rounds/s':>9}")
+    for coalesce, rounds, elapsed, histogram, sends, recvs in rows:
+        print(f"{str(coalesce):>8} {rounds:>7} {sends / rounds:>9.2f} {recvs / rounds:>9.2f} "
+              f"{elapsed * args.sessions / rounds * 1e3:>8.3f} "
+              f"{histogram.percentile(99) * 1e3:>10.3f} {rounds / elapsed:>9.0f}")
+
+
+# ----- Policy sessions on a slow link -----
+
+# Copy reader to writer, delivering every chunk `delay` seconds after it was
+# read (one direction of a link with that one-way latency).
+async def delayed_pipe(reader, writer, delay):
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+
+    async def deliver():
+        while True:
+            due, data = await chunks.get()
+            if data is None:
+                break
+            await asyncio.sleep(max(0.0, due - loop.time()))
+            writer.write(data)
+            await writer.drain()
+        writer.close()
+
+    delivery = asyncio.create_task(deliver())
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            chunks.put_nowait((loop.time() + delay, data))
+    finally:
+        chunks.put_nowait((0.0, None))
+        await delivery
+
+
+# Forward connections on a new local port to target_port with rtt seconds
+# of added round-trip time. Returns (server, port).
+async def start_delay_proxy(target_port, rtt):
+    async def handle(client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection("127.0.0.1", target_port)
+        with contextlib.suppress(asyncio.CancelledError):  # still open when the run ends
+            await asyncio.gather(
+                delayed_pipe(client_reader, server_writer, rtt / 2),
+                delayed_pipe(server_reader, client_writer, rtt / 2),
+                return_exceptions=True,
+            )
+
+    proxy = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return proxy, proxy.sockets[0].getsockname()[1]
+
+
+async def run_through_proxy(port, rtt, sessions, rounds, strategy, pipeline):
+    proxy, proxy_port = await start_delay_proxy(port, rtt)
+    async with proxy:
+        return await run_load("127.0.0.1", proxy_port, sessions, rounds, strategy,
+                              stream=not pipeline, pipeline=pipeline)
+
+
+def bench_pipeline(args):
+    port = free_port()
+    proc = start_server(port, "--coalesce")
+    try:
+        print(f"{'rtt ms':>6} {'session':>9} {'rounds':>7} {'ms/round':>9} {'rounds/s':>9}")
+        for rtt_ms in args.rtt_ms:
+            for pipeline in (False, True):
+                start = time.perf_counter()
+                _, failed, rounds, _ = asyncio.run(run_through_proxy(
+                    port, rtt_ms / 1e3, args.sessions, args.rounds, args.strategy, pipeline
+                ))
+                elapsed = time.perf_counter() - start
+                if failed:
+                    print(f"{failed} sessions failed")
+                print(f"{rtt_ms:>6} {'policy' if pipeline else 'stream':>9} {rounds:>7} "
+                      f"{elapsed * args.sessions / rounds * 1e3:>9.2f} {rounds / elapsed:>9.0f}")
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+# ----- Multiplexed tables: hundreds of tables on one connection -----
+
+# Rounds/s of `tables` multiplexed tables on one connection for each table
+# count, on a fresh server of the given engine.
+# Returns {tables: (rounds/s, failed tables)}.
+def mux_rates(levels, rounds, engine):
+    port = free_port()
+    proc = start_server(port, "--coalesce", "--engine", engine)
+    rates = {}
+    try:
+        for tables in levels:
+            start = time.perf_counter()
+            _, failed, played, _ = asyncio.run(
+                run_load("127.0.0.1", port, tables, rounds, mux=tables)
+            )
+            rates[tables] = played / (time.perf_counter() - start), failed
+    finally:
+        proc.kill()
+        proc.wait()
+    return rates
+
+
+def bench_mux(args):
+    failures = 0
+    print(f"{'engine':>8} {'tables':>7} {'failed':>7} {'rounds/s':>10}")
+    for engine in args.engines:
+        for tables, (rate, failed) in mux_rates(args.tables, args.rounds, engine).items():
+            print(f"{engine:>8} {tables:>7} {failed:>7} {rate:>10,.0f}")
+            failures += failed
+    if failures:
+        sys.exit(1)
+
+
+# ----- Batch sessions: rounds per second on one connection -----
+
+# Session kinds compared by bench_batch, as run_load keyword arguments.
+BATCH_MODES = {
+    "stream": {"stream": True},
+    "policy": {"pipeline": True},
+    "batch": {"batch": 0},
+    "batch+cards": {"batch": BATCH_CARDS},
+}
+
+
+def bench_batch(args):
+    port = free_port()
+    proc = start_server(port, "--coalesce", "--engine", args.engine)
+    try:
+        print(f"{'session':>12} {'rounds':>8} {'seconds':>8} {'rounds/s':>10}")
+        for mode in args.modes:
+            start = time.perf_counter()
+            _, failed, rounds, _ = asyncio.run(run_load(
+                "127.0.0.1", port, 1, args.rounds, args.strategy, **BATCH_MODES[mode]
+            ))
+            elapsed = time.perf_counter() - start
+            if failed:
+                print(f"{mode} session failed")
+            print(f"{mode:>12} {rounds:>8} {elapsed:>8.2f} {rounds / elapsed:>10,.0f}")
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+# ----- Shuffling: shared global generator vs one generator per session -----
+
+# Shuffle `shoes` shoes on each of `threads` threads; returns shoes/s.
+# rng_for(thread index) gives the generator a thread shuffles with.
+def shuffle_rate(threads, shoes, decks, rng_for):
+    from shoe import shuffled_shoe
+
+    start_line = threading.Barrier(threads + 1)
+
+    def work(index):
+        rng = rng_for(index)
+        start_line.wait()
+        for _ in range(shoes):
+            shuffled_shoe(decks, rng)
+
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    start_line.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return threads * shoes / (time.perf_counter() - start)
+
+
+def bench_shuffle(args):
+    import random
+    from shoe import session_rng
+
+    modes = {
+        "global": lambda index: random,
+        "session": lambda index: session_rng(args.seed, index),
+    }
+    print(f"{'threads':>7} " + " ".join(f"{mode + ' shoes/s':>16}" for mode in modes))
+    for threads in args.threads:
+        rates = [shuffle_rate(threads, args.shoes, args.decks, rng_for) for rng_for in modes.values()]
+        print(f"{threads:>7} " + " ".join(f"{rate:>16,.0f}" for rate in rates))
+
+
+# ----- Server instrumentation overhead -----
+
+def bench_metrics(args):
+    import server
+
+    for enabled in (False, True):
+        server.METRICS.enabled = enabled
+        print(f"record() with metrics {'on' if enabled else 'off'}: "
+              f"{ns_per_op(lambda: server.METRICS.record('bench', 1e-4), 200_000):.1f} ns/op")
+    server.METRICS = type(server.METRICS)()   # drop the microbenchmark samples
+
+    rows = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.repeat):
+            for enabled in (False, True):
+                server.METRICS.enabled = enabled
+                listener, port = start_in_process_server(coalesce=True)
+                start = time.perf_counter()
+                _, _, rounds, _ = asyncio.run(
+                    run_load("127.0.0.1", port, args.sessions, args.rounds)
+                )
+                rows.append((enabled, rounds / (time.perf_counter() - start)))
+                listener.close()
+
+    for enabled in (False, True):
+        rates = [rate for on, rate in rows if on == enabled]
+        print(f"metrics {'on ' if enabled else 'off'}: best {max(rates):,.0f} rounds/s "
+              f"over {len(rates)} runs")
+    print()
+    print(server.METRICS.report())
+
+
+# ----- Load-aware server selection -----
+
+# Start sessions at a steady rate, each on the server the policy picks.
+# Returns (per-message histogram, sessions per server port, failed sessions).
+async def balanced_load(directory, policy, sessions, rounds, interval):
+    histogram = LatencyHistogram()
+    gate = asyncio.Semaphore(100)
+    per_server = {}
+    tasks = []
+    for _ in range(sessions):
+        server = await directory.pick_async(policy)
+        per_server[server.tcp_port] = per_server.get(server.tcp_port, 0) + 1
+        tasks.append(asyncio.create_task(
+            run_session(server.ip, server.tcp_port, rounds, STRATEGIES["dealer"], histogram, gate)
+        ))
+        await asyncio.sleep(interval)
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    failed = sum(isinstance(result, BaseException) for result in results)
+    return histogram, per_server, failed
+
+
+def bench_balance(args):
+    from discovery import ServerDirectory
+
+    raise_fd_limit()
+    directory = ServerDirectory()
+    directory.start()
+    ports = [free_port() for _ in range(args.servers)]
+    procs = [start_server(port, "--coalesce", "--capacity", str(args.capacity)) for port in ports]
+    try:
+        deadline = time.monotonic() + 5.0
+        while {s.tcp_port for s in directory.servers()} < set(ports):
+            if time.monotonic() > deadline:
+                raise RuntimeError("not every server's offer was heard")
+            time.sleep(0.1)
+
+        print(f"{'policy':>12} {'failed':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  sessions per server")
+        for policy in args.policies:
+            histogram, per_server, failed = asyncio.run(
+                balanced_load(directory, policy, args.sessions, args.rounds, args.interval)
+            )
+            spread = " ".join(str(per_server.get(port, 0)) for port in ports)
+            print(f"{policy:>12} {failed:>6} {histogram.percentile(50) * 1e3:>8.2f} "
+                  f"{histogram.percentile(95) * 1e3:>8.2f} {histogram.percentile(99) * 1e3:>8.2f}  {spread}")
+            time.sleep(2.5)  # let every server's load offer catch up
+    finally:
+        for proc in procs:
+            proc.kill()
+            proc.wait()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Blackijecky benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    engines = commands.add_parser("engines", help="thread vs asyncio server engine")
+    engines.add_argument("--engines", nargs="+", default=["thread", "asyncio"])
+    engines.add_argument("--sessions", type=int, nargs="+",
+                         default=[100, 500, 1000, 2000, 4000])
+    engines.add_argument("--rounds", type=int, default=20)
+    engines.add_argument("--timeout", type=float, default=120.0,
+                         help="seconds allowed per concurrency level")
+    engines.set_defaults(func=bench_engines)
+
+    simulate = commands.add_parser("simulate", help="scalar vs NumPy Monte Carlo")
+    simulate.add_argument("--hands", type=int, default=2_000_000)
+    simulate.add_argument("--scalar-hands", type=int, default=50_000)
+    simulate.add_argument("--seed", type=int, default=0)
+    simulate.set_defaults(func=bench_simulate)
+
+    coalesce = commands.add_parser("coalesce", help="per-card sendall vs coalesced writes")
+    coalesce.add_argument("--sessions", type=int, default=1)
+    coalesce.add_argument("--rounds", type=int, default=100)
+    coalesce.set_defaults(func=bench_coalesce)
+
+    pipeline = commands.add_parser("pipeline",
+                                   help="client decisions vs policy sessions on a slow link")
+    pipeline.add_argument("--rtt-ms", type=float, nargs="+", default=[1, 20, 80])
+    pipeline.add_argument("--sessions", type=int, default=10)
+    pipeline.add_argument("--rounds", type=int, default=100)
+    pipeline.add_argument("--strategy", choices=sorted(STRATEGIES), default="dealer")
+    pipeline.set_defaults(func=bench_pipeline)
+
+    mux = commands.add_parser("mux", help="hundreds of multiplexed tables on one connection")
+    mux.add_argument("--tables", type=int, nargs="+", default=[100, 500, 1000])
+    mux.add_argument("--rounds", type=int, default=10)
+    mux.add_argument("--engines", nargs="+", default=["thread", "asyncio"])
+    mux.set_defaults(func=bench_mux)
+
+    batch = commands.add_parser("batch", help="rounds/s of one connection by session kind")
+    batch.add_argument("--rounds", type=int, default=50_000)
+    batch.add_argument("--strategy", choices=sorted(STRATEGIES), default="basic")
+    batch.add_argument("--engine", choices=["thread", "asyncio"], default="thread")
+    batch.add_argument("--modes", nargs="+", choices=list(BATCH_MODES), default=list(BATCH_MODES))
+    batch.set_defaults(func=bench_batch)
+
+    shuffle = commands.add_parser("shuffle", help="global vs per-session shuffle generators")
+    shuffle.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16, 64])
+    shuffle.add_argument("--shoes", type=int, default=5_000, help="shoes shuffled per thread")
+    shuffle.add_argument("--decks", type=int, default=1)
+    shuffle.add_argument("--seed", type=int, default=0)
+    shuffle.set_defaults(func=bench_shuffle)
+
+    metrics = commands.add_parser("metrics", help="server instrumentation overhead")
+    metrics.add_argument("--sessions", type=int, default=20)
+    metrics.add_argument("--rounds", type=int, default=100)
+    metrics.add_argument("--repeat", type=int, default=3)
+    metrics.set_defaults(func=bench_metrics)
+
+    balance = commands.add_parser("balance",
+                                  help="load-aware server selection vs first offer wins")
+    balance.add_argument("--servers", type=int, default=3)
+    balance.add_argument("--capacity", type=int, default=100)
+    balance.add_argument("--sessions", type=int, default=300)
+    balance.add_argument("--rounds", type=int, default=50)
+    balance.add_argument("--interval", type=float, default=0.01,
+                         help="seconds between session starts")
+    balance.add_argument("--policies", nargs="+", default=["first-offer", "least-loaded"])
+    balance.set_defaults(func=bench_balance)
+
+    suite = commands.add_parser("suite",
+                                help="codec and loopback throughput against the baseline file")
+    suite.add_argument("--baseline", default=BASELINE)
+    suite.add_argument("--update", action="store_true",
+                       help="write this run's results as the new baseline")
+    suite.add_argument("--output", default=None, help="also write this run's results here (JSON)")
+    suite.add_argument("--tolerance", type=float, default=0.25,
+                       help="fraction a metric may worsen before it is flagged")
+    suite.add_argument("--number", type=int, default=20_000, help="calls per codec timing")
+    suite.add_argument("--passes", type=int, default=5, help="codec timing passes (best is kept)")
+    suite.add_argument("--sessions", type=int, nargs="+", default=[1, 100, 10_000],
+                       help="loopback concurrency levels")
+    suite.add_argument("--rounds", type=int, default=20_000,
+                       help="rounds played per loopback level (at most 255 per session)")
+    suite.add_argument("--loopback-passes", type=int, default=2,
+                       help="loopback runs per level (best is kept)")
+    suite.add_argument("--engine", choices=["thread", "asyncio"], default="asyncio")
+    suite.add_argument("--mux-tables", type=int, nargs="+", default=[500, 1000],
+                       help="multiplexed tables on one thread engine connection")
+    suite.add_argument("--skip-codecs", action="store_true")
+    suite.add_argument("--skip-loopback", action="store_true")
+    suite.set_defaults(func=bench_suite)
+
+    protocol = commands.add_parser("protocol", help="protocol codec ns/op before and after")
+    protocol.add_argument("--number", type=int, default=200_000)
+    protocol.set_defaults(func=bench_protocol)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,18 @@ from utils import (
 # Card is represented as a tuple: (rank, suit)
 Card = Tuple[int, int]
 
+# Compact card code: rank * 4 + suit, fits in one byte (see shoe.py).
+# Code 0 (rank 0) is never a real card.
+CardCode = int
+
+
+def card_code(rank: int, suit: int) -> CardCode:
+    return rank * 4 + suit
+
+
+def card_from_code(code: CardCode) -> Card:
+    return code >> 2, code & 3
+
 # Create a new standard 52-card deck.
 def new_deck() -> List[Card]:
     deck: list[Card]= []
@@ -22,9 +34,10 @@ def new_deck() -> List[Card]:
             deck.append((rank, suit))
     return deck
 
-# Shuffle the deck in place.
-def shuffle_deck(deck: List[Card]) -> None:
-    random.shuffle(deck)
+# Shuffle the deck in place, with the global generator unless rng (a
+# random.Random, e.g. from shoe.session_rng) is given.
+def shuffle_deck(deck: List[Card], rng=random) -> None:
+    rng.shuffle(deck)
 
 
 def draw_card(deck: List[Card]) -> Card:
@@ -66,3 +79,66 @@ def is_bust(hand: List[Card]) -> bool:
 
 def dealer_should_hit(hand: List[Card]) -> bool:
     return hand_total(hand) < 17        # hit if total is less than 17 otherwise stand  
+
+
+# ----- Incremental hands -----
+
+# A hand state is one small int: its hand_total() in the low 5 bits (bust
+# totals are capped at 31), plus HAND_SOFT while an ace still counts as 11.
+HAND_SOFT = 32
+HAND_TOTAL_MASK = HAND_SOFT - 1
+
+
+def _next_hand_state(state: int, rank: int) -> int:
+    total = (state & HAND_TOTAL_MASK) + card_value(rank)
+    soft_aces = (1 if state & HAND_SOFT else 0) + (1 if rank == 1 else 0)
+    while total > 21 and soft_aces > 0:
+        total -= 10
+        soft_aces -= 1
+    return min(total, HAND_TOTAL_MASK) | (HAND_SOFT if soft_aces else 0)
+
+
+# HAND_TRANSITIONS[state][rank] is the state after adding a card of that rank.
+HAND_TRANSITIONS = [
+    [_next_hand_state(state, rank) if rank else state for rank in range(MAX_RANK + 1)]
+    for state in range(2 * HAND_SOFT)
+]
+
+
+# A hand that keeps its total up to date as cards are added.
+# Cards are stored as card codes; adding one is a table lookup, and total,
+# bust and soft checks are O(1). Iterating a Hand yields (rank, suit) cards,
+# so print_cards() and hand_total() accept it.
+class Hand:
+    __slots__ = ("cards", "state")
+
+    def __init__(self, codes=()):
+        self.cards: List[CardCode] = []
+        self.state = 0
+        for code in codes:
+            self.add(code)
+
+    def add(self, code: CardCode) -> None:
+        self.cards.append(code)
+        self.state = HAND_TRANSITIONS[self.state][code >> 2]
+
+    @property
+    def total(self) -> int:
+        return self.state & HAND_TOTAL_MASK
+
+    # True while an ace is counted as 11 (e.g. a soft 17).
+    @property
+    def soft(self) -> bool:
+        return self.state >= HAND_SOFT
+
+    def is_bust(self) -> bool:
+        return self.state & HAND_TOTAL_MASK > 21
+
+    def dealer_should_hit(self) -> bool:
+        return self.state & HAND_TOTAL_MASK < 17
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def __iter__(self):
+        return (card_from_code(code) for code in self.cards)
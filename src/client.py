@@ -1,60 +1,113 @@
 import socket
-import struct
+import time
 
 from protocol import (
-    PAYLOAD_SERVER_FORMAT,
-    unpack_offer,
+    PAYLOAD_SERVER_SIZE,
+    STREAM_END_SIZE,
     pack_request,
     unpack_payload_server,
     pack_payload_client,
+    pack_stream_request,
+    pack_stream_credit,
+    unpack_stream_end,
+    pack_policy_request,
+    BATCH_RESULTS_SIZE,
+    pack_batch_request,
+    unpack_batch_results,
 )
 from utils import (
-    UDP_OFFER_PORT,
     RESULT_NOT_OVER,
     RESULT_WIN,
     RESULT_LOSS,
     RESULT_TIE,
     DECISION_HIT,
     DECISION_STAND,
-    format_card,
-    recv_exact,
+    FrameReader,
     print_cards,
 )
-from blackijecky import hand_total
+from blackijecky import Hand, card_code
+from strategy import load_table, pack_table
+from discovery import ServerDirectory
+from render import CARD_NAMES, RENDER_FULL, RENDER_SUMMARY, RENDER_SILENT, Renderer
 
 
 TEAM_NAME = "DealMeASliceClient"
 
+MAX_ROUNDS = 2**32 - 1     # more than 255 rounds are played as a streaming session
+STREAM_WINDOW = 256        # rounds of credit a streaming client keeps granted
+
+# Precomputed basic strategy, BASIC_STRATEGY[hand.state][up_value] (see strategy.py).
+BASIC_STRATEGY = load_table()
+
+# Live servers heard from in the background; started by main().
+DIRECTORY = ServerDirectory()
+
 
 
 def choose_mode():
     while True:
         try:
-            choice = input("Choose mode:\n1) dealer like mode \n2) manual mode\n3) careful mode\n4) risk mode\n").strip().lower()
-            if choice in ("1", "2", "3", "4"):
+            choice = input("Choose mode:\n1) dealer like mode \n2) manual mode\n3) careful mode\n4) risk mode\n5) basic strategy mode\n").strip().lower()
+            if choice in ("1", "2", "3", "4", "5"):
                 return choice
-            print("Please type '1' for dealer like mode, '2' for manual mode, '3' for careful mode, or '4' for risk mode")
+            print("Please type '1' for dealer like mode, '2' for manual mode, '3' for careful mode, '4' for risk mode, or '5' for basic strategy mode")
         except KeyboardInterrupt:
             print("\nInterrupted by user.")
             raise
 
 
-def as_dealer_decision(hand):
-    decision = DECISION_HIT if hand_total(hand) < 17 else DECISION_STAND
-    print(f"Decision: {decision.decode()}")
-    return decision
+def choose_pipelined():
+    while True:
+        try:
+            choice = input("Let the server play this strategy for you? Much faster on slow "
+                           "links, DealMeASlice servers only (yes/no): ").strip().lower()
+            if choice in ("yes", "no"):
+                return choice == "yes"
+            print("Please type 'yes' or 'no'")
+        except KeyboardInterrupt:
+            print("\nInterrupted by user.")
+            raise
+
 
-def careful_decision(hand):
-    decision = DECISION_HIT if hand_total(hand) < 15 else DECISION_STAND
-    print(f"Decision: {decision.decode()}")
-    return decision
+def choose_verbosity():
+    while True:
+        try:
+            choice = input("Choose output:\n1) full (cards)\n2) summary (one line per round)\n3) silent (statistics only)\n").strip()
+            if choice in ("1", "2", "3"):
+                return {"1": RENDER_FULL, "2": RENDER_SUMMARY, "3": RENDER_SILENT}[choice]
+            print("Please type '1' for full, '2' for summary or '3' for silent output")
+        except KeyboardInterrupt:
+            print("\nInterrupted by user.")
+            raise
 
-def risk_decision(hand):
-    decision = DECISION_HIT if hand_total(hand) < 20 else DECISION_STAND
-    print(f"Decision: {decision.decode()}")
-    return decision
 
-def manual_decision(_hand):
+# Decision functions are called as decision_func(hand, dealer_hand), where
+# dealer_hand holds only the dealer's visible card. They do not print: main()
+# reports automatic decisions through its Renderer.
+
+# Hit below the threshold, stand otherwise. Pure policy, no printing.
+def threshold_decision(hand, threshold):
+    return DECISION_HIT if hand.total < threshold else DECISION_STAND
+
+
+# Table lookup on the player's hand and the dealer's up-card. Pure policy, no printing.
+def basic_strategy_decision(hand, dealer_hand):
+    return BASIC_STRATEGY[hand.state][dealer_hand.total]
+
+
+def as_dealer_decision(hand, _dealer_hand):
+    return threshold_decision(hand, 17)
+
+def careful_decision(hand, _dealer_hand):
+    return threshold_decision(hand, 15)
+
+def risk_decision(hand, _dealer_hand):
+    return threshold_decision(hand, 20)
+
+def basic_decision(hand, dealer_hand):
+    return basic_strategy_decision(hand, dealer_hand)
+
+def manual_decision(_hand, _dealer_hand):
     while True:
         try:
             choice = input("Hit or Stand? ").strip().lower()
@@ -68,54 +121,57 @@ def manual_decision(_hand):
             raise
 
 
-def play_round(tcp_sock, decision_func):
-    player_hand = []
-    dealer_hand = []
+def show_card(message, label, hand):
+    print(message)
+    print(label)
+    print_cards(hand)
+
+
+# The client side of a round, independent of the socket.
+# The generator yields a decision to send, or None when it needs the next
+# server payload, which the caller sends back in as (result, rank, suit).
+# show(message, label, hand) is called for every card unless show is None.
+# The round result is the generator's return value.
+def round_steps(decision_func, show=show_card):
+    player_hand = Hand()
+    dealer_hand = Hand()
 
     # -------- Phase 1: Initial deal --------
     # Expect: 2 player cards + 1 dealer visible card
     for _ in range(3):
-        data = recv_exact(tcp_sock, struct.calcsize(PAYLOAD_SERVER_FORMAT))
-        payload = unpack_payload_server(data)
-        if payload is None:
-            raise RuntimeError("Invalid payload from server")
-
-        result, rank, suit = payload
+        result, rank, suit = yield
 
         if rank == 0:
             raise RuntimeError("Expected card during initial deal")
 
+        code = card_code(rank, suit)
         if len(player_hand) < 2:
-            player_hand.append((rank, suit))
-            print(f"You received: {format_card(rank, suit)} (total: {hand_total(player_hand)})")
-            print("your hand:")
-            print_cards(player_hand)
+            player_hand.add(code)
+            if show:
+                show(f"You received: {CARD_NAMES[code]} (total: {player_hand.total})",
+                     "your hand:", player_hand)
         else:
-            dealer_hand.append((rank, suit))
-            print(f"Dealer's visible card: {format_card(rank, suit)} (total: {hand_total(dealer_hand)})")
-            print("dealer hand:")
-            print_cards(dealer_hand)
+            dealer_hand.add(code)
+            if show:
+                show(f"Dealer's visible card: {CARD_NAMES[code]} (total: {dealer_hand.total})",
+                     "dealer hand:", dealer_hand)
 
     # -------- Phase 2: Player turn --------
     while True:
-        decision = decision_func(player_hand)
-        tcp_sock.sendall(pack_payload_client(decision))
+        decision = decision_func(player_hand, dealer_hand)
+        yield decision
 
         if decision == DECISION_STAND:
             break
 
-        data = recv_exact(tcp_sock, struct.calcsize(PAYLOAD_SERVER_FORMAT))
-        payload = unpack_payload_server(data)
-        if payload is None:
-            raise RuntimeError("Server sent invalid payload, disconnecting")
-
-        result, rank, suit = payload
+        result, rank, suit = yield
 
         if rank != 0:
-            player_hand.append((rank, suit))
-            print(f"You received: {format_card(rank, suit)} (total: {hand_total(player_hand)})")
-            print("your hand:")
-            print_cards(player_hand)
+            code = card_code(rank, suit)
+            player_hand.add(code)
+            if show:
+                show(f"You received: {CARD_NAMES[code]} (total: {player_hand.total})",
+                     "your hand:", player_hand)
 
         if result != RESULT_NOT_OVER:
             return result
@@ -124,39 +180,113 @@ def play_round(tcp_sock, decision_func):
 
     # -------- Phase 3: Dealer turn --------
     # Reveal hidden card
-    data = recv_exact(tcp_sock, struct.calcsize(PAYLOAD_SERVER_FORMAT))
-    payload = unpack_payload_server(data)
-    if payload is None:
-        raise RuntimeError("Invalid payload from server")
-
-    _, rank, suit = payload
+    _, rank, suit = yield
     if rank == 0:
         raise RuntimeError("Expected dealer hidden card")
 
-    dealer_hand.append((rank, suit))
-    print(f"Dealer's hidden card: {format_card(rank, suit)} (total: {hand_total(dealer_hand)})")
-    print("dealer hand:")
-    print_cards(dealer_hand)
+    code = card_code(rank, suit)
+    dealer_hand.add(code)
+    if show:
+        show(f"Dealer's hidden card: {CARD_NAMES[code]} (total: {dealer_hand.total})",
+             "dealer hand:", dealer_hand)
 
     # Dealer hit loop
     while True:
-        data = recv_exact(tcp_sock, struct.calcsize(PAYLOAD_SERVER_FORMAT))
-        payload = unpack_payload_server(data)
-        if payload is None:
-            raise RuntimeError("Invalid payload from server")
-
-        result, rank, suit = payload
+        result, rank, suit = yield
 
         if rank != 0:
-            dealer_hand.append((rank, suit))
-            print(f"Dealer received: {format_card(rank, suit)} (total: {hand_total(dealer_hand)})")
-            print("dealer hand:")
-            print_cards(dealer_hand)
+            code = card_code(rank, suit)
+            dealer_hand.add(code)
+            if show:
+                show(f"Dealer received: {CARD_NAMES[code]} (total: {dealer_hand.total})",
+                     "dealer hand:", dealer_hand)
 
         if result != RESULT_NOT_OVER:
             return result
 
 
+def read_payload(reader):
+    data = reader.read(PAYLOAD_SERVER_SIZE)
+    payload = unpack_payload_server(data)
+    if payload is None:
+        raise RuntimeError("Invalid payload from server")
+    return payload
+
+
+def play_round(tcp_sock, reader, decision_func, show=show_card):
+    steps = round_steps(decision_func, show)
+    try:
+        request = next(steps)
+        while True:
+            if request is None:
+                request = steps.send(read_payload(reader))
+            else:
+                tcp_sock.sendall(pack_payload_client(request))
+                request = next(steps)
+    except StopIteration as stop:
+        return stop.value
+
+
+# The policy request arguments (threshold, table) that make the server play
+# each automatic mode exactly like its decision function.
+MODE_POLICIES = {
+    "1": (17, None),
+    "3": (15, None),
+    "4": (20, None),
+    "5": (0, pack_table(BASIC_STRATEGY)),
+}
+
+
+# Follow a round of a policy session: the server makes the decisions, so
+# they are only replayed locally (to show them and keep the hands in step)
+# and never sent.
+def follow_round(reader, decision_func, show=show_card):
+    steps = round_steps(decision_func, show)
+    try:
+        request = next(steps)
+        while True:
+            if request is None:
+                request = steps.send(read_payload(reader))
+            else:
+                request = next(steps)
+    except StopIteration as stop:
+        return stop.value
+
+
+# The result of every round of a batch session, in order, read from the
+# server's batch results frames (which carry no cards unless requested).
+def batch_results(reader, num_rounds):
+    played = 0
+    while played < num_rounds:
+        header = unpack_batch_results(reader.read(BATCH_RESULTS_SIZE))
+        if header is None or header[0] == 0:
+            raise RuntimeError("Invalid batch results from server")
+        rounds, _wins, _losses, _ties, cards_size = header
+        results = bytes(reader.read(rounds))
+        reader.read(cards_size)
+        yield from results
+        played += rounds
+
+
+# Flow control for a streaming session of num_rounds rounds: the request
+# grants STREAM_WINDOW rounds, and this returns the stream credit frame to
+# send after `played` rounds, if any, topping the window back up every half
+# window so the server never waits on credit.
+def stream_credit(played, num_rounds):
+    half = STREAM_WINDOW // 2
+    if played % half or played + half >= num_rounds:
+        return None
+    return pack_stream_credit(half)
+
+
+# Read the server's stream end frame; returns the number of rounds it played.
+def read_stream_end(reader):
+    played = unpack_stream_end(reader.read(STREAM_END_SIZE))
+    if played is None:
+        raise RuntimeError("Invalid stream end from server")
+    return played
+
+
 def main():
     # User setup
     while True:
@@ -164,9 +294,9 @@ def main():
             try:
                 # Ask user for number of rounds
                 num_rounds = int(input("Enter number of rounds to play: "))
-                if 1 <= num_rounds <= 255:
+                if 1 <= num_rounds <= MAX_ROUNDS:
                     break
-                print("Please enter a number between 1 and 255.")
+                print(f"Please enter a number between 1 and {MAX_ROUNDS}.")
             except ValueError:
                 print("Invalid number.")
             except KeyboardInterrupt:
@@ -182,51 +312,96 @@ def main():
                 decision_func = careful_decision
             elif mode == "4":
                 decision_func = risk_decision
+            elif mode == "5":
+                decision_func = basic_decision
+            # Manual play needs to see the cards.
+            verbosity = RENDER_FULL if mode == "2" else choose_verbosity()
+            pipelined = mode in MODE_POLICIES and choose_pipelined()
         except KeyboardInterrupt:
             return
 
+        renderer = Renderer(verbosity)
+        if mode == "2":
+            # Show the cards dealt so far before asking for a decision.
+            def decide(hand, dealer_hand, ask=decision_func):
+                renderer.flush()
+                return ask(hand, dealer_hand)
+        else:
+            def decide(hand, dealer_hand, policy=decision_func):
+                decision = policy(hand, dealer_hand)
+                renderer.detail(f"Decision: {decision.decode()}\n")
+                return decision
+
 
     
         print("Client started, listening for offer requests...")
 
-        # Create UDP socket for listening to offers
-        udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-        udp_sock.bind(("", UDP_OFFER_PORT))
-        data, (server_ip, _) = udp_sock.recvfrom(1024)
-        offer = unpack_offer(data)
-        if offer is None:
-            continue
-
-        tcp_port, server_name = offer
-        print(f"Received offer from {server_ip}, server name: {server_name}")
+        # Offers are collected in the background, so this only waits when no
+        # server has been heard from yet.
+        DIRECTORY.start()
+        try:
+            server = DIRECTORY.pick()
+        except KeyboardInterrupt:
+            print("\nInterrupted by user.")
+            return
+        print(f"Received offer from {server.ip}, server name: {server.name}")
 
 
         try:
             # Connect to server over TCP
             tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             tcp_sock.settimeout(60.0)
-            tcp_sock.connect((server_ip, tcp_port))
-            tcp_sock.sendall(pack_request(num_rounds, TEAM_NAME))
+            connect_start = time.perf_counter()
+            tcp_sock.connect(server.address)
+            DIRECTORY.record_rtt(server, time.perf_counter() - connect_start)
+            streaming = num_rounds > 255 and not pipelined
+            # Without cards to show, the server plays the whole session as
+            # one batch and only sends the results.
+            batched = pipelined and verbosity < RENDER_FULL
+            if batched:
+                threshold, table = MODE_POLICIES[mode]
+                tcp_sock.sendall(pack_batch_request(num_rounds, TEAM_NAME, threshold, table))
+            elif pipelined:
+                threshold, table = MODE_POLICIES[mode]
+                tcp_sock.sendall(pack_policy_request(num_rounds, TEAM_NAME, threshold, table))
+            elif streaming:
+                tcp_sock.sendall(pack_stream_request(num_rounds, STREAM_WINDOW, TEAM_NAME))
+            else:
+                tcp_sock.sendall(pack_request(num_rounds, TEAM_NAME))
+            reader = FrameReader(tcp_sock)
 
             wins, losses, ties = 0, 0, 0
             print("\nWelcome to \"Deal Me A Slice\" Casino!")
             print("Sit comfortably and enjoy your pizza 🍕!\n")
+            if batched:
+                results = batch_results(reader, num_rounds)
             for i in range(num_rounds):
-                result = play_round(tcp_sock, decision_func)
+                if batched:
+                    result = next(results)
+                elif pipelined:
+                    result = follow_round(reader, decide, renderer.show)
+                else:
+                    result = play_round(tcp_sock, reader, decide, renderer.show)
                 if result == RESULT_WIN:
                     wins += 1
-                    print(f"Round {i+1} result: 🏆 WIN 🏆\n")
+                    renderer.summary(f"Round {i+1} result: 🏆 WIN 🏆\n\n")
                     
                 elif result == RESULT_LOSS:
                     losses += 1
-                    print(f"Round {i+1} result: LOSS\n")
+                    renderer.summary(f"Round {i+1} result: LOSS\n\n")
                     
                 elif result == RESULT_TIE:
                     ties += 1
-                    print(f"Round {i+1} result: TIE\n")
-                print("-" * 30)
-                    
+                    renderer.summary(f"Round {i+1} result: TIE\n\n")
+                renderer.summary("-" * 30 + "\n")
+                renderer.end_round()
+                if streaming:
+                    credit = stream_credit(i + 1, num_rounds)
+                    if credit:
+                        tcp_sock.sendall(credit)
+
+            if streaming:
+                read_stream_end(reader)
             print(f"Finished playing {num_rounds} rounds.")
             print("Game statistics:")
             print(f"Wins: {wins}")
@@ -237,6 +412,10 @@ def main():
 
 
 
+        except OSError as e:
+            print(f"Connection error: {e}")
+            DIRECTORY.forget(server)  # pick another server next time
+
         except Exception as e:
             print(f"Connection error: {e}")
 
@@ -244,6 +423,7 @@ def main():
             return
 
         finally:
+            renderer.flush()
             tcp_sock.close()
 
         while True:
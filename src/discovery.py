@@ -0,0 +1,262 @@
+# Background discovery of game servers.
+# A ServerDirectory listens for offers on UDP_OFFER_PORT with an asyncio
+# datagram endpoint and keeps every server heard from within the last `ttl`
+# seconds, with a smoothed TCP connect round-trip time and the load from its
+# load offers. One directory is the shared listener of a whole process:
+# start() runs it on a daemon thread's event loop for blocking callers,
+# attach() on the caller's running loop instead, and any number of
+# concurrent sessions can pick() from it, await pick_async() or subscribe()
+# to offers. A client only has to wait for a broadcast when nothing has been
+# heard yet.
+
+import asyncio
+import random
+import socket
+import threading
+import time
+
+from protocol import unpack_offer, unpack_offer_load
+from utils import UDP_OFFER_PORT
+
+
+OFFER_TTL = 3.0       # seconds without an offer before a server is dropped (offers come every second)
+PROBE_TIMEOUT = 1.0   # seconds allowed for the connect that measures a new server's RTT
+RTT_WEIGHT = 0.25     # weight of a new RTT sample in the moving average
+
+
+# A live server as known from its offers.
+# active, capacity and rounds_per_sec stay None until a load offer arrives;
+# assigned counts sessions this client sent there since that load offer.
+class ServerInfo:
+    __slots__ = ("ip", "tcp_port", "name", "last_seen", "rtt",
+                 "active", "capacity", "rounds_per_sec", "assigned")
+
+    def __init__(self, ip, tcp_port, name, last_seen):
+        self.ip = ip
+        self.tcp_port = tcp_port
+        self.name = name
+        self.last_seen = last_seen
+        self.rtt = None  # seconds, None until measured
+        self.active = None
+        self.capacity = None
+        self.rounds_per_sec = None
+        self.assigned = 0
+
+    @property
+    def address(self):
+        return self.ip, self.tcp_port
+
+    # Expected share of capacity in use (sessions when capacity is unlimited),
+    # counting sessions assigned since the last load offer.
+    @property
+    def utilization(self) -> float:
+        sessions = (self.active or 0) + self.assigned
+        return sessions / self.capacity if self.capacity else float(sessions)
+
+
+# Lower sorts first: measured servers by RTT, then unmeasured ones.
+def rank(server: ServerInfo):
+    return (server.rtt is None, server.rtt or 0.0)
+
+
+# Lower sorts first: servers advertising load by utilization, then by
+# throughput, then everything else; RTT breaks ties.
+def load_rank(server: ServerInfo):
+    if server.active is None:
+        return (1, 0.0, 0, rank(server))
+    return (0, server.utilization, server.rounds_per_sec, rank(server))
+
+
+# Server selection policies for ServerDirectory.pick().
+POLICIES = ("least-loaded", "lowest-rtt", "first-offer")
+
+
+# Datagram protocol of the offer listener: every valid offer is passed to
+# the directory, anything else is ignored.
+class OfferListener(asyncio.DatagramProtocol):
+    def __init__(self, directory):
+        self.directory = directory
+
+    def datagram_received(self, data, addr):
+        offer = unpack_offer(data)
+        if offer is not None:
+            tcp_port, server_name = offer
+            self.directory.offer_received(addr[0], tcp_port, server_name)
+            return
+        offer = unpack_offer_load(data)
+        if offer is not None:
+            tcp_port, server_name, *load = offer
+            self.directory.offer_received(addr[0], tcp_port, server_name, load)
+
+    def error_received(self, exc):
+        pass  # e.g. ICMP errors; the listener keeps going
+
+
+class ServerDirectory:
+    def __init__(self, ttl: float = OFFER_TTL, port: int = UDP_OFFER_PORT, probe: bool = True):
+        self.ttl = ttl
+        self.port = port
+        self.probe = probe
+        self._servers = {}  # (ip, tcp_port) -> ServerInfo
+        self._changed = threading.Condition()
+        self._subscribers = []
+        self._transport = None
+        self._loop = None
+
+    # Start listening for offers on a daemon thread's event loop. Safe to
+    # call more than once, and after attach(). Binding happens here, so an
+    # error such as the port being in use reaches the caller.
+    def start(self):
+        with self._changed:
+            if self._transport is not None:
+                return
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(self.attach())
+            except OSError:
+                loop.close()
+                raise
+            threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    # Listen for offers on the running event loop instead. Safe to call more
+    # than once.
+    async def attach(self):
+        if self._transport is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._transport, _ = await self._loop.create_datagram_endpoint(
+            lambda: OfferListener(self),
+            local_addr=("0.0.0.0", self.port),
+            family=socket.AF_INET,
+            reuse_port=True,
+        )
+
+    # Stop listening; known servers are kept until they expire.
+    def close(self):
+        transport, self._transport = self._transport, None
+        if transport is not None:
+            self._loop.call_soon_threadsafe(transport.close)
+
+    # Call callback(server) with the ServerInfo of every offer received from
+    # now on, on the listener's loop; it must not block. Returns a function
+    # that cancels the subscription.
+    def subscribe(self, callback):
+        with self._changed:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._changed:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    # Record an offer; load is (active, capacity, rounds_per_sec) for load offers.
+    def offer_received(self, ip, tcp_port, name, load=None, now=None):
+        now = time.monotonic() if now is None else now
+        with self._changed:
+            server = self._servers.get((ip, tcp_port))
+            if server is None:
+                server = self._servers[ip, tcp_port] = ServerInfo(ip, tcp_port, name, now)
+                if self.probe:
+                    threading.Thread(target=self._probe, args=(server,), daemon=True).start()
+            else:
+                server.name = name
+                server.last_seen = now
+            if load is not None:
+                server.active, server.capacity, server.rounds_per_sec = load
+                server.assigned = 0  # now included in active
+            self._changed.notify_all()
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(server)
+
+    # Time a TCP connect to a newly seen server as its first RTT sample.
+    def _probe(self, server):
+        start = time.perf_counter()
+        try:
+            with socket.create_connection(server.address, timeout=PROBE_TIMEOUT):
+                pass
+        except OSError:
+            self.forget(server)
+            return
+        self.record_rtt(server, time.perf_counter() - start)
+
+    # Fold a measured round-trip time (e.g. a session's connect time) into
+    # the server's moving average.
+    def record_rtt(self, server: ServerInfo, seconds: float):
+        with self._changed:
+            if server.rtt is None:
+                server.rtt = seconds
+            else:
+                server.rtt += RTT_WEIGHT * (seconds - server.rtt)
+
+    # Drop a server, e.g. after failing to connect; its next offer adds it back.
+    def forget(self, server: ServerInfo):
+        with self._changed:
+            if self._servers.get(server.address) is server:
+                del self._servers[server.address]
+
+    # Live servers, best first.
+    def servers(self):
+        with self._changed:
+            return sorted(self._live(), key=rank)
+
+    # The best live server, waiting up to timeout seconds (None = forever)
+    # for an offer if none is known. Returns None on timeout.
+    def best(self, timeout=None):
+        with self._changed:
+            live = self._changed.wait_for(self._live, timeout)
+            return min(live, key=rank) if live else None
+
+    # Choose a server for a new session, waiting like best() if none is known.
+    # "least-loaded" takes the less utilized of two random live servers (power
+    # of two choices, so clients acting on the same offers do not all pile
+    # onto one server), "lowest-rtt" is best(), and "first-offer" takes the
+    # longest-known server, like waiting for the first broadcast.
+    def pick(self, policy: str = "least-loaded", timeout=None):
+        with self._changed:
+            live = self._changed.wait_for(self._live, timeout)
+            if not live:
+                return None
+            if policy == "least-loaded":
+                server = min(random.sample(live, min(2, len(live))), key=load_rank)
+            elif policy == "lowest-rtt":
+                server = min(live, key=rank)
+            elif policy == "first-offer":
+                server = live[0]
+            else:
+                raise ValueError(f"Unknown policy: {policy}")
+            server.assigned += 1
+            return server
+
+    # pick() for coroutines: waits for an offer (up to timeout seconds, None =
+    # forever) without blocking the event loop.
+    async def pick_async(self, policy: str = "least-loaded", timeout=None):
+        server = self.pick(policy, timeout=0)
+        if server is not None:
+            return server
+        loop = asyncio.get_running_loop()
+        heard = loop.create_future()
+
+        def on_offer(_server):
+            loop.call_soon_threadsafe(lambda: heard.done() or heard.set_result(None))
+
+        unsubscribe = self.subscribe(on_offer)
+        try:
+            server = self.pick(policy, timeout=0)   # an offer may have arrived meanwhile
+            if server is None:
+                await asyncio.wait_for(heard, timeout)
+                server = self.pick(policy, timeout=0)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            unsubscribe()
+        return server
+
+    # Evict expired servers and return the rest. Call with the lock held.
+    def _live(self):
+        deadline = time.monotonic() - self.ttl
+        expired = [key for key, server in self._servers.items() if server.last_seen < deadline]
+        for key in expired:
+            del self._servers[key]
+        return list(self._servers.values())
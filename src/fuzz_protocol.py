@@ -0,0 +1,345 @@
+# Differential fuzzer for the protocol codecs.
+# Every codec that protocol_reference.py defines is checked against it: the
+# candidate module (protocol.py by default, or any faster replacement) must
+# return exactly what the reference returns, or raise the same exception
+# type, for every generated input, so it accepts and rejects the same frames.
+# Codecs without a reference (the extensions) are checked for round trips
+# and for never raising on arbitrary bytes.
+# Inputs are valid frames, mutated frames (changed fields and bytes,
+# truncations, extensions, other message types), random bytes, and an
+# exhaustive sweep of the server payload's result/rank/suit fields. The run
+# is reproducible from --seed. Exits with status 1 on any mismatch.
+# --self-test checks the fuzzer itself: it loads copies of the candidate with
+# one format or name helper changed, and fails unless every change is reported.
+# Example:  python fuzz_protocol.py --cases 200000 --seed 1
+#           python fuzz_protocol.py --candidate my_protocol
+#           python fuzz_protocol.py --self-test
+
+import argparse
+import importlib
+import random
+import struct
+import sys
+import types
+
+from utils import (
+    MAGIC_COOKIE,
+    MSG_TYPE_PAYLOAD,
+    DECISION_HIT,
+    DECISION_STAND,
+)
+
+
+# Message types worth mutating a type field into: every known one and a few others.
+MESSAGE_TYPES = list(range(0x0, 0x10)) + [0x7F, 0xFF]
+# Interesting field values, by field width in bytes.
+EDGES = {
+    1: [0, 1, 2, 3, 4, 12, 13, 14, 127, 128, 255],
+    2: [0, 1, 3, 4, 13, 14, 255, 256, 65535],
+    4: [0, 1, 255, 2**31, 2**32 - 1, MAGIC_COOKIE, MAGIC_COOKIE ^ 1],
+}
+MAX_SHOWN = 5   # mismatching inputs printed per codec
+
+
+# The outcome of calling func: ("ok", value) or ("raise", exception type name).
+def outcome(func, *args):
+    try:
+        return ("ok", func(*args))
+    except Exception as e:
+        return ("raise", type(e).__name__)
+
+
+def random_name(rng) -> str:
+    alphabet = "abcXYZ019 _-\x00é🍕"
+    return "".join(rng.choice(alphabet) for _ in range(rng.choice((0, 1, 5, 31, 32, 33, 40))))
+
+
+def random_int(rng, size: int) -> int:
+    if rng.random() < 0.5:
+        return rng.choice(EDGES[size])
+    return rng.getrandbits(8 * size)
+
+
+# Valid frames of the original message types, and the field layout used to
+# mutate them: (offset, size) of every integer field.
+def valid_offer(protocol, rng):
+    return protocol.pack_offer(random_int(rng, 2), random_name(rng))
+
+
+def valid_request(protocol, rng):
+    return protocol.pack_request(random_int(rng, 1), random_name(rng))
+
+
+def valid_payload_client(protocol, rng):
+    return protocol.pack_payload_client(rng.choice((DECISION_HIT, DECISION_STAND)))
+
+
+def valid_payload_server(protocol, rng):
+    return protocol.pack_payload_server(rng.randrange(4), rng.randrange(14), rng.randrange(4))
+
+
+FRAMES = {
+    # unpack function: (valid frame generator, integer fields)
+    "unpack_offer": (valid_offer, [(0, 4), (4, 1), (5, 2)]),
+    "unpack_request": (valid_request, [(0, 4), (4, 1), (5, 1)]),
+    "unpack_payload_client": (valid_payload_client, [(0, 4), (4, 1)]),
+    "unpack_payload_server": (valid_payload_server, [(0, 4), (4, 1), (5, 1), (6, 2), (8, 1)]),
+}
+
+
+# A mutated copy of frame: 1-3 of field changes, byte changes, truncation,
+# extension and message type changes.
+def mutate(frame: bytes, fields, rng) -> bytes:
+    data = bytearray(frame)
+    for _ in range(rng.randint(1, 3)):
+        choice = rng.random()
+        if choice < 0.35 and fields:
+            offset, size = rng.choice(fields)
+            if offset + size <= len(data):
+                data[offset:offset + size] = random_int(rng, size).to_bytes(size, "big")
+        elif choice < 0.55 and len(data) > 4:
+            data[4] = rng.choice(MESSAGE_TYPES)
+        elif choice < 0.75 and data:
+            data[rng.randrange(len(data))] = rng.getrandbits(8)
+        elif choice < 0.85:
+            del data[rng.randrange(len(data) + 1):]
+        else:
+            data += bytes(rng.getrandbits(8) for _ in range(rng.randint(1, 8)))
+    return bytes(data)
+
+
+def random_bytes(rng, size: int) -> bytes:
+    length = max(0, size + rng.randint(-3, 3))
+    data = bytearray(rng.getrandbits(8) for _ in range(length))
+    if length >= 5 and rng.random() < 0.7:
+        struct.pack_into("!I B", data, 0, MAGIC_COOKIE, rng.choice(MESSAGE_TYPES))
+    return bytes(data)
+
+
+# Inputs for one unpack function: valid, mutated and random frames.
+def generate(name, reference, cases, rng):
+    valid, fields = FRAMES[name]
+    size = len(valid(reference, rng))
+    for _ in range(cases):
+        choice = rng.random()
+        if choice < 0.2:
+            yield valid(reference, rng)
+        elif choice < 0.85:
+            yield mutate(valid(reference, rng), fields, rng)
+        else:
+            yield random_bytes(rng, size)
+
+
+# Every (result, rank, suit) combination of interest in an otherwise valid
+# server payload: the validation on every frame a client reads.
+def payload_server_sweep():
+    for result in list(range(6)) + [255]:
+        for rank in list(range(16)) + [255, 256, 65535]:
+            for suit in range(256):
+                yield struct.pack("!I B B H B", MAGIC_COOKIE, MSG_TYPE_PAYLOAD, result, rank, suit)
+
+
+class Report:
+    def __init__(self):
+        self.checked = {}      # codec -> [cases, accepted]
+        self.mismatches = {}   # codec -> [(input, candidate outcome, reference outcome)]
+
+    def check(self, codec, data, got, want):
+        counts = self.checked.setdefault(codec, [0, 0])
+        counts[0] += 1
+        if want[0] == "ok" and want[1] is not None:
+            counts[1] += 1
+        if got != want:
+            self.mismatches.setdefault(codec, []).append((data, got, want))
+
+    # For inputs without an expected value: anything but an exception.
+    def check_no_raise(self, codec, data, got):
+        counts = self.checked.setdefault(codec, [0, 0])
+        counts[0] += 1
+        if got[0] == "ok" and got[1] is not None:
+            counts[1] += 1
+        if got[0] == "raise":
+            self.mismatches.setdefault(codec, []).append((data, got, "no exception"))
+
+    def print(self):
+        print(f"{'codec':>34} {'cases':>9} {'accepted':>9} {'mismatches':>10}")
+        for codec, (cases, accepted) in self.checked.items():
+            print(f"{codec:>34} {cases:>9} {accepted:>9} {len(self.mismatches.get(codec, [])):>10}")
+        for codec, mismatches in self.mismatches.items():
+            print(f"\n{codec}: {len(mismatches)} mismatches, e.g.")
+            for data, got, want in mismatches[:MAX_SHOWN]:
+                print(f"  input {data!r}\n    candidate {got}\n    reference {want}")
+
+
+# Compare the candidate's codecs with the reference's.
+def check_against_reference(candidate, reference, cases, rng, report):
+    for name in FRAMES:
+        unpack, want_unpack = getattr(candidate, name), getattr(reference, name)
+        unpack_from = getattr(candidate, f"{name}_from", None)
+        size = len(FRAMES[name][0](reference, rng))
+        inputs = generate(name, reference, cases, rng)
+        if name == "unpack_payload_server":
+            inputs = list(inputs) + list(payload_server_sweep())
+        for data in inputs:
+            report.check(name, data, outcome(unpack, data), outcome(want_unpack, data))
+            if unpack_from is not None:
+                # The input at an offset in a larger buffer, as a reader sees
+                # it: the _from codec must treat the frame-sized slice there
+                # exactly as the reference treats it as a whole frame.
+                offset = rng.randrange(8)
+                buffer = bytearray(bytes(offset) + data + bytes(rng.randrange(4)))
+                want = outcome(want_unpack, bytes(buffer[offset:offset + size]))
+                report.check(f"{name}_from", data,
+                             outcome(unpack_from, memoryview(buffer), offset), want)
+
+    # Packing: same bytes or the same error for the same arguments.
+    for _ in range(cases // 4):
+        port, rounds, name = random_int(rng, 4) >> rng.choice((0, 14, 16, 24)), random_int(rng, 2), random_name(rng)
+        report.check("pack_offer", (port, name),
+                     outcome(candidate.pack_offer, port, name), outcome(reference.pack_offer, port, name))
+        report.check("pack_request", (rounds, name),
+                     outcome(candidate.pack_request, rounds, name),
+                     outcome(reference.pack_request, rounds, name))
+        decision = rng.choice((DECISION_HIT, DECISION_STAND, b"Hit", b"stand", b"", b"Hittt\x00"))
+        report.check("pack_payload_client", decision,
+                     outcome(candidate.pack_payload_client, decision),
+                     outcome(reference.pack_payload_client, decision))
+        fields = (rng.choice((-1, 0, 3, 4, 255, 256)), rng.choice((-1, 0, 1, 13, 14, 65535, 65536)),
+                  rng.choice((-1, 0, 3, 4, 255, 256)))
+        report.check("pack_payload_server", fields,
+                     outcome(candidate.pack_payload_server, *fields),
+                     outcome(reference.pack_payload_server, *fields))
+
+
+# Extension codecs: unpack(pack(args)) gives the arguments back, and no
+# input makes an unpack function raise.
+def check_extensions(protocol, cases, rng, report):
+    def round_trip(codec, packed, expected):
+        got = outcome(getattr(protocol, codec), packed)
+        report.check(codec, packed, got, ("ok", expected))
+
+    for _ in range(cases // 4):
+        name = "".join(rng.choice("abcxyz019") for _ in range(rng.randint(0, 32)))
+        port, table, rounds = rng.getrandbits(16), rng.getrandbits(16), rng.getrandbits(32)
+        active, capacity, rate = rng.getrandbits(32), rng.getrandbits(32), rng.getrandbits(32)
+        table_bits = bytes(rng.getrandbits(8) for _ in range(protocol.POLICY_TABLE_SIZE))
+        threshold = rng.getrandbits(8)
+        decision = rng.choice((DECISION_HIT, DECISION_STAND))
+        card = (rng.randrange(4), rng.randint(1, 13), rng.randrange(4))
+
+        round_trip("unpack_offer_load", protocol.pack_offer_load(port, name, active, capacity, rate),
+                   (port, name, active, capacity, rate))
+        round_trip("unpack_mux_request", protocol.pack_mux_request(table, rounds & 0xFF, name),
+                   (table, rounds & 0xFF, name))
+        round_trip("unpack_mux_payload_client", protocol.pack_mux_payload_client(table, decision),
+                   (table, decision))
+        round_trip("unpack_mux_payload_server", protocol.pack_mux_payload_server(table, *card),
+                   (table, *card))
+        round_trip("unpack_stream_request", protocol.pack_stream_request(rounds, port, name),
+                   (rounds, port, name))
+        round_trip("unpack_stream_credit", protocol.pack_stream_credit(port), port)
+        round_trip("unpack_stream_end", protocol.pack_stream_end(rounds), rounds)
+        round_trip("unpack_policy_request", protocol.pack_policy_request(rounds, name, threshold),
+                   (rounds, threshold, None, name))
+        round_trip("unpack_policy_request", protocol.pack_policy_request(rounds, name, 0, table_bits),
+                   (rounds, 0, table_bits, name))
+        flags = rng.getrandbits(8)
+        round_trip("unpack_batch_request",
+                   protocol.pack_batch_request(rounds, name, 0, table_bits, flags),
+                   (rounds, 0, table_bits, flags, name))
+        results = bytes(rng.randint(1, 3) for _ in range(rng.randint(0, 64)))
+        records = [(bytes(rng.getrandbits(6) for _ in range(rng.randint(2, 8))),
+                    bytes(rng.getrandbits(6) for _ in range(rng.randint(2, 8))))
+                   for _ in range(rng.randint(0, 8))]
+        cards = b"".join(bytes((len(p), len(d))) + p + d for p, d in records)
+        frame = protocol.pack_batch_results(results, cards)
+        header = frame[:protocol.BATCH_RESULTS_SIZE]
+        round_trip("unpack_batch_results", header,
+                   (len(results), results.count(3), results.count(2), results.count(1), len(cards)))
+        round_trip("unpack_batch_cards", cards, records)
+
+    # Arbitrary and mutated input: None or a value, never an exception.
+    unpacks = [name for name in dir(protocol)
+               if name.startswith("unpack_") and not name.endswith("_from") and name not in FRAMES]
+    for name in unpacks:
+        unpack = getattr(protocol, name)
+        for _ in range(cases // 4):
+            data = random_bytes(rng, rng.choice((5, 7, 9, 11, 14, 17, 41, 47, 124, 129)))
+            report.check_no_raise(f"{name} (arbitrary)", data, outcome(unpack, data))
+
+
+# Changes to the candidate's source the fuzzer must catch: (what, old, new).
+SELF_TEST_CHANGES = [
+    ("offer name field", 'OFFER_FORMAT = "!I B H 32s"', 'OFFER_FORMAT = "!I B H 31s"'),
+    ("request rounds field", 'REQUEST_FORMAT = "!I B B 32s"', 'REQUEST_FORMAT = "!I B b 32s"'),
+    ("client decision field", 'PAYLOAD_CLIENT_FORMAT = "!I B 5s"', 'PAYLOAD_CLIENT_FORMAT = "!I B 5p"'),
+    ("server byte order", 'PAYLOAD_SERVER_FORMAT = "!I B B H B"', 'PAYLOAD_SERVER_FORMAT = "<I B B H B"'),
+    ("name padding", 'raw.ljust(TEAM_NAME_SIZE, b"\\x00")', 'raw.ljust(TEAM_NAME_SIZE, b" ")'),
+    ("name decoding", 'errors="ignore"', 'errors="replace"'),
+]
+
+
+# A copy of module with old replaced by new in its source.
+def changed_module(module, old: str, new: str):
+    with open(module.__file__, encoding="utf-8") as f:
+        source = f.read()
+    if old not in source:
+        return None                                      #error handling
+    copy = types.ModuleType(f"{module.__name__}_changed")
+    copy.__file__ = module.__file__
+    exec(compile(source.replace(old, new, 1), module.__file__, "exec"), copy.__dict__)
+    return copy
+
+
+# Fuzz each changed copy of the candidate; every change must give mismatches.
+def self_test(candidate, reference, cases, seed) -> bool:
+    ok = True
+    print(f"{'change':>24} {'mismatches':>10}")
+    for what, old, new in SELF_TEST_CHANGES:
+        changed = changed_module(candidate, old, new)
+        if changed is None:
+            print(f"{what:>24} {'not found':>10}")
+            ok = False
+            continue
+        report = Report()
+        check_against_reference(changed, reference, cases, random.Random(seed), report)
+        found = sum(len(m) for m in report.mismatches.values())
+        print(f"{what:>24} {found:>10}")
+        if not found:
+            ok = False
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Differential fuzzer for the protocol codecs")
+    parser.add_argument("--candidate", default="protocol", help="module under test")
+    parser.add_argument("--reference", default="protocol_reference",
+                        help="module whose accept/reject behavior is the contract")
+    parser.add_argument("--cases", type=int, default=50_000, help="generated inputs per codec")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--self-test", action="store_true",
+                        help="check that changed formats in the candidate are reported")
+    args = parser.parse_args(argv)
+
+    candidate = importlib.import_module(args.candidate)
+    reference = importlib.import_module(args.reference)
+    if args.self_test:
+        if not self_test(candidate, reference, min(args.cases, 2_000), args.seed):
+            print(f"\nFAILED: a change to {args.candidate} went unreported (--seed {args.seed})")
+            sys.exit(1)
+        print(f"\nOK: every change to {args.candidate} was reported (--seed {args.seed})")
+        return
+    rng = random.Random(args.seed)
+    report = Report()
+    check_against_reference(candidate, reference, args.cases, rng, report)
+    check_extensions(candidate, args.cases, rng, report)
+    report.print()
+    if report.mismatches:
+        print(f"\nFAILED: {sum(len(m) for m in report.mismatches.values())} mismatches "
+              f"(--seed {args.seed})")
+        sys.exit(1)
+    print(f"\nOK: {args.candidate} matches {args.reference} (--seed {args.seed})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# Persistent per-team leaderboard.
+# Game threads count every finished round in one of SHARDS small dicts, each
+# with its own lock (a thread always uses the same shard, so the locks are
+# practically uncontended). A daemon thread swaps the shards out every
+# FLUSH_INTERVAL, adds the counts to a SQLite database in WAL mode in one
+# transaction, and reloads the top TOP_K teams into an immutable tuple that
+# top() returns without locking. The database is shared by all server
+# processes (e.g. --workers), so the leaderboard covers all of them.
+# Example:  python leaderboard.py scores.db --top 20
+
+import argparse
+import sqlite3
+import threading
+
+from utils import RESULT_WIN, RESULT_LOSS, RESULT_TIE
+
+
+SHARDS = 16
+FLUSH_INTERVAL = 1.0   # seconds between database writes
+TOP_K = 10
+
+# Index of each round result in a team's [wins, losses, ties] counts.
+_COLUMN = {RESULT_WIN: 0, RESULT_LOSS: 1, RESULT_TIE: 2}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS teams (
+    name   TEXT PRIMARY KEY,
+    wins   INTEGER NOT NULL DEFAULT 0,
+    losses INTEGER NOT NULL DEFAULT 0,
+    ties   INTEGER NOT NULL DEFAULT 0
+)
+"""
+_UPSERT = """
+INSERT INTO teams (name, wins, losses, ties) VALUES (?, ?, ?, ?)
+ON CONFLICT (name) DO UPDATE SET
+    wins = wins + excluded.wins,
+    losses = losses + excluded.losses,
+    ties = ties + excluded.ties
+"""
+_TOP = "SELECT name, wins, losses, ties FROM teams ORDER BY wins DESC, losses ASC, name LIMIT ?"
+
+
+def connect(path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute(_SCHEMA)
+    return db
+
+
+class Leaderboard:
+    def __init__(self, path: str, flush_interval: float = FLUSH_INTERVAL, k: int = TOP_K):
+        self.k = k
+        self.flush_interval = flush_interval
+        self._db = connect(path)
+        self._shards = [({}, threading.Lock()) for _ in range(SHARDS)]
+        self._top = tuple(self._db.execute(_TOP, (k,)))
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Count one round of team_name with the given result code.
+    def add(self, team_name: str, result: int):
+        counts, lock = self._shards[threading.get_ident() % SHARDS]
+        with lock:
+            team = counts.get(team_name)
+            if team is None:
+                team = counts[team_name] = [0, 0, 0]
+            team[_COLUMN[result]] += 1
+
+    # A round observer for one session of team_name, with the same signature
+    # as a transcript log (see server.round_steps).
+    def session(self, team_name: str):
+        add = self.add
+        return lambda result, _player_cards, _dealer_cards: add(team_name, result)
+
+    # The best teams as (name, wins, losses, ties), as of the last flush.
+    def top(self):
+        return self._top
+
+    # Write the counts since the last flush and refresh the top teams.
+    # If the write fails (e.g. the database is locked by another worker) the
+    # transaction is rolled back and the counts are put back for the next flush.
+    def flush(self):
+        totals = {}
+        for counts, lock in self._shards:
+            if not counts:
+                continue
+            with lock:
+                batch = list(counts.items())
+                counts.clear()
+            for name, team in batch:
+                total = totals.setdefault(name, [0, 0, 0])
+                for column in range(3):
+                    total[column] += team[column]
+        try:
+            with self._db:
+                if totals:
+                    self._db.executemany(_UPSERT, [(name, *team) for name, team in totals.items()])
+                self._top = tuple(self._db.execute(_TOP, (self.k,)))
+        except sqlite3.Error:
+            self._restore(totals)
+            raise
+
+    # Add totals of a failed flush back into a shard.
+    def _restore(self, totals):
+        counts, lock = self._shards[0]
+        with lock:
+            for name, total in totals.items():
+                team = counts.get(name)
+                if team is None:
+                    team = counts[name] = [0, 0, 0]
+                for column in range(3):
+                    team[column] += total[column]
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Leaderboard flush failed: {e}")
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+        self.flush()
+        self._db.close()
+
+    def report(self) -> str:
+        return format_top(self.top())
+
+
+def format_top(top) -> str:
+    lines = [f"{'#':>3} {'team':<32} {'wins':>9} {'losses':>9} {'ties':>9} {'win %':>7}"]
+    for place, (name, wins, losses, ties) in enumerate(top, 1):
+        rounds = wins + losses + ties
+        lines.append(f"{place:>3} {name:<32} {wins:>9} {losses:>9} {ties:>9} "
+                     f"{100 * wins / rounds if rounds else 0.0:>7.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Blackijecky leaderboard")
+    parser.add_argument("database", help="file written by server.py --leaderboard")
+    parser.add_argument("--top", type=int, default=TOP_K)
+    args = parser.parse_args(argv)
+
+    db = connect(args.database)
+    try:
+        print(format_top(db.execute(_TOP, (args.top,)).fetchall()))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
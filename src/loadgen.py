@@ -0,0 +1,374 @@
+# Headless load generator for the Blackijecky server.
+# Runs the same round flow as client.play_round (client.round_steps) on
+# asyncio streams, without printing, for thousands of concurrent sessions.
+# Example:  python loadgen.py --port 5000 --sessions 2000 --rounds 50 --processes 4
+# With --mux N, sessions are played N at a time as tables multiplexed over
+# one connection instead of one connection each, and with --stream each
+# session is a streaming session, so --rounds can go past 255. With
+# --pipeline the server plays the strategy (a policy session) and the
+# generator only reads; with --batch it plays all of a session's rounds
+# in-process and only sends back their results (--batch-cards: and cards).
+
+import argparse
+import asyncio
+import multiprocessing
+import resource
+import time
+
+from protocol import (
+    PAYLOAD_SERVER_SIZE,
+    MUX_PAYLOAD_SERVER_SIZE,
+    STREAM_END_SIZE,
+    pack_request,
+    pack_stream_request,
+    unpack_stream_end,
+    pack_payload_client,
+    unpack_payload_server,
+    pack_mux_request,
+    pack_mux_payload_client,
+    unpack_mux_payload_server,
+    pack_policy_request,
+    BATCH_RESULTS_SIZE,
+    BATCH_CARDS,
+    pack_batch_request,
+    unpack_batch_results,
+)
+from client import (
+    MAX_ROUNDS,
+    STREAM_WINDOW,
+    round_steps,
+    threshold_decision,
+    basic_strategy_decision,
+    stream_credit,
+    BASIC_STRATEGY,
+)
+from strategy import pack_table
+from metrics import LatencyHistogram
+
+
+TEAM_NAME = "DealMeASliceLoadgen"
+
+# Headless strategies: decision_func(hand, dealer_hand) -> decision, without printing.
+STRATEGIES = {
+    "dealer": lambda hand, _dealer_hand: threshold_decision(hand, 17),
+    "careful": lambda hand, _dealer_hand: threshold_decision(hand, 15),
+    "risk": lambda hand, _dealer_hand: threshold_decision(hand, 20),
+    "basic": basic_strategy_decision,
+}
+
+# The same strategies as policy request arguments (threshold, table).
+POLICIES = {
+    "dealer": (17, None),
+    "careful": (15, None),
+    "risk": (20, None),
+    "basic": (0, pack_table(BASIC_STRATEGY)),
+}
+
+
+# Raise the open-file limit so thousands of sockets fit in one process.
+# Child processes started afterwards inherit the raised limit.
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+# Read one server payload, recording how long the client waited for it.
+async def read_payload(reader, histogram):
+    start = time.perf_counter()
+    data = await reader.readexactly(PAYLOAD_SERVER_SIZE)
+    histogram.record(time.perf_counter() - start)
+    payload = unpack_payload_server(data)
+    if payload is None:
+        raise RuntimeError("Invalid payload from server")
+    return payload
+
+
+async def play_round(reader, writer, decision_func, histogram):
+    steps = round_steps(decision_func, show=None)
+    try:
+        request = next(steps)
+        while True:
+            if request is None:
+                request = steps.send(await read_payload(reader, histogram))
+            else:
+                writer.write(pack_payload_client(request))
+                request = next(steps)
+    except StopIteration as stop:
+        return stop.value
+
+
+# Play one full session; returns the number of rounds completed.
+async def run_session(host, port, rounds, decision_func, histogram, connect_gate):
+    async with connect_gate:
+        reader, writer = await asyncio.open_connection(host, port)
+    played = 0
+    try:
+        writer.write(pack_request(rounds, TEAM_NAME))
+        for _ in range(rounds):
+            await play_round(reader, writer, decision_func, histogram)
+            played += 1
+    finally:
+        writer.close()
+    return played
+
+
+# Play one streaming session (any number of rounds); returns the number of
+# rounds completed.
+async def run_stream_session(host, port, rounds, decision_func, histogram, connect_gate):
+    async with connect_gate:
+        reader, writer = await asyncio.open_connection(host, port)
+    played = 0
+    try:
+        writer.write(pack_stream_request(rounds, STREAM_WINDOW, TEAM_NAME))
+        while played < rounds:
+            await play_round(reader, writer, decision_func, histogram)
+            played += 1
+            credit = stream_credit(played, rounds)
+            if credit:
+                writer.write(credit)
+        if unpack_stream_end(await reader.readexactly(STREAM_END_SIZE)) != played:
+            raise RuntimeError("Invalid stream end from server")
+    finally:
+        writer.close()
+    return played
+
+
+# Play one policy session; returns the number of rounds completed.
+# Decisions are replayed locally to follow the rounds but never sent.
+async def run_policy_session(host, port, rounds, strategy, histogram, connect_gate):
+    async with connect_gate:
+        reader, writer = await asyncio.open_connection(host, port)
+    decision_func = STRATEGIES[strategy]
+    played = 0
+    try:
+        writer.write(pack_policy_request(rounds, TEAM_NAME, *POLICIES[strategy]))
+        for _ in range(rounds):
+            steps = round_steps(decision_func, show=None)
+            try:
+                request = next(steps)
+                while True:
+                    if request is None:
+                        request = steps.send(await read_payload(reader, histogram))
+                    else:
+                        request = next(steps)
+            except StopIteration:
+                played += 1
+    finally:
+        writer.close()
+    return played
+
+
+# Play one batch session with the request flags `batch`; returns the number
+# of rounds reported. The histogram records the wait for each results frame.
+async def run_batch_session(host, port, rounds, strategy, batch, histogram, connect_gate):
+    async with connect_gate:
+        reader, writer = await asyncio.open_connection(host, port)
+    played = 0
+    try:
+        writer.write(pack_batch_request(rounds, TEAM_NAME, *POLICIES[strategy], flags=batch))
+        while played < rounds:
+            start = time.perf_counter()
+            header = unpack_batch_results(await reader.readexactly(BATCH_RESULTS_SIZE))
+            if header is None or header[0] == 0:
+                raise RuntimeError("Invalid batch results from server")
+            await reader.readexactly(header[0] + header[4])
+            histogram.record(time.perf_counter() - start)
+            played += header[0]
+    finally:
+        writer.close()
+    return played
+
+
+# Play `tables` sessions as multiplexed tables over one connection; returns
+# the number of rounds completed over all tables.
+async def run_mux_connection(host, port, tables, rounds, decision_func, histogram, connect_gate):
+    async with connect_gate:
+        reader, writer = await asyncio.open_connection(host, port)
+    steps = {}
+    rounds_left = {}
+    played = 0
+    try:
+        for table in range(tables):
+            writer.write(pack_mux_request(table, rounds, TEAM_NAME))
+            steps[table] = round_steps(decision_func, show=None)
+            next(steps[table])
+            rounds_left[table] = rounds
+
+        while steps:
+            start = time.perf_counter()
+            data = await reader.readexactly(MUX_PAYLOAD_SERVER_SIZE)
+            histogram.record(time.perf_counter() - start)
+            payload = unpack_mux_payload_server(data)
+            if payload is None:
+                raise RuntimeError("Invalid payload from server")
+            table, result, rank, suit = payload
+
+            table_steps = steps[table]
+            try:
+                request = table_steps.send((result, rank, suit))
+                while request is not None:
+                    writer.write(pack_mux_payload_client(table, request))
+                    request = next(table_steps)
+            except StopIteration:
+                played += 1
+                rounds_left[table] -= 1
+                if rounds_left[table]:
+                    steps[table] = round_steps(decision_func, show=None)
+                    next(steps[table])
+                else:
+                    del steps[table]
+    finally:
+        writer.close()
+    return played
+
+
+# Run `sessions` concurrent sessions in this process, one connection each or
+# `mux` tables per connection. batch, when not None, is the batch request
+# flags of batch sessions.
+# Returns (completed sessions, failed sessions, rounds played, histogram).
+async def run_load(host, port, sessions, rounds, strategy="dealer",
+                   timeout=120.0, connect_concurrency=100, mux=0, stream=False, pipeline=False,
+                   batch=None):
+    histogram = LatencyHistogram()
+    decision_func = STRATEGIES[strategy]
+    connect_gate = asyncio.Semaphore(connect_concurrency)  # stay under the server's accept backlog
+    if mux:
+        # task -> number of sessions it plays
+        tasks = {
+            asyncio.create_task(
+                run_mux_connection(host, port, min(mux, sessions - first), rounds,
+                                   decision_func, histogram, connect_gate)
+            ): min(mux, sessions - first)
+            for first in range(0, sessions, mux)
+        }
+    elif batch is not None:
+        tasks = {
+            asyncio.create_task(
+                run_batch_session(host, port, rounds, strategy, batch, histogram, connect_gate)
+            ): 1
+            for _ in range(sessions)
+        }
+    elif pipeline:
+        tasks = {
+            asyncio.create_task(
+                run_policy_session(host, port, rounds, strategy, histogram, connect_gate)
+            ): 1
+            for _ in range(sessions)
+        }
+    else:
+        session = run_stream_session if stream else run_session
+        tasks = {
+            asyncio.create_task(
+                session(host, port, rounds, decision_func, histogram, connect_gate)
+            ): 1
+            for _ in range(sessions)
+        }
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+
+    completed = failed = rounds_played = 0
+    for task in done:
+        if task.exception() is None:
+            completed += tasks[task]
+            rounds_played += task.result()
+        else:
+            failed += tasks[task]
+    failed += sum(tasks[task] for task in pending)
+    return completed, failed, rounds_played, histogram
+
+
+def _process_main(job):
+    host, port, sessions, rounds, strategy, timeout, mux, stream, pipeline, batch = job
+    return asyncio.run(
+        run_load(host, port, sessions, rounds, strategy, timeout, mux=mux, stream=stream,
+                 pipeline=pipeline, batch=batch)
+    )
+
+
+# Spread the sessions over `processes` worker processes and merge their results.
+def run_load_pool(host, port, sessions, rounds, strategy="dealer",
+                  timeout=120.0, processes=1, mux=0, stream=False, pipeline=False, batch=None):
+    if processes <= 1:
+        return _process_main((host, port, sessions, rounds, strategy, timeout, mux, stream, pipeline,
+                              batch))
+
+    share, extra = divmod(sessions, processes)
+    jobs = [
+        (host, port, share + (1 if i < extra else 0), rounds, strategy, timeout, mux, stream,
+         pipeline, batch)
+        for i in range(processes)
+    ]
+    histogram = LatencyHistogram()
+    completed = failed = rounds_played = 0
+    with multiprocessing.Pool(processes) as pool:
+        for c, f, r, h in pool.imap_unordered(_process_main, jobs):
+            completed += c
+            failed += f
+            rounds_played += r
+            histogram.merge(h)
+    return completed, failed, rounds_played, histogram
+
+
+def print_report(completed, failed, rounds_played, histogram, elapsed):
+    print(f"Sessions: {completed} completed, {failed} failed in {elapsed:.2f}s")
+    print(f"Sessions/sec: {completed / elapsed:,.1f}")
+    print(f"Rounds/sec: {rounds_played / elapsed:,.1f}")
+    print(f"Messages: {histogram.total}")
+    for p in (50, 95, 99):
+        print(f"p{p}: {histogram.percentile(p) * 1e3:.3f} ms")
+
+    print("Per-message latency histogram:")
+    peak = max((count for _, count in histogram.buckets()), default=0)
+    for upper, count in histogram.buckets():
+        bar = "#" * max(1, round(40 * count / peak))
+        print(f"  <= {upper * 1e6:11.1f} us {count:>9} {bar}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Blackijecky headless load generator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=10,
+                        help="rounds per session (1-255, more with --stream)")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="dealer")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--mux", type=int, default=0,
+                        help="play N sessions per connection as multiplexed tables")
+    parser.add_argument("--stream", action="store_true",
+                        help="play streaming sessions (no 255-round limit)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="let the server play the strategy (policy sessions, no 255-round limit)")
+    parser.add_argument("--batch", action="store_true",
+                        help="let the server play whole sessions in-process and send only results")
+    parser.add_argument("--batch-cards", action="store_true",
+                        help="like --batch, with every round's cards in the results")
+    args = parser.parse_args(argv)
+    args.batch = BATCH_CARDS if args.batch_cards else (0 if args.batch else None)
+    if sum((bool(args.mux), args.stream, args.pipeline, args.batch is not None)) > 1:
+        parser.error("--mux, --stream, --pipeline and --batch cannot be combined")
+    max_rounds = MAX_ROUNDS if args.stream or args.pipeline or args.batch is not None else 255
+    if not 1 <= args.rounds <= max_rounds:
+        parser.error(f"--rounds must be between 1 and {max_rounds}")
+    if not 0 <= args.mux <= 65536:
+        parser.error("--mux must be between 0 and 65536")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    raise_fd_limit()
+    start = time.perf_counter()
+    completed, failed, rounds_played, histogram = run_load_pool(
+        args.host, args.port, args.sessions, args.rounds,
+        args.strategy, args.timeout, args.processes, args.mux, args.stream, args.pipeline,
+        args.batch,
+    )
+    print_report(completed, failed, rounds_played, histogram, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
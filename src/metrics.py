@@ -0,0 +1,195 @@
+# Low-overhead latency metrics.
+
+import math
+import os
+from collections import deque
+import socket
+import threading
+import time
+
+
+SUB_BUCKETS = 16   # buckets per power of two (~4% relative precision)
+OCTAVES = 40       # 1 us .. 2^40 us (~12 days)
+
+_BUCKETS = OCTAVES * SUB_BUCKETS
+_TWICE_SUB = 2 * SUB_BUCKETS
+_frexp = math.frexp
+
+
+# HDR-style log-linear histogram of durations.
+# Values are recorded in seconds and bucketed by microseconds; recording is an
+# frexp and a list increment, and histograms from many sources can be merged.
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (OCTAVES * SUB_BUCKETS)
+        self.total = 0
+
+    @staticmethod
+    def _index(micros: float) -> int:
+        if micros < 1.0:
+            return 0
+        mantissa, exponent = math.frexp(micros)   # micros = mantissa * 2**exponent, 0.5 <= mantissa < 1
+        index = (exponent - 1) * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+        return min(index, OCTAVES * SUB_BUCKETS - 1)
+
+    # Upper bound of a bucket, in seconds.
+    @staticmethod
+    def _upper(index: int) -> float:
+        exponent, sub = divmod(index, SUB_BUCKETS)
+        return math.ldexp(1.0 + (sub + 1) / SUB_BUCKETS, exponent) / 1e6
+
+    def record(self, seconds: float):
+        # Same bucketing as _index(), inlined because this is on the hot path.
+        micros = seconds * 1e6
+        if micros < 1.0:
+            index = 0
+        else:
+            mantissa, exponent = _frexp(micros)
+            index = (exponent - 1) * SUB_BUCKETS + int((mantissa - 0.5) * _TWICE_SUB)
+            if index >= _BUCKETS:
+                index = _BUCKETS - 1
+        self.counts[index] += 1
+        self.total += 1
+
+    def merge(self, other: "LatencyHistogram"):
+        for i, count in enumerate(other.counts):
+            if count:
+                self.counts[i] += count
+        self.total += other.total
+
+    # Latency at percentile p (0-100), in seconds.
+    def percentile(self, p: float) -> float:
+        if not self.total:
+            return 0.0
+        target = max(1, math.ceil(self.total * p / 100))
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self._upper(i)
+        return self._upper(len(self.counts) - 1)
+
+    # Non-empty buckets as (upper bound in seconds, count), smallest first.
+    def buckets(self):
+        return [(self._upper(i), count) for i, count in enumerate(self.counts) if count]
+
+
+FOLD_EVERY = 1024  # records kept thread-local before they are folded in
+
+
+# Per-phase latency histograms for the server.
+# record() is a no-op while disabled. When enabled, each thread records into
+# its own histograms without locking and folds them into the shared set every
+# FOLD_EVERY records and whenever fold() is called (e.g. at session end).
+# Counters and gauges are rare events and are kept even while disabled.
+class PhaseMetrics:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._merged = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    # Report fn() as the current value of name.
+    def gauge(self, name: str, fn):
+        self._gauges[name] = fn
+
+    def record(self, phase: str, seconds: float):
+        if not self.enabled:
+            return
+        local = self._local
+        try:
+            histograms = local.histograms
+        except AttributeError:
+            histograms = local.histograms = {}
+            local.pending = 0
+        histogram = histograms.get(phase)
+        if histogram is None:
+            histogram = histograms[phase] = LatencyHistogram()
+        histogram.record(seconds)
+        local.pending += 1
+        if local.pending >= FOLD_EVERY:
+            self.fold()
+
+    # Merge this thread's records into the shared histograms.
+    def fold(self):
+        histograms = getattr(self._local, "histograms", None)
+        if not histograms:
+            return
+        self._local.histograms = {}
+        self._local.pending = 0
+        with self._lock:
+            for phase, histogram in histograms.items():
+                merged = self._merged.get(phase)
+                if merged is None:
+                    self._merged[phase] = histogram
+                else:
+                    merged.merge(histogram)
+
+    # Copy of the shared histograms, by phase.
+    def snapshot(self):
+        with self._lock:
+            snapshot = {}
+            for phase, histogram in self._merged.items():
+                copy = LatencyHistogram()
+                copy.merge(histogram)
+                snapshot[phase] = copy
+        return snapshot
+
+    def report(self) -> str:
+        lines = [f"{'phase':<14} {'count':>9} {'p50 ms':>9} {'p90 ms':>9} "
+                 f"{'p99 ms':>9} {'max ms':>9}"]
+        for phase, histogram in sorted(self.snapshot().items()):
+            lines.append(
+                f"{phase:<14} {histogram.total:>9} "
+                + " ".join(f"{histogram.percentile(p) * 1e3:>9.3f}" for p in (50, 90, 99, 100))
+            )
+        with self._lock:
+            counters = sorted(self._counters.items())
+        for name, value in counters:
+            lines.append(f"{name:<14} {value:>9}")
+        for name, fn in sorted(self._gauges.items()):
+            lines.append(f"{name:<14} {fn():>9}")
+        return "\n".join(lines)
+
+
+# Answer every connection to 127.0.0.1:port with the current report.
+# Runs forever; start it in a daemon thread.
+def serve_stats(metrics: PhaseMetrics, port: int):
+    sock = socket.create_server(("127.0.0.1", port))
+    while True:
+        conn, _ = sock.accept()
+        with conn:
+            try:
+                conn.sendall((metrics.report() + "\n").encode())
+            except OSError:
+                pass
+
+
+# Print the report every interval seconds. Runs forever; start it in a daemon thread.
+def dump_stats(metrics: PhaseMetrics, interval: float):
+    while True:
+        time.sleep(interval)
+        print(f"[stats pid {os.getpid()}]\n{metrics.report()}", flush=True)
+
+
+# Rate of a growing counter over roughly the last `window` seconds.
+class RollingRate:
+    def __init__(self, window: float = 5.0):
+        self.window = window
+        self._samples = deque()  # (time, count)
+
+    # Add a sample of the counter and return its current rate per second.
+    def update(self, count: int, now=None) -> float:
+        now = time.monotonic() if now is None else now
+        samples = self._samples
+        samples.append((now, count))
+        while len(samples) > 2 and now - samples[1][0] >= self.window:
+            samples.popleft()
+        start, first = samples[0]
+        return (count - first) / (now - start) if now > start else 0.0
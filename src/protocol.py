@@ -4,11 +4,23 @@ import struct
 from utils import (
     MAGIC_COOKIE,
     MSG_TYPE_OFFER,
+    MSG_TYPE_OFFER_LOAD,
     MSG_TYPE_REQUEST,
     MSG_TYPE_PAYLOAD,
+    MSG_TYPE_MUX_REQUEST,
+    MSG_TYPE_MUX_PAYLOAD,
+    MSG_TYPE_STREAM_REQUEST,
+    MSG_TYPE_STREAM_CREDIT,
+    MSG_TYPE_STREAM_END,
+    MSG_TYPE_POLICY_REQUEST,
+    MSG_TYPE_BATCH_REQUEST,
+    MSG_TYPE_BATCH_RESULTS,
     TEAM_NAME_SIZE,
     DECISION_HIT,
     DECISION_STAND,
+    RESULT_WIN,
+    RESULT_LOSS,
+    RESULT_TIE,
     MIN_RANK,
     MAX_RANK,
     SUITS,
@@ -28,6 +40,17 @@ REQUEST_FORMAT = "!I B B 32s"
 PAYLOAD_CLIENT_FORMAT = "!I B 5s"
 PAYLOAD_SERVER_FORMAT = "!I B B H B"
 
+# Precompiled codecs, so the format strings are parsed once at import time.
+OFFER_STRUCT = struct.Struct(OFFER_FORMAT)
+REQUEST_STRUCT = struct.Struct(REQUEST_FORMAT)
+PAYLOAD_CLIENT_STRUCT = struct.Struct(PAYLOAD_CLIENT_FORMAT)
+PAYLOAD_SERVER_STRUCT = struct.Struct(PAYLOAD_SERVER_FORMAT)
+
+OFFER_SIZE = OFFER_STRUCT.size
+REQUEST_SIZE = REQUEST_STRUCT.size
+PAYLOAD_CLIENT_SIZE = PAYLOAD_CLIENT_STRUCT.size
+PAYLOAD_SERVER_SIZE = PAYLOAD_SERVER_STRUCT.size
+
 # Encode a team or server name into exactly 32 bytes. 
 # Pads with 0x00 or truncates if needed.
 def _encode_name(name: str) -> bytes:
@@ -47,8 +70,7 @@ def _decode_name(raw: bytes) -> str:
 
 # pack to bytes according to OFFER_FORMAT
 def pack_offer(tcp_port: int, server_name: str) -> bytes:
-    return struct.pack(
-        OFFER_FORMAT,
+    return OFFER_STRUCT.pack(
         MAGIC_COOKIE,
         MSG_TYPE_OFFER,
         tcp_port,
@@ -58,10 +80,25 @@ def pack_offer(tcp_port: int, server_name: str) -> bytes:
 
 # unpack from bytes according to OFFER_FORMAT
 def unpack_offer(data: bytes):
-    if len(data) != struct.calcsize(OFFER_FORMAT):
+    if len(data) != OFFER_SIZE:
+        return None
+
+    cookie, msg_type, tcp_port, raw_name = OFFER_STRUCT.unpack(data)
+
+    if cookie != MAGIC_COOKIE:
+        return None                    #error handling
+    if msg_type != MSG_TYPE_OFFER:
+        return None                    #error handling
+
+    return tcp_port, _decode_name(raw_name)
+
+
+# unpack an offer starting at offset in any buffer (bytes, bytearray, memoryview)
+def unpack_offer_from(buffer, offset: int = 0):
+    if len(buffer) - offset < OFFER_SIZE:
         return None
 
-    cookie, msg_type, tcp_port, raw_name = struct.unpack(OFFER_FORMAT, data)
+    cookie, msg_type, tcp_port, raw_name = OFFER_STRUCT.unpack_from(buffer, offset)
 
     if cookie != MAGIC_COOKIE:
         return None                    #error handling
@@ -71,12 +108,50 @@ def unpack_offer(data: bytes):
     return tcp_port, _decode_name(raw_name)
 
 
+# ----- Load offer (UDP, extension) -----
+
+# An offer followed by the server's load. Servers broadcast it next to the
+# plain offer, which older clients keep using: they reject this message by
+# its length and type.
+OFFER_LOAD_FORMAT = "!I B H 32s I I I"   # ... active sessions, capacity (0 = unlimited), rounds/sec
+OFFER_LOAD_STRUCT = struct.Struct(OFFER_LOAD_FORMAT)
+OFFER_LOAD_SIZE = OFFER_LOAD_STRUCT.size
+
+
+def pack_offer_load(tcp_port: int, server_name: str, active: int, capacity: int,
+                    rounds_per_sec: int) -> bytes:
+    return OFFER_LOAD_STRUCT.pack(
+        MAGIC_COOKIE,
+        MSG_TYPE_OFFER_LOAD,
+        tcp_port,
+        _encode_name(server_name),
+        active,
+        capacity,
+        rounds_per_sec,
+    )
+
+
+# unpack into (tcp_port, server_name, active, capacity, rounds_per_sec)
+def unpack_offer_load(data: bytes):
+    if len(data) != OFFER_LOAD_SIZE:
+        return None
+
+    cookie, msg_type, tcp_port, raw_name, active, capacity, rounds_per_sec = \
+        OFFER_LOAD_STRUCT.unpack(data)
+
+    if cookie != MAGIC_COOKIE:
+        return None                    #error handling
+    if msg_type != MSG_TYPE_OFFER_LOAD:
+        return None                    #error handling
+
+    return tcp_port, _decode_name(raw_name), active, capacity, rounds_per_sec
+
+
 # ----- Request (TCP) -----
 
 # pack request to bytes according to REQUEST_FORMAT
 def pack_request(num_rounds: int, team_name: str) -> bytes:
-    return struct.pack(
-        REQUEST_FORMAT,
+    return REQUEST_STRUCT.pack(
         MAGIC_COOKIE,
         MSG_TYPE_REQUEST,
         num_rounds,
@@ -85,10 +160,25 @@ def pack_request(num_rounds: int, team_name: str) -> bytes:
 
 # unpack request from bytes according to REQUEST_FORMAT
 def unpack_request(data: bytes):
-    if len(data) != struct.calcsize(REQUEST_FORMAT):
+    if len(data) != REQUEST_SIZE:
         return None
 
-    cookie, msg_type, num_rounds, raw_name = struct.unpack(REQUEST_FORMAT, data)
+    cookie, msg_type, num_rounds, raw_name = REQUEST_STRUCT.unpack(data)
+
+    if cookie != MAGIC_COOKIE: 
+        return None                   #error handling
+    if msg_type != MSG_TYPE_REQUEST:
+        return None                   #error handling
+
+    return num_rounds, _decode_name(raw_name)
+
+
+# unpack a request starting at offset in any buffer (bytes, bytearray, memoryview)
+def unpack_request_from(buffer, offset: int = 0):
+    if len(buffer) - offset < REQUEST_SIZE:
+        return None
+
+    cookie, msg_type, num_rounds, raw_name = REQUEST_STRUCT.unpack_from(buffer, offset)
 
     if cookie != MAGIC_COOKIE: 
         return None                   #error handling
@@ -101,40 +191,60 @@ def unpack_request(data: bytes):
 
 # ----- Payload: Client -> Server -----
 
+# Only two client payloads are valid, so both are packed once up front.
+_PAYLOAD_HIT = PAYLOAD_CLIENT_STRUCT.pack(MAGIC_COOKIE, MSG_TYPE_PAYLOAD, DECISION_HIT)
+_PAYLOAD_STAND = PAYLOAD_CLIENT_STRUCT.pack(MAGIC_COOKIE, MSG_TYPE_PAYLOAD, DECISION_STAND)
+
 # pack client decision to bytes according to PAYLOAD_CLIENT_FORMAT
 def pack_payload_client(decision: bytes) -> bytes:
+    if decision == DECISION_HIT:
+        return _PAYLOAD_HIT
+    if decision == DECISION_STAND:
+        return _PAYLOAD_STAND
+    raise ValueError("Invalid client decision")    #invalid protocol value
+
+# pack client decision into a preallocated buffer at offset
+# (struct.error if the buffer is too short there, rather than growing it)
+def pack_payload_client_into(buffer, offset: int, decision: bytes) -> None:
     if decision not in (DECISION_HIT, DECISION_STAND):
         raise ValueError("Invalid client decision")    #invalid protocol value
-
-    return struct.pack(
-        PAYLOAD_CLIENT_FORMAT,
-        MAGIC_COOKIE,
-        MSG_TYPE_PAYLOAD,
-        decision,
-    )
+    PAYLOAD_CLIENT_STRUCT.pack_into(buffer, offset, MAGIC_COOKIE, MSG_TYPE_PAYLOAD, decision)
 
 # unpack client decision from bytes according to PAYLOAD_CLIENT_FORMAT
+# A valid frame is byte-for-byte one of the two precomputed payloads, which
+# checks the length, cookie, type and decision in a single comparison.
 def unpack_payload_client(data: bytes):
-    if len(data) != struct.calcsize(PAYLOAD_CLIENT_FORMAT):
-        return None
-
-    cookie, msg_type, decision = struct.unpack(PAYLOAD_CLIENT_FORMAT, data)
-
-    if cookie != MAGIC_COOKIE:
-        return None                                       #error handling
-    if msg_type != MSG_TYPE_PAYLOAD:
-        return None                                       #error handling
-    if decision not in (DECISION_HIT, DECISION_STAND):
-        return None                                       #error handling
-    return decision
+    if data == _PAYLOAD_HIT:
+        return DECISION_HIT
+    if data == _PAYLOAD_STAND:
+        return DECISION_STAND
+    return None                                           #error handling
+
+# unpack client decision starting at offset in any buffer
+def unpack_payload_client_from(buffer, offset: int = 0):
+    return unpack_payload_client(
+        memoryview(buffer)[offset:offset + PAYLOAD_CLIENT_SIZE]
+    )
 
 
 # ----- Payload: Server -> Client -----
 
+# Every server payload the server can send, packed once:
+# SERVER_PAYLOADS[result_code][rank * 4 + suit], where index 0 (rank 0) is the
+# "no card" payload that ends a round.
+SERVER_PAYLOADS = [
+    [
+        PAYLOAD_SERVER_STRUCT.pack(MAGIC_COOKIE, MSG_TYPE_PAYLOAD, result_code, card >> 2, card & 3)
+        for card in range((MAX_RANK + 1) * len(SUITS))
+    ]
+    for result_code in range(RESULT_WIN + 1)
+]
+
 # pack server payload to bytes according to PAYLOAD_SERVER_FORMAT
 def pack_payload_server(result_code: int, rank: int, suit: int) -> bytes:
-    return struct.pack(
-        PAYLOAD_SERVER_FORMAT,
+    if 0 <= result_code <= RESULT_WIN and 0 <= rank <= MAX_RANK and suit in SUITS:
+        return SERVER_PAYLOADS[result_code][rank * 4 + suit]
+    return PAYLOAD_SERVER_STRUCT.pack(
         MAGIC_COOKIE,
         MSG_TYPE_PAYLOAD,
         result_code,
@@ -142,23 +252,404 @@ def pack_payload_server(result_code: int, rank: int, suit: int) -> bytes:
         suit,
     )
 
+# pack server payload into a preallocated buffer at offset
+# (struct.error if the buffer is too short there, rather than growing it)
+def pack_payload_server_into(buffer, offset: int, result_code: int, rank: int, suit: int) -> None:
+    PAYLOAD_SERVER_STRUCT.pack_into(
+        buffer, offset, MAGIC_COOKIE, MSG_TYPE_PAYLOAD, result_code, rank, suit
+    )
+
 # unpack server payload from bytes according to PAYLOAD_SERVER_FORMAT
 def unpack_payload_server(data: bytes):
-    if len(data) != struct.calcsize(PAYLOAD_SERVER_FORMAT):
+    if len(data) != PAYLOAD_SERVER_SIZE:
         return None
 
-    cookie, msg_type, result_code, rank, suit = struct.unpack(
-        PAYLOAD_SERVER_FORMAT, data
+    cookie, msg_type, result_code, rank, suit = PAYLOAD_SERVER_STRUCT.unpack(data)
+
+    if cookie != MAGIC_COOKIE or msg_type != MSG_TYPE_PAYLOAD:
+        return None                                      #error handling
+    if rank != 0:                                     
+        if not (MIN_RANK <= rank <= MAX_RANK):
+            return None
+        if suit not in SUITS:
+            return None
+    # else: rank == 0 (special case: no card dealt)
+    return result_code, rank, suit
+
+# unpack server payload starting at offset in any buffer (bytes, bytearray, memoryview)
+def unpack_payload_server_from(buffer, offset: int = 0):
+    if len(buffer) - offset < PAYLOAD_SERVER_SIZE:
+        return None
+
+    cookie, msg_type, result_code, rank, suit = PAYLOAD_SERVER_STRUCT.unpack_from(
+        buffer, offset
+    )
+
+    if cookie != MAGIC_COOKIE or msg_type != MSG_TYPE_PAYLOAD:
+        return None                                      #error handling
+    if rank != 0:                                     
+        if not (MIN_RANK <= rank <= MAX_RANK):
+            return None
+        if suit not in SUITS:
+            return None
+    # else: rank == 0 (special case: no card dealt)
+    return result_code, rank, suit
+
+
+# ----- Multiplexed tables (extension) -----
+
+# A connection whose first frame is a MUX request instead of a request runs
+# many independent game tables. Each MUX request opens one table; every
+# payload then carries the 2-byte table id after the message type. Tables
+# can be opened at any time, and legacy connections are unaffected.
+
+FRAME_HEADER_FORMAT = "!I B"             # cookie, message type: common to all frames
+MUX_REQUEST_FORMAT = "!I B H B 32s"
+MUX_PAYLOAD_CLIENT_FORMAT = "!I B H 5s"
+MUX_PAYLOAD_SERVER_FORMAT = "!I B H B H B"
+MUX_HEADER_FORMAT = "!I B H"             # cookie, message type, table id
+
+FRAME_HEADER_STRUCT = struct.Struct(FRAME_HEADER_FORMAT)
+MUX_REQUEST_STRUCT = struct.Struct(MUX_REQUEST_FORMAT)
+MUX_PAYLOAD_CLIENT_STRUCT = struct.Struct(MUX_PAYLOAD_CLIENT_FORMAT)
+MUX_PAYLOAD_SERVER_STRUCT = struct.Struct(MUX_PAYLOAD_SERVER_FORMAT)
+MUX_HEADER_STRUCT = struct.Struct(MUX_HEADER_FORMAT)
+
+FRAME_HEADER_SIZE = FRAME_HEADER_STRUCT.size
+MUX_REQUEST_SIZE = MUX_REQUEST_STRUCT.size
+MUX_PAYLOAD_CLIENT_SIZE = MUX_PAYLOAD_CLIENT_STRUCT.size
+MUX_PAYLOAD_SERVER_SIZE = MUX_PAYLOAD_SERVER_STRUCT.size
+
+# Size of every frame a client may send on a multiplexed connection, by type.
+MUX_CLIENT_FRAME_SIZES = {
+    MSG_TYPE_MUX_REQUEST: MUX_REQUEST_SIZE,
+    MSG_TYPE_MUX_PAYLOAD: MUX_PAYLOAD_CLIENT_SIZE,
+}
+
+
+# Message type of the frame starting with header, or None on a bad cookie.
+def frame_type(header):
+    cookie, msg_type = FRAME_HEADER_STRUCT.unpack_from(header)
+    if cookie != MAGIC_COOKIE:
+        return None                   #error handling
+    return msg_type
+
+
+def pack_mux_request(table: int, num_rounds: int, team_name: str) -> bytes:
+    return MUX_REQUEST_STRUCT.pack(
+        MAGIC_COOKIE,
+        MSG_TYPE_MUX_REQUEST,
+        table,
+        num_rounds,
+        _encode_name(team_name),
     )
 
+def unpack_mux_request(data: bytes):
+    if len(data) != MUX_REQUEST_SIZE:
+        return None
+
+    cookie, msg_type, table, num_rounds, raw_name = MUX_REQUEST_STRUCT.unpack(data)
+
     if cookie != MAGIC_COOKIE:
+        return None                   #error handling
+    if msg_type != MSG_TYPE_MUX_REQUEST:
+        return None                   #error handling
+
+    return table, num_rounds, _decode_name(raw_name)
+
+
+def pack_mux_payload_client(table: int, decision: bytes) -> bytes:
+    if decision != DECISION_HIT and decision != DECISION_STAND:
+        raise ValueError("Invalid client decision")    #invalid protocol value
+    return MUX_PAYLOAD_CLIENT_STRUCT.pack(MAGIC_COOKIE, MSG_TYPE_MUX_PAYLOAD, table, decision)
+
+def unpack_mux_payload_client(data: bytes):
+    if len(data) != MUX_PAYLOAD_CLIENT_SIZE:
+        return None
+
+    cookie, msg_type, table, decision = MUX_PAYLOAD_CLIENT_STRUCT.unpack(data)
+
+    if cookie != MAGIC_COOKIE or msg_type != MSG_TYPE_MUX_PAYLOAD:
         return None                                      #error handling
-    if msg_type != MSG_TYPE_PAYLOAD:
+    if decision != DECISION_HIT and decision != DECISION_STAND:
+        return None
+    return table, decision
+
+
+# Header that addresses a server payload to a table; see mux_payload_server().
+def mux_server_prefix(table: int) -> bytes:
+    return MUX_HEADER_STRUCT.pack(MAGIC_COOKIE, MSG_TYPE_MUX_PAYLOAD, table)
+
+# Re-address a legacy server payload (e.g. from SERVER_PAYLOADS) to the table
+# whose mux_server_prefix() is given: the table header replaces the frame header.
+def mux_payload_server(prefix: bytes, payload: bytes) -> bytes:
+    return prefix + payload[FRAME_HEADER_SIZE:]
+
+def pack_mux_payload_server(table: int, result_code: int, rank: int, suit: int) -> bytes:
+    return MUX_PAYLOAD_SERVER_STRUCT.pack(
+        MAGIC_COOKIE,
+        MSG_TYPE_MUX_PAYLOAD,
+        table,
+        result_code,
+        rank,
+        suit,
+    )
+
+# unpack a multiplexed server payload into (table, result_code, rank, suit)
+def unpack_mux_payload_server(data: bytes):
+    if len(data) != MUX_PAYLOAD_SERVER_SIZE:
+        return None
+
+    cookie, msg_type, table, result_code, rank, suit = MUX_PAYLOAD_SERVER_STRUCT.unpack(data)
+
+    if cookie != MAGIC_COOKIE or msg_type != MSG_TYPE_MUX_PAYLOAD:
         return None                                      #error handling
-    if rank != 0:                                     
+    if rank != 0:
         if not (MIN_RANK <= rank <= MAX_RANK):
             return None
         if suit not in SUITS:
             return None
     # else: rank == 0 (special case: no card dealt)
-    return result_code, rank, suit
\ No newline at end of file
+    return table, result_code, rank, suit
+
+
+# ----- Streaming sessions (extension) -----
+
+# A connection that starts with a stream request instead of a request plays
+# up to 2^32 - 1 rounds, or an open-ended number when num_rounds is 0.
+# Flow control is by credit: the server starts a round only while it holds
+# credit, which the request grants first and stream credit frames add to
+# (one unit per round). A client stream end frame asks the server to stop
+# after the current round. The server always finishes with a stream end
+# frame carrying the number of rounds played, then closes the connection.
+
+STREAM_REQUEST_FORMAT = "!I B I H 32s"   # cookie, type, num_rounds (0 = open-ended), credit, name
+STREAM_CREDIT_FORMAT = "!I B H"          # cookie, type, additional rounds
+STREAM_END_FORMAT = "!I B I"             # cookie, type, rounds played (0 from the client)
+
+STREAM_REQUEST_STRUCT = struct.Struct(STREAM_REQUEST_FORMAT)
+STREAM_CREDIT_STRUCT = struct.Struct(STREAM_CREDIT_FORMAT)
+STREAM_END_STRUCT = struct.Struct(STREAM_END_FORMAT)
+
+STREAM_REQUEST_SIZE = STREAM_REQUEST_STRUCT.size
+STREAM_CREDIT_SIZE = STREAM_CREDIT_STRUCT.size
+STREAM_END_SIZE = STREAM_END_STRUCT.size
+
+# Size of every frame a client may send after its stream request, by type.
+STREAM_CLIENT_FRAME_SIZES = {
+    MSG_TYPE_PAYLOAD: PAYLOAD_CLIENT_SIZE,
+    MSG_TYPE_STREAM_CREDIT: STREAM_CREDIT_SIZE,
+    MSG_TYPE_STREAM_END: STREAM_END_SIZE,
+}
+
+
+def pack_stream_request(num_rounds: int, credit: int, team_name: str) -> bytes:
+    return STREAM_REQUEST_STRUCT.pack(
+        MAGIC_COOKIE,
+        MSG_TYPE_STREAM_REQUEST,
+        num_rounds,
+        credit,
+        _encode_name(team_name),
+    )
+
+def unpack_stream_request(data: bytes):
+    if len(data) != STREAM_REQUEST_SIZE:
+        return None
+
+    cookie, msg_type, num_rounds, credit, raw_name = STREAM_REQUEST_STRUCT.unpack(data)
+
+    if cookie != MAGIC_COOKIE:
+        return None                   #error handling
+    if msg_type != MSG_TYPE_STREAM_REQUEST:
+        return None                   #error handling
+
+    return num_rounds, credit, _decode_name(raw_name)
+
+
+def pack_stream_credit(rounds: int) -> bytes:
+    return STREAM_CREDIT_STRUCT.pack(MAGIC_COOKIE, MSG_TYPE_STREAM_CREDIT, rounds)
+
+def unpack_stream_credit(data: bytes):
+    if len(data) != STREAM_CREDIT_SIZE:
+        return None
+
+    cookie, msg_type, rounds = STREAM_CREDIT_STRUCT.unpack(data)
+
+    if cookie != MAGIC_COOKIE or msg_type != MSG_TYPE_STREAM_CREDIT:
+        return None                   #error handling
+    return rounds
+
+
+def pack_stream_end(rounds_played: int = 0) -> bytes:
+    return STREAM_END_STRUCT.pack(MAGIC_COOKIE, MSG_TYPE_STREAM_END, rounds_played)
+
+def unpack_stream_end(data: bytes):
+    if len(data) != STREAM_END_SIZE:
+        return None
+
+    cookie, msg_type, rounds_played = STREAM_END_STRUCT.unpack(data)
+
+    if cookie != MAGIC_COOKIE or msg_type != MSG_TYPE_STREAM_END:
+        return None                   #error handling
+    return rounds_played
+
+
+# ----- Policy sessions (extension) -----
+
+# A connection that starts with a policy request hands the player's
+# decisions to the server: instead of sending a payload per decision, the
+# client describes its policy once and the server plays every round with it,
+# sending the same server payloads as a legacy session, round after round,
+# without waiting on the client. The client only reads. The connection is
+# closed after num_rounds rounds.
+# The policy is either a stand threshold (hit while the total is below it)
+# or a decision table: POLICY_TABLE_SIZE bytes of bits, most significant bit
+# first, where bit (hand state * POLICY_UP_VALUES + up value - 2) is set to
+# hit. The hand state is blackijecky's (total, plus 32 while soft) and the
+# up value is the dealer's visible card's value, 2..11 (ace = 11).
+
+POLICY_THRESHOLD = 0
+POLICY_TABLE = 1
+
+POLICY_HAND_STATES = 64
+POLICY_UP_VALUES = 10
+POLICY_TABLE_SIZE = POLICY_HAND_STATES * POLICY_UP_VALUES // 8   # 80 bytes
+
+POLICY_REQUEST_FORMAT = f"!I B I B B 32s {POLICY_TABLE_SIZE}s"   # cookie, type, num_rounds, kind, threshold, name, table
+POLICY_REQUEST_STRUCT = struct.Struct(POLICY_REQUEST_FORMAT)
+POLICY_REQUEST_SIZE = POLICY_REQUEST_STRUCT.size
+
+
+# Request a threshold policy (table is None) or a table policy (table is the
+# POLICY_TABLE_SIZE bytes described above).
+def pack_policy_request(num_rounds: int, team_name: str, threshold: int = 0, table=None) -> bytes:
+    return POLICY_REQUEST_STRUCT.pack(
+        MAGIC_COOKIE,
+        MSG_TYPE_POLICY_REQUEST,
+        num_rounds,
+        POLICY_THRESHOLD if table is None else POLICY_TABLE,
+        threshold,
+        _encode_name(team_name),
+        b"" if table is None else table,
+    )
+
+# unpack into (num_rounds, threshold, table, team_name); table is None for
+# threshold policies
+def unpack_policy_request(data: bytes):
+    if len(data) != POLICY_REQUEST_SIZE:
+        return None
+
+    cookie, msg_type, num_rounds, kind, threshold, raw_name, table = POLICY_REQUEST_STRUCT.unpack(data)
+
+    if cookie != MAGIC_COOKIE or msg_type != MSG_TYPE_POLICY_REQUEST:
+        return None                   #error handling
+    if kind == POLICY_THRESHOLD:
+        return num_rounds, threshold, None, _decode_name(raw_name)
+    if kind == POLICY_TABLE:
+        return num_rounds, 0, table, _decode_name(raw_name)
+    return None                       #error handling
+
+
+# ----- Batch sessions (extension) -----
+
+# A batch request is a policy request whose rounds are played entirely on
+# the server: no server payloads are sent at all. Instead the server answers
+# with batch results frames, each covering up to BATCH_ROUNDS consecutive
+# rounds, until num_rounds rounds have been reported; then it closes the
+# connection.
+# A batch results frame is a BATCH_RESULTS_STRUCT header followed by
+#   rounds bytes       the result code of each round, in order
+#   cards_size bytes   with BATCH_CARDS only: for each round, the player's card
+#                      count, the dealer's card count, then the player's and
+#                      the dealer's card codes (rank * 4 + suit)
+# wins, losses and ties total the frame's rounds.
+
+BATCH_CARDS = 0x1    # request flag: include every round's cards
+
+BATCH_ROUNDS = 65536     # most rounds in one batch results frame
+
+BATCH_REQUEST_FORMAT = f"!I B I B B B 32s {POLICY_TABLE_SIZE}s"   # cookie, type, num_rounds, kind, threshold, flags, name, table
+BATCH_REQUEST_STRUCT = struct.Struct(BATCH_REQUEST_FORMAT)
+BATCH_REQUEST_SIZE = BATCH_REQUEST_STRUCT.size
+
+BATCH_RESULTS_FORMAT = "!I B I I I I I"   # cookie, type, rounds, wins, losses, ties, cards_size
+BATCH_RESULTS_STRUCT = struct.Struct(BATCH_RESULTS_FORMAT)
+BATCH_RESULTS_SIZE = BATCH_RESULTS_STRUCT.size
+
+
+# Request a batch with a threshold or table policy, as pack_policy_request.
+def pack_batch_request(num_rounds: int, team_name: str, threshold: int = 0, table=None,
+                       flags: int = 0) -> bytes:
+    return BATCH_REQUEST_STRUCT.pack(
+        MAGIC_COOKIE,
+        MSG_TYPE_BATCH_REQUEST,
+        num_rounds,
+        POLICY_THRESHOLD if table is None else POLICY_TABLE,
+        threshold,
+        flags,
+        _encode_name(team_name),
+        b"" if table is None else table,
+    )
+
+# unpack into (num_rounds, threshold, table, flags, team_name); table is None
+# for threshold policies
+def unpack_batch_request(data: bytes):
+    if len(data) != BATCH_REQUEST_SIZE:
+        return None
+
+    cookie, msg_type, num_rounds, kind, threshold, flags, raw_name, table = BATCH_REQUEST_STRUCT.unpack(data)
+
+    if cookie != MAGIC_COOKIE or msg_type != MSG_TYPE_BATCH_REQUEST:
+        return None                   #error handling
+    if kind == POLICY_THRESHOLD:
+        return num_rounds, threshold, None, flags, _decode_name(raw_name)
+    if kind == POLICY_TABLE:
+        return num_rounds, 0, table, flags, _decode_name(raw_name)
+    return None                       #error handling
+
+
+# A whole batch results frame from the round results and (possibly empty)
+# card records.
+def pack_batch_results(results: bytes, cards: bytes = b"") -> bytes:
+    header = BATCH_RESULTS_STRUCT.pack(
+        MAGIC_COOKIE,
+        MSG_TYPE_BATCH_RESULTS,
+        len(results),
+        results.count(RESULT_WIN),
+        results.count(RESULT_LOSS),
+        results.count(RESULT_TIE),
+        len(cards),
+    )
+    return header + results + cards
+
+# unpack a batch results header into (rounds, wins, losses, ties, cards_size);
+# the rounds + cards_size bytes after it are the frame's body
+def unpack_batch_results(data: bytes):
+    if len(data) != BATCH_RESULTS_SIZE:
+        return None
+
+    cookie, msg_type, rounds, wins, losses, ties, cards_size = BATCH_RESULTS_STRUCT.unpack(data)
+
+    if cookie != MAGIC_COOKIE or msg_type != MSG_TYPE_BATCH_RESULTS:
+        return None                   #error handling
+    if wins + losses + ties != rounds or rounds > BATCH_ROUNDS:
+        return None                   #error handling
+    return rounds, wins, losses, ties, cards_size
+
+
+# unpack a BATCH_CARDS body into a list of (player_cards, dealer_cards) byte
+# strings, one per round; None if the records do not fill it exactly
+def unpack_batch_cards(cards: bytes):
+    rounds = []
+    offset = 0
+    size = len(cards)
+    while offset < size:
+        if offset + 2 > size:
+            return None               #error handling
+        player_end = offset + 2 + cards[offset]
+        end = player_end + cards[offset + 1]
+        if end > size:
+            return None               #error handling
+        rounds.append((cards[offset + 2:player_end], cards[player_end:end]))
+        offset = end
+    return rounds
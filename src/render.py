@@ -0,0 +1,99 @@
+# Client output at three verbosity levels.
+# RENDER_FULL draws every card as print_cards() does, RENDER_SUMMARY prints
+# one line per round and RENDER_SILENT only the final statistics.
+# Card text is rendered once per card code at import time. Hands are drawn
+# incrementally, by appending the new cards' glyphs to the lines already
+# built, and a round's output is collected in memory and written to the
+# terminal in one call when the round ends, so a slow terminal never sits
+# between a server payload and the next decision.
+
+import sys
+
+from utils import MIN_RANK, MAX_RANK, SUITS, format_card
+from blackijecky import card_code
+
+
+RENDER_SILENT = 0
+RENDER_SUMMARY = 1
+RENDER_FULL = 2
+
+_RED = "\033[31m"
+_RESET = "\033[0m"
+_SUIT_SYMBOLS = {0: "♥", 1: "♦", 2: "♣", 3: "♠"}
+_RANK_SYMBOLS = {1: "A", 11: "J", 12: "Q", 13: "K"}
+
+
+def _glyph(rank, suit):
+    symbol = f"{_RANK_SYMBOLS.get(rank, str(rank))}{_SUIT_SYMBOLS[suit]}"
+    if suit in (0, 1):  # Heart or Diamond are red
+        symbol = f"{_RED}{symbol}{_RESET}"
+    return ("+--+", f"|{symbol}|", "+--+")
+
+
+# Per card code: the three lines of its print_cards() box, and its
+# format_card() name. Codes that are not cards map to None.
+CARD_GLYPHS = [None] * (card_code(MAX_RANK, max(SUITS)) + 1)
+CARD_NAMES = [None] * len(CARD_GLYPHS)
+for _rank in range(MIN_RANK, MAX_RANK + 1):
+    for _suit in SUITS:
+        CARD_GLYPHS[card_code(_rank, _suit)] = _glyph(_rank, _suit)
+        CARD_NAMES[card_code(_rank, _suit)] = format_card(_rank, _suit)
+
+
+# The box lines of one hand, extended as cards are dealt.
+class HandArt:
+    __slots__ = ("hand", "drawn", "lines")
+
+    def __init__(self, hand):
+        self.hand = hand
+        self.drawn = 0
+        self.lines = ["", "", ""]
+
+    def text(self) -> str:
+        cards = self.hand.cards
+        lines = self.lines
+        for code in cards[self.drawn:]:
+            glyph = CARD_GLYPHS[code]
+            for i in range(3):
+                lines[i] = f"{lines[i]} {glyph[i]}" if lines[i] else glyph[i]
+        self.drawn = len(cards)
+        return "\n".join(lines)
+
+
+# Collects a session's output and writes it once per round (or on flush()).
+# show is the client.round_steps show callback for the level (None unless
+# RENDER_FULL, so the round does no rendering work at all).
+class Renderer:
+    def __init__(self, level: int = RENDER_FULL, out=None):
+        self.level = level
+        self.out = out if out is not None else sys.stdout
+        self.show = self._show if level >= RENDER_FULL else None
+        self._buffer = []
+        self._art = {}  # label -> HandArt of the current round
+
+    def _show(self, message, label, hand):
+        art = self._art.get(label)
+        if art is None or art.hand is not hand:
+            art = self._art[label] = HandArt(hand)
+        self._buffer.append(f"{message}\n{label}\n{art.text()}\n")
+
+    # Add text at RENDER_FULL only.
+    def detail(self, text: str):
+        if self.level >= RENDER_FULL:
+            self._buffer.append(text)
+
+    # Add text at RENDER_SUMMARY and above.
+    def summary(self, text: str):
+        if self.level >= RENDER_SUMMARY:
+            self._buffer.append(text)
+
+    # End of a round: write its output.
+    def end_round(self):
+        self._art.clear()
+        self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.out.write("".join(self._buffer))
+            self.out.flush()
+            self._buffer.clear()
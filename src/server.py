@@ -1,15 +1,41 @@
+import argparse
+import asyncio
+import functools
+import os
+import queue
+import random
 import socket
-import struct
 import threading
 import time
 
 from protocol import (
-    PAYLOAD_CLIENT_FORMAT,
-    REQUEST_FORMAT,
+    PAYLOAD_CLIENT_SIZE,
+    REQUEST_SIZE,
+    FRAME_HEADER_SIZE,
+    MUX_REQUEST_SIZE,
+    MUX_CLIENT_FRAME_SIZES,
+    STREAM_REQUEST_SIZE,
+    STREAM_CLIENT_FRAME_SIZES,
+    POLICY_REQUEST_SIZE,
+    BATCH_REQUEST_SIZE,
+    BATCH_ROUNDS,
+    BATCH_CARDS,
     pack_offer,
+    pack_offer_load,
     unpack_request,
     unpack_payload_client,
-    pack_payload_server,
+    frame_type,
+    unpack_mux_request,
+    unpack_mux_payload_client,
+    mux_server_prefix,
+    mux_payload_server,
+    unpack_stream_request,
+    unpack_stream_credit,
+    pack_stream_end,
+    unpack_policy_request,
+    unpack_batch_request,
+    pack_batch_results,
+    SERVER_PAYLOADS,
 )
 from utils import (
     UDP_OFFER_PORT,
@@ -19,167 +45,1040 @@ from utils import (
     RESULT_TIE,
     DECISION_HIT,
     DECISION_STAND,
-    recv_exact,
-)
-from blackijecky import (
-    new_deck,
-    shuffle_deck,
-    draw_card,
-    hand_total,
-    is_bust,
-    dealer_should_hit,
+    MSG_TYPE_MUX_REQUEST,
+    MSG_TYPE_MUX_PAYLOAD,
+    MSG_TYPE_PAYLOAD,
+    MSG_TYPE_STREAM_REQUEST,
+    MSG_TYPE_STREAM_CREDIT,
+    MSG_TYPE_POLICY_REQUEST,
+    MSG_TYPE_BATCH_REQUEST,
+    IOV_MAX,
+    FrameReader,
+    FrameWriter,
 )
+from workers import supervise
+from shoe import Shoe, ShoePool, session_rng
+from metrics import PhaseMetrics, RollingRate, serve_stats, dump_stats
+from timers import TimerWheel
+from leaderboard import Leaderboard
+from blackijecky import Hand, card_value
+from strategy import threshold_table, unpack_table
 
 
 SERVER_NAME = "DealMeASliceServer"  
+CLIENT_TIMEOUT = 60.0  # seconds to wait on a client before dropping it
+REQUEST_TIMEOUT = 10.0  # seconds a new connection gets to send its request
 
-# Broadcast offer messages over UDP once per second.
-def udp_offer_broadcaster(tcp_port: int):
+# Thread engine admission control (see SessionPool); defaults of the flags.
+MAX_SESSIONS = 1000    # sessions played at once
+SESSION_QUEUE = 1000   # accepted connections waiting for a session thread
+BACKLOG = 1024         # listen backlog
 
-    udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+# Live session counters for this server process.
+class SessionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+        self.total = 0
+        self.rounds = 0
+        self._first_id = 1
+        self._id_step = 1
 
-    while True:
-        try:
-            offer_msg = pack_offer(tcp_port, SERVER_NAME)
-            udp_sock.sendto(offer_msg, ("<broadcast>", UDP_OFFER_PORT)) # Send UDP broadcast so all clients listening on UDP_OFFER_PORT can receive the offer
-            time.sleep(1)       # Broadcast every second
-        except Exception:
-            # UDP errors should not crash the server
-            time.sleep(1)
+    # Number this process's sessions as worker `worker` of `workers`, after
+    # `before` sessions of the worker it replaces: ids then run worker + 1,
+    # worker + 1 + workers, ..., so no two workers (and with --seed, no two
+    # sessions) share one.
+    def number_sessions(self, worker: int, workers: int, before: int = 0):
+        self._first_id = worker + 1 + before * workers
+        self._id_step = workers
+
+    # Count a new session and return its id (1, 2, ... in a single process).
+    def session_opened(self) -> int:
+        with self._lock:
+            self.active += 1
+            self.total += 1
+            return self._first_id + (self.total - 1) * self._id_step
+
+    def session_closed(self):
+        with self._lock:
+            self.active -= 1
+
+    def round_played(self):
+        with self._lock:
+            self.rounds += 1
+
+    # (sessions so far, active sessions, rounds so far), as reported to the
+    # supervisor and advertised in load offers.
+    def load(self):
+        return self.total, self.active, self.rounds
+
+
+STATS = SessionStats()
+
+# Pre-shuffled shoes for all sessions; main() replaces it to apply --decks
+# and --penetration.
+SHOES = ShoePool()
+
+# Master seed set by --seed. When set, every session shuffles its own shoes
+# from session_rng(SEED, session id) instead of taking them from SHOES.
+SEED = None
+
+# Per-phase latency histograms; off unless enabled by --metrics.
+METRICS = PhaseMetrics()
+
+# Client deadlines of the thread engine.
+TIMERS = TimerWheel()
+
+# Round transcript writer; None unless enabled by --transcript.
+TRANSCRIPT = None
+
+# Per-team results; None unless enabled by --leaderboard.
+BOARD = None
+
+
+# Offer broadcasting; defaults of --offer-interval, --offer-jitter and --broadcast.
+OFFER_INTERVAL = 1.0   # seconds between offers
+OFFER_JITTER = 0.1     # each interval varies by up to this fraction, so servers started together drift apart
+BROADCAST_ADDRESSES = ("<broadcast>",)
+
+
+# The offer datagrams of one server: the plain offer never changes and is
+# packed once, the load offer is repacked only when the advertised load does.
+class OfferCache:
+    def __init__(self, tcp_port: int, capacity: int = 0, name: str = SERVER_NAME):
+        self.tcp_port = tcp_port
+        self.capacity = capacity
+        self.name = name
+        self.offer = pack_offer(tcp_port, name)
+        self._load = None
+        self._load_offer = None
+
+    def load_offer(self, active: int, rounds_per_sec: int) -> bytes:
+        if (active, rounds_per_sec) != self._load:
+            self._load = active, rounds_per_sec
+            self._load_offer = pack_offer_load(
+                self.tcp_port, self.name, active, self.capacity, rounds_per_sec
+            )
+        return self._load_offer
+
+
+class _OfferSender(asyncio.DatagramProtocol):
+    def error_received(self, exc):
+        pass  # UDP errors should not crash the server
+
+
+# Broadcast offers to UDP_OFFER_PORT at every address in addresses (e.g. the
+# broadcast address of each interface) every interval seconds, +- jitter.
+# Each plain offer is followed by a load offer built from load(), which
+# returns (sessions so far, active sessions, rounds so far) like
+# SessionStats.load; capacity is advertised as given (0 = unlimited).
+# Runs on the caller's event loop until cancelled.
+async def broadcast_offers(tcp_port: int, load=STATS.load, capacity: int = 0,
+                           interval: float = OFFER_INTERVAL, jitter: float = OFFER_JITTER,
+                           addresses=BROADCAST_ADDRESSES):
+    transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+        _OfferSender, family=socket.AF_INET, allow_broadcast=True
+    )
+    offers = OfferCache(tcp_port, capacity)
+    round_rate = RollingRate()
+    targets = [(address, UDP_OFFER_PORT) for address in addresses]
+    try:
+        while True:
+            _, active, rounds = load()
+            load_offer = offers.load_offer(active, round(round_rate.update(rounds)))
+            for target in targets:
+                transport.sendto(offers.offer, target)
+                transport.sendto(load_offer, target)
+            await asyncio.sleep(interval * random.uniform(1 - jitter, 1 + jitter))
+    finally:
+        transport.close()
 
-def send_card(conn, result, card):
-    if card is None:
-        conn.sendall(pack_payload_server(result, 0, 0))
-    else:
-        rank, suit = card
-        conn.sendall(pack_payload_server(result, rank, suit))
 
+# broadcast_offers on its own event loop, as a thread target for engines
+# (and the --workers supervisor) that do not run one.
+def udp_offer_broadcaster(tcp_port: int, load=STATS.load, **options):
+    asyncio.run(broadcast_offers(tcp_port, load, **options))
 
-def play_round(conn):
-    deck = new_deck()
-    shuffle_deck(deck)
+# Start a session for team_name: count it in STATS and return its shoe and
+# its round log for the transcript and leaderboard (None when both are off).
+# Call STATS.session_closed() when it ends.
+def open_session(team_name):
+    session = STATS.session_opened()
+    rng = None if SEED is None else session_rng(SEED, session)
+    logs = []
+    if TRANSCRIPT:
+        logs.append(TRANSCRIPT.session(session, team_name))
+    if BOARD:
+        logs.append(BOARD.session(team_name))
+    if len(logs) > 1:
+        return Shoe(SHOES, rng), lambda *round_: [log(*round_) for log in logs]
+    return Shoe(SHOES, rng), logs[0] if logs else None
 
-    player_hand = []
-    dealer_hand = []
+
+# Look up the prebuilt server payload for a card code, or the "no card"
+# payload when card is None. Nothing is packed while a round is being played.
+def card_payload(result, card):
+    return SERVER_PAYLOADS[result][0 if card is None else card]
+
+
+def send_card(conn, result, card):
+    conn.sendall(card_payload(result, card))
+
+
+# Deal two cards to the player and two to the dealer, showing the player
+# their cards and the dealer's visible one.
+def initial_deal(shoe, emit):
+    player_hand = Hand()
+    dealer_hand = Hand()
 
     # Initial deal - player
     for _ in range(2):
-        card = draw_card(deck)
-        player_hand.append(card)
-        send_card(conn, RESULT_NOT_OVER, card)
+        card = shoe.draw()
+        player_hand.add(card)
+        emit(card_payload(RESULT_NOT_OVER, card))
 
     # Initial deal - dealer
-    dealer_visible = draw_card(deck)
-    dealer_hidden = draw_card(deck)
-    dealer_hand.append(dealer_visible)
-    dealer_hand.append(dealer_hidden)
+    dealer_visible = shoe.draw()
+    dealer_hidden = shoe.draw()
+    dealer_hand.add(dealer_visible)
+    dealer_hand.add(dealer_hidden)
+
+    emit(card_payload(RESULT_NOT_OVER, dealer_visible))
+    return player_hand, dealer_hand, dealer_hidden
+
+
+# Reveal the hidden card, let the dealer draw and settle the round.
+def dealer_turn(shoe, player_hand, dealer_hand, dealer_hidden, emit):
+    emit(card_payload(RESULT_NOT_OVER, dealer_hidden))
+
+    while dealer_hand.dealer_should_hit():
+        card = shoe.draw()
+        dealer_hand.add(card)
+
+        if dealer_hand.is_bust():
+            emit(card_payload(RESULT_WIN, card))
+            return RESULT_WIN
+
+        emit(card_payload(RESULT_NOT_OVER, card))
+
+    # Compare totals
+    player_total = player_hand.total
+    dealer_total = dealer_hand.total
+
+    if player_total > dealer_total:
+        emit(card_payload(RESULT_WIN, None))
+        return RESULT_WIN
+    if dealer_total > player_total:
+        emit(card_payload(RESULT_LOSS, None))
+        return RESULT_LOSS
+
+    emit(card_payload(RESULT_TIE, None))
+    return RESULT_TIE
 
-    send_card(conn, RESULT_NOT_OVER, dealer_visible)
 
-    # Player turn
+# The round state machine, written once and shared by every server engine.
+# Cards are drawn from the session's shoe as card codes, and every server
+# payload is handed to emit() in wire order. The generator yields whenever it
+# needs the next client decision, which the engine sends back in.
+# The round result is the generator's return value.
+# record(phase, seconds), when given, times the deal and the dealer turn.
+# log(result, player_cards, dealer_cards), when given, gets every finished
+# round for the session's transcript (see transcript.py).
+def round_steps(shoe, emit, record=None, log=None):
+    if record:
+        start = time.perf_counter()
+    player_hand, dealer_hand, dealer_hidden = initial_deal(shoe, emit)
+    if record:
+        record("deal", time.perf_counter() - start)
+
+    # The dealer's up-card value, for engines that decide for the player.
+    up = card_value(dealer_hand.cards[0] >> 2)
+
+    # Player turn: yields (player hand, dealer up value) for each decision
     while True:
-        data = recv_exact(conn, struct.calcsize(PAYLOAD_CLIENT_FORMAT))
-        decision = unpack_payload_client(data)
-        if decision is None:
-            raise RuntimeError("Invalid client payload")
+        decision = yield player_hand, up
 
         if decision == DECISION_HIT:
-            card = draw_card(deck)
-            player_hand.append(card)
+            card = shoe.draw()
+            player_hand.add(card)
 
-            if is_bust(player_hand):
-                send_card(conn, RESULT_LOSS, card)
+            if player_hand.is_bust():
+                emit(card_payload(RESULT_LOSS, card))
+                if log:
+                    log(RESULT_LOSS, player_hand.cards, dealer_hand.cards)
                 return RESULT_LOSS
 
-            send_card(conn, RESULT_NOT_OVER, card)
+            emit(card_payload(RESULT_NOT_OVER, card))
 
         elif decision == DECISION_STAND:
             break
 
     # Dealer turn
-    send_card(conn, RESULT_NOT_OVER, dealer_hidden)
+    if record:
+        start = time.perf_counter()
+    result = dealer_turn(shoe, player_hand, dealer_hand, dealer_hidden, emit)
+    if record:
+        record("dealer", time.perf_counter() - start)
+    if log:
+        log(result, player_hand.cards, dealer_hand.cards)
+    return result
 
-    while dealer_should_hit(dealer_hand):
-        card = draw_card(deck)
-        dealer_hand.append(card)
 
-        if is_bust(dealer_hand):
-            send_card(conn, RESULT_WIN, card)
-            return RESULT_WIN
+# Wrap func so every call is timed as phase.
+def timed(func, phase, record):
+    def call(*args):
+        start = time.perf_counter()
+        result = func(*args)
+        record(phase, time.perf_counter() - start)
+        return result
+    return call
 
-        send_card(conn, RESULT_NOT_OVER, card)
 
-    # Compare totals
-    player_total = hand_total(player_hand)
-    dealer_total = hand_total(dealer_hand)
+def read_decision(reader):
+    data = reader.read(PAYLOAD_CLIENT_SIZE)
+    decision = unpack_payload_client(data)
+    if decision is None:
+        raise RuntimeError("Invalid client payload")
+    return decision
 
-    if player_total > dealer_total:
-        send_card(conn, RESULT_WIN, None)
-        return RESULT_WIN
-    if dealer_total > player_total:
-        send_card(conn, RESULT_LOSS, None)
-        return RESULT_LOSS
 
-    send_card(conn, RESULT_TIE, None)
-    return RESULT_TIE
+# Play one round over a FrameReader/FrameWriter pair. Frames are flushed
+# only when the client's next decision is needed; whatever the round leaves
+# pending goes out together with the next round's initial deal.
+# read_decision(reader) reads the client's next decision.
+def play_round(reader, writer, shoe, record=None, read_decision=read_decision, log=None):
+    if record:
+        start = time.perf_counter()
+        wait_decision = timed(read_decision, "decision_wait", record)
+    else:
+        wait_decision = read_decision
+
+    shoe.start_round()
+    steps = round_steps(shoe, writer.write, record, log)
+    try:
+        next(steps)
+        while True:
+            writer.flush()
+            steps.send(wait_decision(reader))
+    except StopIteration as stop:
+        STATS.round_played()
+        if record:
+            record("round", time.perf_counter() - start)
+        return stop.value
+
+# ----- Streaming sessions -----
+
+# Credit-based flow control of a streaming session (no I/O).
+# The session may start a round while credit > 0; ended is set once the
+# client has asked to stop after the current round.
+class StreamControl:
+    def __init__(self, credit):
+        self.credit = credit
+        self.ended = False
+
+    # Apply a client stream credit or stream end frame.
+    def receive(self, msg_type, frame):
+        if msg_type == MSG_TYPE_STREAM_CREDIT:
+            rounds = unpack_stream_credit(frame)
+            if rounds is None:
+                raise RuntimeError("Invalid stream credit")
+            self.credit += rounds
+        else:
+            self.ended = True
+
+
+# Read the next client frame as (type, frame), for connections where
+# several frame types may arrive; sizes maps each allowed type to its size.
+def read_frame(reader, sizes):
+    msg_type = frame_type(reader.peek(FRAME_HEADER_SIZE))
+    size = sizes.get(msg_type)
+    if size is None:
+        raise RuntimeError("Unexpected client frame")
+    return msg_type, reader.read(size)
+
+
+# read_decision for streaming sessions: control frames may arrive between
+# decisions and are applied on the way.
+def read_stream_decision(reader, control):
+    while True:
+        msg_type, frame = read_frame(reader, STREAM_CLIENT_FRAME_SIZES)
+        if msg_type == MSG_TYPE_PAYLOAD:
+            decision = unpack_payload_client(frame)
+            if decision is None:
+                raise RuntimeError("Invalid client payload")
+            return decision
+        control.receive(msg_type, frame)
+
+
+# Play rounds while credit lasts, until num_rounds (0 = no limit) have been
+# played or the client ends the stream, then send the stream end frame.
+def play_stream(reader, writer, shoe, num_rounds, control, record=None, log=None):
+    read = functools.partial(read_stream_decision, control=control)
+    played = 0
+    while not control.ended and (num_rounds == 0 or played < num_rounds):
+        if control.credit == 0:
+            # Out of credit: wait for the client to grant more (or end).
+            writer.flush()
+            msg_type, frame = read_frame(reader, STREAM_CLIENT_FRAME_SIZES)
+            if msg_type == MSG_TYPE_PAYLOAD:
+                raise RuntimeError("Decision outside a round")
+            control.receive(msg_type, frame)
+            continue
+        control.credit -= 1
+        play_round(reader, writer, shoe, record, read, log)
+        played += 1
+    writer.write(pack_stream_end(played))
+    return played
+
+
+# ----- Policy sessions -----
+
+# The decision table of a policy request: table[hand state][up value].
+def policy_table(threshold, table):
+    return threshold_table(threshold) if table is None else unpack_table(table)
+
+
+# Play one round with the client's decisions taken from its policy table,
+# handing every payload to emit() without waiting on the client.
+# Shared by both engines: nothing here does I/O.
+def policy_round(emit, shoe, table, record=None, log=None):
+    if record:
+        start = time.perf_counter()
+    shoe.start_round()
+    steps = round_steps(shoe, emit, record, log)
+    try:
+        hand, up = next(steps)
+        while True:
+            hand, up = steps.send(table[hand.state][up])
+    except StopIteration as stop:
+        STATS.round_played()
+        if record:
+            record("round", time.perf_counter() - start)
+        return stop.value
+
+
+# ----- Batch sessions -----
+
+# Rounds the asyncio engine plays between yields to the event loop, so one
+# large batch does not stall every other session.
+BATCH_SLICE = 1024
+
+
+def _discard(_payload):
+    pass
+
+
+# The rounds of a batch session, played with policy_round but without any
+# server payloads: only each round's result (and with cards, its card record)
+# is kept, until frame() packs them into a batch results frame.
+class BatchSession:
+    def __init__(self, shoe, table, cards=False, record=None, log=None):
+        self.shoe = shoe
+        self.table = table
+        self.record = record
+        self.results = bytearray()
+        self.cards = bytearray() if cards else None
+        if cards:
+            self.log = self._log_cards if log is None else (
+                lambda *round_: (self._log_cards(*round_), log(*round_)))
+        else:
+            self.log = log
+
+    def _log_cards(self, _result, player_cards, dealer_cards):
+        cards = self.cards
+        cards.append(len(player_cards))
+        cards.append(len(dealer_cards))
+        cards += bytes(player_cards)
+        cards += bytes(dealer_cards)
+
+    @property
+    def pending(self) -> int:
+        return len(self.results)
+
+    def play(self, rounds):
+        append = self.results.append
+        shoe, table, record, log = self.shoe, self.table, self.record, self.log
+        for _ in range(rounds):
+            append(policy_round(_discard, shoe, table, record, log))
+
+    # The batch results frame of the rounds played since the last frame().
+    def frame(self) -> bytes:
+        frame = pack_batch_results(bytes(self.results), bytes(self.cards or b""))
+        self.results.clear()
+        if self.cards:
+            self.cards.clear()
+        return frame
+
+
+# Play num_rounds rounds of a batch session, one results frame per
+# BATCH_ROUNDS rounds. The client only waits while a slice is computed, so
+# the writer's deadline is restarted before each one.
+def play_batch(writer, batch, num_rounds):
+    while num_rounds:
+        if writer.deadline:
+            writer.deadline.reset()
+        rounds = min(num_rounds, BATCH_ROUNDS)
+        batch.play(rounds)
+        writer.write(batch.frame())
+        writer.flush()
+        num_rounds -= rounds
+
+
+# ----- Multiplexed tables -----
+
+# One game table on a multiplexed connection.
+class _Table:
+    __slots__ = ("emit", "shoe", "rounds_left", "steps", "log")
+
+    def __init__(self, emit, shoe, rounds_left, log=None):
+        self.emit = emit
+        self.shoe = shoe
+        self.rounds_left = rounds_left
+        self.steps = None
+        self.log = log
+
+
+# The game tables of one multiplexed connection.
+# Like round_steps this does no I/O: the engine passes every client frame to
+# receive() and sends whatever the session hands to emit(). Each table plays
+# its rounds from its own shoe, exactly like a legacy session, and counts as
+# one session in STATS. Every table request is recorded as a "request" phase:
+# the first from the connection's start (as in a legacy session), later ones
+# from the arrival of their frame.
+class MuxSession:
+    def __init__(self, emit, record=None, start=None):
+        self.emit = emit
+        self.record = record
+        self.tables = {}
+        self._request_start = start
+
+    # True when no table is in the middle of its rounds.
+    @property
+    def idle(self) -> bool:
+        return not self.tables
+
+    def receive(self, msg_type, frame):
+        if msg_type == MSG_TYPE_MUX_PAYLOAD:
+            payload = unpack_mux_payload_client(frame)
+            if payload is None:
+                raise RuntimeError("Invalid client payload")
+            self.decide(*payload)
+        else:
+            start = self._request_start or time.perf_counter()
+            self._request_start = None
+            request = unpack_mux_request(frame)
+            if request is None:
+                raise RuntimeError("Invalid table request")
+            if self.record:
+                self.record("request", time.perf_counter() - start)
+            table, num_rounds, team_name = request
+            self.open_table(table, num_rounds, team_name)
+
+    def open_table(self, table, num_rounds, team_name=""):
+        if table in self.tables:
+            raise RuntimeError(f"Table {table} is already open")
+        if num_rounds == 0:
+            return
+        prefix = mux_server_prefix(table)
+        emit = self.emit
+        shoe, log = open_session(team_name)
+        state = _Table(lambda payload: emit(mux_payload_server(prefix, payload)),
+                       shoe, num_rounds, log)
+        self.tables[table] = state
+        self._start_round(state)
+
+    def decide(self, table, decision):
+        state = self.tables.get(table)
+        if state is None:
+            raise RuntimeError(f"Decision for table {table}, which is not open")
+        try:
+            state.steps.send(decision)
+        except StopIteration:
+            STATS.round_played()
+            state.rounds_left -= 1
+            if state.rounds_left:
+                self._start_round(state)
+            else:
+                del self.tables[table]
+                STATS.session_closed()
+
+    # Drop every open table (the connection is going away).
+    def close(self):
+        for _ in self.tables:
+            STATS.session_closed()
+        self.tables.clear()
+
+    def _start_round(self, state):
+        state.shoe.start_round()
+        state.steps = round_steps(state.shoe, state.emit, self.record, state.log)
+        next(state.steps)
+
+
+# Replies a multiplexed connection collects before writing them. One client
+# frame can add a few replies past it, so it stays well below IOV_MAX.
+MUX_FLUSH_FRAMES = IOV_MAX // 2
+
+
+# Read the next client frame of a multiplexed connection as (type, frame).
+# Pending output is flushed before the reader would block, so replies to
+# every client frame that arrived together go out together, and whenever
+# MUX_FLUSH_FRAMES replies are pending, so a burst of decisions from
+# hundreds of tables never queues an unbounded write.
+def read_mux_frame(reader, writer):
+    if reader.buffered < FRAME_HEADER_SIZE or writer.pending >= MUX_FLUSH_FRAMES:
+        writer.flush()
+    msg_type = frame_type(reader.peek(FRAME_HEADER_SIZE))
+    size = MUX_CLIENT_FRAME_SIZES.get(msg_type)
+    if size is None:
+        raise RuntimeError("Invalid multiplexed frame")
+    if reader.buffered < size:
+        writer.flush()
+    return msg_type, reader.read(size)
+
+
+# Run the tables of a multiplexed connection until the client closes it.
+def serve_mux(reader, writer, record=None, start=None):
+    session = MuxSession(writer.write, record, start)
+    try:
+        while True:
+            try:
+                msg_type, frame = read_mux_frame(reader, writer)
+            except ConnectionError:
+                if session.idle:
+                    return
+                raise
+            session.receive(msg_type, frame)
+    finally:
+        session.close()
+
 
 # Handle a single TCP client connection.
-def handle_tcp_client(conn, addr):
+# With coalesce=True all payloads produced before the next client decision
+# are sent with one syscall instead of one sendall per card.
+# The socket blocks without a timeout; a deadline on TIMERS shuts it down
+# instead if the client takes longer than REQUEST_TIMEOUT to send its request,
+# or CLIENT_TIMEOUT for any later frame (or to accept our payloads).
+def handle_tcp_client(conn, addr, coalesce=False):
+    deadline = TIMERS.deadline(REQUEST_TIMEOUT, functools.partial(shutdown_connection, conn))
     try:
-        conn.settimeout(60.0)
+        record = METRICS.record if METRICS.enabled else None
+        session_start = time.perf_counter()
 
-        data = recv_exact(conn, struct.calcsize(REQUEST_FORMAT))
-        request = unpack_request(data)  
-        if request is None:
+        reader = FrameReader(conn, deadline=deadline)
+        on_send = (lambda seconds: record("send", seconds)) if record else None
+        if frame_type(reader.peek(FRAME_HEADER_SIZE)) == MSG_TYPE_MUX_REQUEST:
+            print(f"Client {addr} connected with multiplexed tables")
+            deadline.timeout = CLIENT_TIMEOUT
+            # Multiplexed connections always coalesce their writes.
+            try:
+                serve_mux(reader, FrameWriter(conn, True, on_send, deadline), record, session_start)
+            finally:
+                if record:
+                    METRICS.fold()
             return
 
-        num_rounds, team_name = request
-        print(f"Client {team_name} connected from {addr}, rounds={num_rounds}")
+        writer = FrameWriter(conn, coalesce, on_send, deadline)
+        control = policy = batch_flags = None
+        msg_type = frame_type(reader.peek(FRAME_HEADER_SIZE))
+        if msg_type == MSG_TYPE_STREAM_REQUEST:
+            request = unpack_stream_request(reader.read(STREAM_REQUEST_SIZE))
+            if request is None:
+                return
+            num_rounds, credit, team_name = request
+            control = StreamControl(credit)
+        elif msg_type == MSG_TYPE_POLICY_REQUEST:
+            request = unpack_policy_request(reader.read(POLICY_REQUEST_SIZE))
+            if request is None:
+                return
+            num_rounds, threshold, table, team_name = request
+            policy = policy_table(threshold, table)
+            writer.coalesce = True  # one write per round
+        elif msg_type == MSG_TYPE_BATCH_REQUEST:
+            request = unpack_batch_request(reader.read(BATCH_REQUEST_SIZE))
+            if request is None:
+                return
+            num_rounds, threshold, table, batch_flags, team_name = request
+            policy = policy_table(threshold, table)
+        else:
+            data = reader.read(REQUEST_SIZE)
+            request = unpack_request(data)  
+            if request is None:
+                return
+            num_rounds, team_name = request
+        deadline.reset(CLIENT_TIMEOUT)  # the request is in: from now on the client's timeout
+        if record:
+            record("request", time.perf_counter() - session_start)
 
-        for _ in range(num_rounds): # Play the requested number of rounds
-            play_round(conn)
+        print(f"Client {team_name} connected from {addr}, "
+              f"rounds={num_rounds if num_rounds or control is None else 'unbounded'}")
 
-    except socket.timeout:
-        print(f"Client {addr} timed out")
+        shoe, log = open_session(team_name)
+        try:
+            if batch_flags is not None:
+                batch = BatchSession(shoe, policy, batch_flags & BATCH_CARDS, record, log)
+                play_batch(writer, batch, num_rounds)
+            elif policy is not None:
+                for _ in range(num_rounds):
+                    policy_round(writer.write, shoe, policy, record, log)
+                    writer.flush()
+            elif control is None:
+                for _ in range(num_rounds): # Play the requested number of rounds
+                    play_round(reader, writer, shoe, record, log=log)
+            else:
+                play_stream(reader, writer, shoe, num_rounds, control, record, log)
+            writer.flush()
+        finally:
+            STATS.session_closed()
+            if record:
+                record("session", time.perf_counter() - session_start)
+                METRICS.fold()
+
+    except OSError as e:
+        if deadline.expired:
+            METRICS.count("timed_out")
+            print(f"Client {addr} timed out")
+        elif isinstance(e, ConnectionError):
+            # Includes clients that only connect to measure RTT (see discovery.py).
+            print(f"Client {addr} disconnected")
+        else:
+            print(f"Unexpected error with {addr}: {e}")
     except RuntimeError as e:
         print(f"Game error with {addr}: {e}")
     except Exception as e:
         print(f"Unexpected error with {addr}: {e}")
     finally:
+        deadline.cancel()
         conn.close()
         print(f"TCP Connection with {addr} closed")
 
 
-def main():
-    # Create TCP socket
-    tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    tcp_sock.bind(("", 0))  # Bind to any available port
-    tcp_sock.listen()
+# Deadline action: unblock whatever the session thread is doing on conn.
+def shutdown_connection(conn):
+    try:
+        conn.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
 
-    tcp_port = tcp_sock.getsockname()[1]
-    print(f"Server started, listening on port {tcp_port}")
 
-    # Start UDP offer broadcaster thread
-    udp_thread = threading.Thread(
-        target=udp_offer_broadcaster,
-        args=(tcp_port,),
-        daemon=True,
+# ----- asyncio engine -----
+
+async def async_read_decision(reader):
+    data = await asyncio.wait_for(
+        reader.readexactly(PAYLOAD_CLIENT_SIZE), CLIENT_TIMEOUT
+    )
+    decision = unpack_payload_client(data)
+    if decision is None:
+        raise RuntimeError("Invalid client payload")
+    return decision
+
+
+async def async_read_frame(reader, sizes):
+    header = await asyncio.wait_for(
+        reader.readexactly(FRAME_HEADER_SIZE), CLIENT_TIMEOUT
     )
-    udp_thread.start()
+    msg_type = frame_type(header)
+    size = sizes.get(msg_type)
+    if size is None:
+        raise RuntimeError("Unexpected client frame")
+    rest = await asyncio.wait_for(
+        reader.readexactly(size - FRAME_HEADER_SIZE), CLIENT_TIMEOUT
+    )
+    return msg_type, header + rest
+
+
+async def async_read_stream_decision(reader, control):
+    while True:
+        msg_type, frame = await async_read_frame(reader, STREAM_CLIENT_FRAME_SIZES)
+        if msg_type == MSG_TYPE_PAYLOAD:
+            decision = unpack_payload_client(frame)
+            if decision is None:
+                raise RuntimeError("Invalid client payload")
+            return decision
+        control.receive(msg_type, frame)
+
+
+# Hand frames collected in pending (coalesce mode) to the transport in one
+# write, then wait for the transport buffer to drain.
+async def async_flush(writer, pending, record=None):
+    if not pending:
+        await writer.drain()
+        return
+    if record:
+        start = time.perf_counter()
+    writer.write(b"".join(pending))
+    pending.clear()
+    await writer.drain()
+    if record:
+        record("send", time.perf_counter() - start)
+
+
+async def async_play_round(reader, writer, shoe, pending=None, record=None,
+                           read_decision=async_read_decision, log=None):
+    if record:
+        start = time.perf_counter()
+    if pending is not None:
+        emit = pending.append
+    elif record:
+        emit = timed(writer.write, "send", record)
+    else:
+        emit = writer.write
+
+    shoe.start_round()
+    steps = round_steps(shoe, emit, record, log)
+    try:
+        next(steps)
+        while True:
+            await async_flush(writer, pending, record)
+            if record:
+                wait_start = time.perf_counter()
+                decision = await read_decision(reader)
+                record("decision_wait", time.perf_counter() - wait_start)
+            else:
+                decision = await read_decision(reader)
+            steps.send(decision)
+    except StopIteration as stop:
+        STATS.round_played()
+        if pending is None:
+            await writer.drain()
+        if record:
+            record("round", time.perf_counter() - start)
+        return stop.value
+
+
+# play_stream on asyncio streams.
+async def async_play_stream(reader, writer, shoe, num_rounds, control, pending=None, record=None,
+                            log=None):
+    read = functools.partial(async_read_stream_decision, control=control)
+    played = 0
+    while not control.ended and (num_rounds == 0 or played < num_rounds):
+        if control.credit == 0:
+            await async_flush(writer, pending, record)
+            msg_type, frame = await async_read_frame(reader, STREAM_CLIENT_FRAME_SIZES)
+            if msg_type == MSG_TYPE_PAYLOAD:
+                raise RuntimeError("Decision outside a round")
+            control.receive(msg_type, frame)
+            continue
+        control.credit -= 1
+        await async_play_round(reader, writer, shoe, pending, record, read, log)
+        played += 1
+    if pending is not None:
+        pending.append(pack_stream_end(played))
+    else:
+        writer.write(pack_stream_end(played))
+    return played
+
+
+# play_batch on asyncio streams, yielding to the event loop every BATCH_SLICE rounds.
+async def async_play_batch(writer, batch, num_rounds, pending, record=None):
+    while num_rounds:
+        rounds = min(num_rounds, BATCH_SLICE, BATCH_ROUNDS - batch.pending)
+        batch.play(rounds)
+        num_rounds -= rounds
+        if batch.pending == BATCH_ROUNDS or not num_rounds:
+            pending.append(batch.frame())
+            await async_flush(writer, pending, record)
+        else:
+            await asyncio.sleep(0)
+
+
+# serve_mux on asyncio streams. Replies to each client frame are written
+# together; the transport buffers them while the socket is busy.
+async def async_serve_mux(reader, writer, first_frame, record=None, start=None):
+    pending = []
+    session = MuxSession(pending.append, record, start)
+    try:
+        session.receive(MSG_TYPE_MUX_REQUEST, first_frame)
+        while True:
+            await async_flush(writer, pending, record)
+            try:
+                msg_type, frame = await async_read_frame(reader, MUX_CLIENT_FRAME_SIZES)
+            except asyncio.IncompleteReadError as e:
+                if session.idle and not e.partial:
+                    return
+                raise
+            session.receive(msg_type, frame)
+    finally:
+        session.close()
+
+
+# Same session flow as handle_tcp_client, on asyncio streams.
+async def async_handle_tcp_client(reader, writer, coalesce=False):
+    addr = writer.get_extra_info("peername")
+    record = METRICS.record if METRICS.enabled else None
+    session_start = time.perf_counter()
+    try:
+        header = await asyncio.wait_for(
+            reader.readexactly(FRAME_HEADER_SIZE), CLIENT_TIMEOUT
+        )
+        if frame_type(header) == MSG_TYPE_MUX_REQUEST:
+            print(f"Client {addr} connected with multiplexed tables")
+            rest = await asyncio.wait_for(
+                reader.readexactly(MUX_REQUEST_SIZE - FRAME_HEADER_SIZE), CLIENT_TIMEOUT
+            )
+            try:
+                await async_serve_mux(reader, writer, header + rest, record, session_start)
+            finally:
+                if record:
+                    METRICS.fold()
+            return
 
+        control = policy = batch_flags = None
+        if frame_type(header) == MSG_TYPE_STREAM_REQUEST:
+            data = header + await asyncio.wait_for(
+                reader.readexactly(STREAM_REQUEST_SIZE - FRAME_HEADER_SIZE), CLIENT_TIMEOUT
+            )
+            request = unpack_stream_request(data)
+            if request is None:
+                return
+            num_rounds, credit, team_name = request
+            control = StreamControl(credit)
+        elif frame_type(header) == MSG_TYPE_POLICY_REQUEST:
+            data = header + await asyncio.wait_for(
+                reader.readexactly(POLICY_REQUEST_SIZE - FRAME_HEADER_SIZE), CLIENT_TIMEOUT
+            )
+            request = unpack_policy_request(data)
+            if request is None:
+                return
+            num_rounds, threshold, table, team_name = request
+            policy = policy_table(threshold, table)
+        elif frame_type(header) == MSG_TYPE_BATCH_REQUEST:
+            data = header + await asyncio.wait_for(
+                reader.readexactly(BATCH_REQUEST_SIZE - FRAME_HEADER_SIZE), CLIENT_TIMEOUT
+            )
+            request = unpack_batch_request(data)
+            if request is None:
+                return
+            num_rounds, threshold, table, batch_flags, team_name = request
+            policy = policy_table(threshold, table)
+        else:
+            data = header + await asyncio.wait_for(
+                reader.readexactly(REQUEST_SIZE - FRAME_HEADER_SIZE), CLIENT_TIMEOUT
+            )
+            request = unpack_request(data)
+            if request is None:
+                return
+            num_rounds, team_name = request
+        if record:
+            record("request", time.perf_counter() - session_start)
+
+        print(f"Client {team_name} connected from {addr}, "
+              f"rounds={num_rounds if num_rounds or control is None else 'unbounded'}")
+
+        pending = [] if coalesce or policy is not None else None
+        shoe, log = open_session(team_name)
+        try:
+            if batch_flags is not None:
+                batch = BatchSession(shoe, policy, batch_flags & BATCH_CARDS, record, log)
+                await async_play_batch(writer, batch, num_rounds, pending, record)
+            elif policy is not None:
+                for _ in range(num_rounds):
+                    policy_round(pending.append, shoe, policy, record, log)
+                    await async_flush(writer, pending, record)
+            elif control is None:
+                for _ in range(num_rounds): # Play the requested number of rounds
+                    await async_play_round(reader, writer, shoe, pending, record, log=log)
+            else:
+                await async_play_stream(reader, writer, shoe, num_rounds, control, pending, record,
+                                        log)
+            await async_flush(writer, pending, record)
+        finally:
+            STATS.session_closed()
+            if record:
+                record("session", time.perf_counter() - session_start)
+                METRICS.fold()
+
+    except asyncio.TimeoutError:
+        print(f"Client {addr} timed out")
+    except (ConnectionError, asyncio.IncompleteReadError):
+        print(f"Client {addr} disconnected")
+    except RuntimeError as e:
+        print(f"Game error with {addr}: {e}")
+    except Exception as e:
+        print(f"Unexpected error with {addr}: {e}")
+    finally:
+        writer.close()
+        print(f"TCP Connection with {addr} closed")
+
+
+# offers, when given, is a coroutine function (e.g. broadcast_offers) run on
+# the engine's event loop next to the sessions.
+def serve_asyncio(tcp_sock, coalesce=False, offers=None):
+    async def run():
+        server = await asyncio.start_server(
+            functools.partial(async_handle_tcp_client, coalesce=coalesce),
+            sock=tcp_sock,
+        )
+        broadcaster = asyncio.create_task(offers()) if offers else None
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if broadcaster:
+                broadcaster.cancel()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("Server shutting down.")
+
+
+# ----- Thread engine -----
+
+# Bounded pool of session threads with admission control.
+# Up to max_sessions connections are handled at once and up to queue_size
+# more wait for a free thread; submit() refuses anything beyond that so the
+# caller can shed the connection. Threads are started as needed and kept.
+class SessionPool:
+    def __init__(self, max_sessions: int, queue_size: int):
+        self.max_sessions = max_sessions
+        self.limit = max_sessions + queue_size
+        self._work = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._admitted = 0   # running or queued
+        self._threads = 0
+
+    # Connections waiting for a thread.
+    @property
+    def queued(self) -> int:
+        return max(0, self._admitted - self._threads)
+
+    def submit(self, func, *args) -> bool:
+        with self._lock:
+            if self._admitted >= self.limit:
+                return False
+            self._admitted += 1
+            spawn = self._admitted > self._threads < self.max_sessions
+            if spawn:
+                self._threads += 1
+        self._work.put((time.perf_counter(), func, args))
+        if spawn:
+            threading.Thread(target=self._worker, daemon=True).start()
+        return True
+
+    def _worker(self):
+        while True:
+            queued_at, func, args = self._work.get()
+            METRICS.record("queue_wait", time.perf_counter() - queued_at)
+            try:
+                func(*args)
+            finally:
+                with self._lock:
+                    self._admitted -= 1
+
+
+def serve_threaded(tcp_sock, coalesce=False, max_sessions=MAX_SESSIONS, queue_size=SESSION_QUEUE):
+    pool = SessionPool(max_sessions, queue_size)
+    METRICS.gauge("queue_depth", lambda: pool.queued)
     # Accept incoming TCP connections
-    # Each connection is handled in a separate thread to allow multiple clients to play simultaneously
+    # Each connection is played on a pool thread so multiple clients can play simultaneously
     while True:
         try:
             conn, addr = tcp_sock.accept()
 
-            client_thread = threading.Thread(
-                target=handle_tcp_client,
-                args=(conn, addr),
-                daemon=True
-            )
-            client_thread.start()
+            if not pool.submit(handle_tcp_client, conn, addr, coalesce):
+                # Saturated: shed the connection at once rather than let it wait.
+                METRICS.count("rejected")
+                conn.close()
 
         except Exception as e:
             print(f"Accept error: {e}")
@@ -190,6 +1089,184 @@ def main():
             print(f"Connection error: {e}")
 
 
+ENGINES = {
+    "thread": serve_threaded,
+    "asyncio": serve_asyncio,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Blackijecky server")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="thread",
+                        help="connection engine (default: thread)")
+    parser.add_argument("--port", type=int, default=0,
+                        help="TCP port to listen on (default: any available)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="run N worker processes sharing --port via SO_REUSEPORT")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="send all payloads up to the next client decision in one write")
+    parser.add_argument("--metrics", action="store_true",
+                        help="record per-phase latency histograms")
+    parser.add_argument("--stats-port", type=int, default=0,
+                        help="serve the latency report on 127.0.0.1:PORT (implies --metrics)")
+    parser.add_argument("--stats-interval", type=float, default=0.0,
+                        help="print the latency report every N seconds (implies --metrics)")
+    parser.add_argument("--decks", type=int, default=1,
+                        help="decks per shoe (default: 1)")
+    parser.add_argument("--penetration", type=float, default=0.0,
+                        help="fraction of the shoe dealt before reshuffling, capped so "
+                             "every round fits in one shoe (default: 0, a fresh shoe every round)")
+    parser.add_argument("--capacity", type=int, default=0,
+                        help="concurrent sessions to advertise as this server's capacity "
+                             "(default: 0, unlimited)")
+    parser.add_argument("--offer-interval", type=float, default=OFFER_INTERVAL,
+                        help=f"seconds between UDP offers (default: {OFFER_INTERVAL})")
+    parser.add_argument("--offer-jitter", type=float, default=OFFER_JITTER,
+                        help="randomize each offer interval by up to this fraction "
+                             f"(default: {OFFER_JITTER})")
+    parser.add_argument("--broadcast", action="append", default=None, metavar="ADDRESS",
+                        help="send offers to ADDRESS, e.g. one interface's broadcast address; "
+                             "repeat for several (default: <broadcast>)")
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS,
+                        help=f"thread engine: sessions played at once (default: {MAX_SESSIONS})")
+    parser.add_argument("--queue", type=int, default=SESSION_QUEUE,
+                        help="thread engine: connections waiting for a session before new "
+                             f"ones are closed (default: {SESSION_QUEUE})")
+    parser.add_argument("--backlog", type=int, default=BACKLOG,
+                        help=f"TCP listen backlog (default: {BACKLOG})")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="deal every session from its own generator seeded from this "
+                             "master seed and the session id (unique across --workers), "
+                             "so runs can be replayed exactly")
+    parser.add_argument("--leaderboard", default=None, metavar="PATH",
+                        help="keep per-team results in the SQLite database at PATH "
+                             "(shared by --workers; read with leaderboard.py)")
+    parser.add_argument("--leaderboard-port", type=int, default=0,
+                        help="serve the top teams on 127.0.0.1:PORT (needs --leaderboard)")
+    parser.add_argument("--transcript", default=None, metavar="PATH",
+                        help="append every round to a binary transcript at PATH "
+                             "(PATH.<pid> per worker with --workers; read with transcript.py)")
+    args = parser.parse_args(argv)
+    if args.workers and not args.port:
+        parser.error("--workers needs a fixed --port")
+    if args.workers and args.stats_port:
+        parser.error("--stats-port needs a single process; use --stats-interval with --workers")
+    if args.leaderboard_port and (args.workers or not args.leaderboard):
+        parser.error("--leaderboard-port needs --leaderboard and a single process")
+    if args.decks < 1 or not 0.0 <= args.penetration < 1.0:
+        parser.error("--decks must be >= 1 and --penetration in [0, 1)")
+    if args.capacity < 0:
+        parser.error("--capacity must be >= 0")
+    if args.offer_interval <= 0 or not 0.0 <= args.offer_jitter < 1.0:
+        parser.error("--offer-interval must be > 0 and --offer-jitter in [0, 1)")
+    if args.broadcast is None:
+        args.broadcast = list(BROADCAST_ADDRESSES)
+    if args.max_sessions < 1 or args.queue < 0 or args.backlog < 1:
+        parser.error("--max-sessions and --backlog must be >= 1 and --queue >= 0")
+    if args.seed is not None and args.seed < 0:
+        parser.error("--seed must be >= 0")
+    return args
+
+
+# Run a connection engine in this process, with the periodic stats dump, the
+# transcript writer and the leaderboard (started here so every worker process
+# gets its own). The supervisor passes a worker its index among `workers` and
+# the sessions of the worker it replaces, which number its sessions (see
+# SessionStats.number_sessions); a worker puts its pid in the transcript's
+# file name.
+def run_engine(tcp_sock, engine, stats_interval=0.0, transcript=None,
+               leaderboard=None, leaderboard_port=0, worker=None, workers=1, sessions_before=0,
+               **options):
+    global TRANSCRIPT, BOARD
+    per_process = worker is not None
+    if per_process:
+        STATS.number_sessions(worker, workers, sessions_before)
+    if stats_interval:
+        threading.Thread(target=dump_stats, args=(METRICS, stats_interval), daemon=True).start()
+    if transcript:
+        from transcript import TranscriptWriter  # needs numpy, so only imported when used
+        TRANSCRIPT = TranscriptWriter(f"{transcript}.{os.getpid()}" if per_process else transcript)
+        METRICS.gauge("transcript_dropped", lambda: TRANSCRIPT.dropped)
+    if leaderboard:
+        BOARD = Leaderboard(leaderboard)
+        if leaderboard_port:
+            threading.Thread(target=serve_stats, args=(BOARD, leaderboard_port), daemon=True).start()
+            print(f"Leaderboard on 127.0.0.1:{leaderboard_port}")
+    try:
+        ENGINES[engine](tcp_sock, **options)
+    finally:
+        if TRANSCRIPT:
+            TRANSCRIPT.close()
+            print(f"Transcript {TRANSCRIPT.path}: run {TRANSCRIPT.run:08x}, "
+                  f"{TRANSCRIPT.dropped} records dropped", flush=True)
+        if BOARD:
+            BOARD.close()
+
+
+def main(argv=None):
+    global SHOES, SEED
+    args = parse_args(argv)
+    SHOES = ShoePool(args.decks, args.penetration)
+    SEED = args.seed
+    METRICS.enabled = args.metrics or bool(args.stats_port or args.stats_interval)
+    options = {"coalesce": args.coalesce}
+    if args.engine == "thread":
+        options.update(max_sessions=args.max_sessions, queue_size=args.queue)
+    serve = functools.partial(
+        run_engine,
+        engine=args.engine,
+        stats_interval=args.stats_interval,
+        transcript=args.transcript,
+        leaderboard=args.leaderboard,
+        leaderboard_port=args.leaderboard_port,
+        **options,
+    )
+
+    offer_options = {
+        "capacity": args.capacity,
+        "interval": args.offer_interval,
+        "jitter": args.offer_jitter,
+        "addresses": args.broadcast,
+    }
+
+    if args.workers:
+        supervise(
+            args.port,
+            args.workers,
+            serve,
+            STATS.load,
+            functools.partial(udp_offer_broadcaster, **offer_options),
+            args.backlog,
+        )
+        return
+
+    # Create TCP socket
+    tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    tcp_sock.bind(("", args.port))  # Port 0 binds to any available port
+    tcp_sock.listen(args.backlog)
+
+    tcp_port = tcp_sock.getsockname()[1]
+    print(f"Server started, listening on port {tcp_port} ({args.engine} engine)")
+
+    if args.stats_port:
+        threading.Thread(target=serve_stats, args=(METRICS, args.stats_port), daemon=True).start()
+        print(f"Latency stats on 127.0.0.1:{args.stats_port}")
+
+    # The asyncio engine broadcasts offers from its own event loop; the
+    # thread engine gets a broadcaster thread.
+    if args.engine == "asyncio":
+        serve(tcp_sock, offers=functools.partial(broadcast_offers, tcp_port, STATS.load,
+                                                 **offer_options))
+        return
+    threading.Thread(
+        target=udp_offer_broadcaster,
+        args=(tcp_port, STATS.load),
+        kwargs=offer_options,
+        daemon=True,
+    ).start()
+
+    serve(tcp_sock)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,124 @@
+# Compact card shoes and a pool of pre-shuffled shoes.
+# A shoe is a bytes object of card codes (rank * 4 + suit, see
+# blackijecky.card_code), so dealing is an index increment. A background
+# producer keeps shuffled shoes ready, so game threads never shuffle.
+# Seeded sessions instead shuffle their own shoes from a private generator
+# derived from a master seed and the session id (session_rng), so the cards
+# of any session can be dealt again exactly.
+
+import itertools
+import queue
+import random
+import threading
+
+from utils import MIN_RANK, MAX_RANK, SUITS
+from blackijecky import card_code, card_value
+
+
+# One standard 52-card deck as card codes.
+DECK_CODES = bytes(
+    card_code(rank, suit) for suit in SUITS for rank in range(MIN_RANK, MAX_RANK + 1)
+)
+
+POOL_SIZE = 64  # shuffled shoes kept ready
+
+PLAYER_MAX_HIT = 21   # the player may hit on any total that is not a bust
+DEALER_MAX_HIT = 16   # the dealer hits below 17
+
+
+# The generator of session session_id under master_seed. Every (seed,
+# session) pair gives an independent stream: the pair is packed into one
+# integer, which Random's seeding spreads over its whole state.
+def session_rng(master_seed: int, session_id: int) -> random.Random:
+    return random.Random((master_seed << 32) | (session_id & 0xFFFFFFFF))
+
+
+# Most cards one round can deal from a shoe of `decks` decks.
+# Every card but the player's last and the dealer's last is dealt while that
+# hand totals at most PLAYER_MAX_HIT or DEALER_MAX_HIT (aces counted as 1),
+# so those cards are at most as many as the smallest values of the shoe that
+# fit in both totals together.
+def max_round_cards(decks: int = 1) -> int:
+    values = sorted(1 if code >> 2 == 1 else card_value(code >> 2) for code in DECK_CODES * decks)
+    totals = itertools.accumulate(values)
+    return sum(1 for total in totals if total <= PLAYER_MAX_HIT + DEALER_MAX_HIT) + 2
+
+
+def shuffled_shoe(decks: int = 1, rng=random) -> bytes:
+    cards = DECK_CODES * decks
+    return bytes(rng.sample(cards, len(cards)))
+
+
+# Background producer of shuffled shoes.
+# take() never blocks: when the pool is empty the shoe is shuffled inline,
+# from the pool's own generator rather than the shared `random` module.
+# The producer thread and that generator are created on first use, so a pool
+# created before fork() gets its own of each in every worker process.
+class ShoePool:
+    def __init__(self, decks: int = 1, penetration: float = 0.0, size: int = POOL_SIZE):
+        if decks < 1:
+            raise ValueError("A shoe needs at least one deck")
+        if not 0.0 <= penetration < 1.0:
+            raise ValueError("Penetration must be in [0, 1)")
+        self.decks = decks
+        # Cards dealt from a shoe before it is replaced at the next round
+        # start: the cut card, or earlier if the rest might not last a round.
+        self.cut = min(int(len(DECK_CODES) * decks * penetration),
+                       len(DECK_CODES) * decks - max_round_cards(decks))
+        self._ready = queue.Queue(maxsize=size)
+        self._producer = None
+        self._rng = None
+        self._lock = threading.Lock()
+
+    def _produce(self):
+        # The producer's own generator: it never shares one with game threads.
+        rng = random.Random()
+        while True:
+            self._ready.put(shuffled_shoe(self.decks, rng))
+
+    def take(self) -> bytes:
+        if self._producer is None:
+            with self._lock:
+                if self._producer is None:
+                    self._rng = random.Random()
+                    self._producer = threading.Thread(target=self._produce, daemon=True)
+                    self._producer.start()
+        try:
+            return self._ready.get_nowait()
+        except queue.Empty:
+            return shuffled_shoe(self.decks, self._rng)
+
+
+# A session's position in its current shoe.
+# start_round() swaps in a fresh shoe once the cut card has been reached
+# (every round with penetration 0, like a freshly shuffled deck per round),
+# so a round never runs out of cards and never mixes two shoes.
+# Fresh shoes come from the pool, or are shuffled from rng when given.
+class Shoe:
+    __slots__ = ("pool", "rng", "cards", "position")
+
+    def __init__(self, pool: ShoePool, rng=None):
+        self.pool = pool
+        self.rng = rng
+        self.cards = self._fresh()
+        self.position = 0
+
+    def _fresh(self) -> bytes:
+        if self.rng is None:
+            return self.pool.take()
+        return shuffled_shoe(self.pool.decks, self.rng)
+
+    def start_round(self):
+        if self.position and self.position >= self.pool.cut:
+            self.cards = self._fresh()
+            self.position = 0
+
+    def draw(self) -> int:
+        try:
+            code = self.cards[self.position]
+        except IndexError:
+            # Cannot happen after start_round() (see ShoePool.cut); checked
+            # here rather than before every draw to keep dealing cheap.
+            raise AssertionError("Shoe ran out mid-round") from None
+        self.position += 1
+        return code
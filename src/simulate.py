@@ -0,0 +1,142 @@
+# Vectorized Monte Carlo simulation of Blackijecky rounds (requires numpy).
+# Plays whole batches of rounds at once with the same rules as
+# server.play_round: a fresh shuffled 52-card deck per round, the player acts
+# first and loses on bust, then the dealer hits below 17 (dealer_should_hit).
+
+import numpy as np
+
+from utils import MAX_RANK, SUITS
+from utils import DECISION_HIT
+from blackijecky import card_value, HAND_SOFT, HAND_TOTAL_MASK, HAND_TRANSITIONS
+from strategy import load_table
+
+
+DECK_SIZE = MAX_RANK * len(SUITS)
+BATCH_SIZE = 100_000  # rounds per NumPy batch; keeps the deck array cache-sized
+
+# Value of every card index 0..51 (index % 13 + 1 is the rank).
+_CARD_VALUES = np.array(
+    [card_value(i % MAX_RANK + 1) for i in range(DECK_SIZE)], dtype=np.int8
+)
+
+
+# A policy receives (player_total, player_soft, dealer_up_value) arrays for the
+# hands still deciding and returns a boolean array: True = hit.
+def threshold_policy(threshold: int):
+    def policy(total, _soft, _dealer_up):
+        return total < threshold
+    return policy
+
+
+# A decision table from strategy.load_table(), in vectorized form.
+def table_policy(table):
+    hits = np.array([[decision == DECISION_HIT for decision in row] for row in table])
+
+    def policy(total, soft, dealer_up):
+        return hits[total | np.where(soft, HAND_SOFT, 0), dealer_up]
+    return policy
+
+
+# The client's strategies, in vectorized form.
+POLICIES = {
+    "dealer": threshold_policy(17),          # as_dealer_decision
+    "careful": threshold_policy(15),         # careful_decision
+    "risk": threshold_policy(20),            # risk_decision
+    "basic": table_policy(load_table()),     # basic_decision
+}
+
+
+# _DEAL[hand, card] is the hand state (see blackijecky.Hand) after adding the
+# card with index 0..51, so dealing a card is a single table lookup.
+_DEAL = np.array(
+    [[HAND_TRANSITIONS[hand][card % MAX_RANK + 1] for card in range(DECK_SIZE)]
+     for hand in range(len(HAND_TRANSITIONS))],
+    dtype=np.int8,
+)
+
+
+# Deal the next card to each row in idx and return the card indices.
+# This is a lazy Fisher-Yates shuffle over the flattened (rows x 52) decks: only
+# the cards actually dealt are shuffled, so a round costs a handful of draws
+# instead of a full permutation.
+def _draw(flat, position, idx, rng):
+    k = position[idx]
+    base = idx * DECK_SIZE
+    j = base + k + (rng.random(idx.size, dtype=np.float32) * (DECK_SIZE - k)).astype(np.intp)
+    cards = flat[j]
+    flat[j] = flat[base + k]
+    position[idx] += 1
+    return cards
+
+
+def _simulate_batch(n, policy, rng):
+    decks = np.tile(np.arange(DECK_SIZE, dtype=np.int8), (n, 1))
+    flat = decks.reshape(-1)
+    rows = np.arange(n)
+    base = rows * DECK_SIZE
+
+    # Initial deal: player, player, dealer visible, dealer hidden.
+    # Every row is at the same deck position here, so columns can be sliced.
+    dealt = []
+    for k in range(4):
+        j = base + k + (rng.random(n, dtype=np.float32) * (DECK_SIZE - k)).astype(np.intp)
+        dealt.append(flat[j])
+        flat[j] = decks[:, k]
+    position = np.full(n, 4, dtype=np.intp)
+
+    player = _DEAL[_DEAL[0, dealt[0]], dealt[1]]
+    dealer = _DEAL[0, dealt[2]]
+    dealer_up = dealer & HAND_TOTAL_MASK
+    dealer = _DEAL[dealer, dealt[3]]
+
+    # Player turn
+    idx = rows
+    while idx.size:
+        hand = player[idx]
+        idx = idx[policy(hand & HAND_TOTAL_MASK, hand >= HAND_SOFT, dealer_up[idx])]
+        if not idx.size:
+            break
+        player[idx] = _DEAL[player[idx], _draw(flat, position, idx, rng)]
+        idx = idx[(player[idx] & HAND_TOTAL_MASK) <= 21]
+
+    player_total = player & HAND_TOTAL_MASK
+    player_bust = player_total > 21
+
+    # Dealer turn (only when the player did not bust)
+    idx = rows[~player_bust & ((dealer & HAND_TOTAL_MASK) < 17)]
+    while idx.size:
+        dealer[idx] = _DEAL[dealer[idx], _draw(flat, position, idx, rng)]
+        idx = idx[(dealer[idx] & HAND_TOTAL_MASK) < 17]
+
+    dealer_total = dealer & HAND_TOTAL_MASK
+    dealer_bust = ~player_bust & (dealer_total > 21)
+    compared = ~player_bust & ~dealer_bust
+
+    wins = int(dealer_bust.sum() + (compared & (player_total > dealer_total)).sum())
+    losses = int(player_bust.sum() + (compared & (player_total < dealer_total)).sum())
+    ties = n - wins - losses
+    return wins, losses, ties
+
+
+# Simulate n independent rounds; returns (wins, losses, ties) for the player.
+# player_policy is a name from POLICIES, an int stand threshold, or a
+# vectorized policy callable (see threshold_policy).
+def simulate_rounds(n: int, player_policy="dealer", seed=None):
+    if isinstance(player_policy, str):
+        policy = POLICIES[player_policy]
+    elif isinstance(player_policy, int):
+        policy = threshold_policy(player_policy)
+    else:
+        policy = player_policy
+
+    rng = np.random.default_rng(seed)
+    wins = losses = ties = 0
+    remaining = n
+    while remaining > 0:
+        batch = min(remaining, BATCH_SIZE)
+        w, l, t = _simulate_batch(batch, policy, rng)
+        wins += w
+        losses += l
+        ties += t
+        remaining -= batch
+    return wins, losses, ties
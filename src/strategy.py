@@ -0,0 +1,224 @@
+# Basic-strategy solver and table-driven decisions.
+# solve() computes exact hit/stand expected values under the server's rules
+# (a freshly shuffled shoe every round, the dealer hits below 17 per
+# dealer_should_hit, no double or split) by memoized dynamic programming over
+# (player hand, dealer up-card, remaining shoe composition). The values are
+# folded into one decision per (player hand, dealer up-card), weighted by how
+# often optimal play reaches each spot, and written as basic_strategy.txt.
+# load_table() turns that file into a lookup indexed by Hand.state and the
+# up-card value, so a decision is two list indexes.
+# Regenerate the shipped table with:  python strategy.py > basic_strategy.txt
+
+import argparse
+import os
+from collections import defaultdict
+from functools import lru_cache
+
+from utils import DECISION_HIT, DECISION_STAND
+from protocol import POLICY_HAND_STATES, POLICY_TABLE_SIZE
+from blackijecky import HAND_SOFT, HAND_TOTAL_MASK, HAND_TRANSITIONS
+
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "basic_strategy.txt")
+
+# The shoe composition is a tuple of counts by card value: ace, 2..9, ten-valued.
+# _RANKS[i] is a rank of the i-th value, used to step HAND_TRANSITIONS, and
+# _VALUES[i] is its blackjack value.
+_RANKS = (1, 2, 3, 4, 5, 6, 7, 8, 9, 10)
+_VALUES = (11, 2, 3, 4, 5, 6, 7, 8, 9, 10)
+
+# Table columns in the file: dealer up-card values 2..10, then ace (11).
+UP_VALUES = (2, 3, 4, 5, 6, 7, 8, 9, 10, 11)
+_UP_LABELS = ("2", "3", "4", "5", "6", "7", "8", "9", "T", "A")
+
+
+def full_shoe(decks: int = 1):
+    return (4 * decks,) * 9 + (16 * decks,)
+
+
+def _without(shoe, i):
+    return shoe[:i] + (shoe[i] - 1,) + shoe[i + 1:]
+
+
+# Probabilities of the dealer finishing on 17, 18, 19, 20, 21 or bust, from
+# hand state `dealer` with `shoe` left to draw from. The hidden card counts as
+# an ordinary draw: the player never sees it, so it is exchangeable with the
+# cards the player draws first.
+@lru_cache(maxsize=None)
+def _dealer_outcomes(dealer, shoe):
+    total = dealer & HAND_TOTAL_MASK
+    if total >= 17:
+        outcomes = [0.0] * 6
+        outcomes[total - 17 if total <= 21 else 5] = 1.0
+        return tuple(outcomes)
+
+    left = sum(shoe)
+    outcomes = [0.0] * 6
+    for i, count in enumerate(shoe):
+        if count:
+            p = count / left
+            sub = _dealer_outcomes(HAND_TRANSITIONS[dealer][_RANKS[i]], _without(shoe, i))
+            for k in range(6):
+                outcomes[k] += p * sub[k]
+    return tuple(outcomes)
+
+
+# Expected value of standing on `total` (win +1, loss -1, tie 0).
+def _stand_ev(total, up, shoe):
+    outcomes = _dealer_outcomes(HAND_TRANSITIONS[0][_RANKS[up]], shoe)
+    ev = outcomes[5]
+    for k in range(5):
+        dealer_total = 17 + k
+        if total > dealer_total:
+            ev += outcomes[k]
+        elif total < dealer_total:
+            ev -= outcomes[k]
+    return ev
+
+
+# (stand EV, hit EV) for a live player hand, playing optimally afterwards.
+@lru_cache(maxsize=None)
+def _player_evs(player, up, shoe):
+    stand = _stand_ev(player & HAND_TOTAL_MASK, up, shoe)
+    left = sum(shoe)
+    hit = 0.0
+    for i, count in enumerate(shoe):
+        if count:
+            p = count / left
+            after = HAND_TRANSITIONS[player][_RANKS[i]]
+            if after & HAND_TOTAL_MASK > 21:
+                hit -= p
+            else:
+                hit += p * max(_player_evs(after, up, _without(shoe, i)))
+    return stand, hit
+
+
+# Solve the game for a shoe of `decks` decks.
+# Returns (decisions, ev): decisions maps (player hand state, up-card value) to
+# True for hit, and ev is the expected value per round of the composition-
+# dependent optimal play the table is derived from.
+def solve(decks: int = 1):
+    shoe = full_shoe(decks)
+
+    # Initial deal: player, player, dealer up-card (the hidden card is drawn later).
+    frontier = defaultdict(float)
+    for a, count_a in enumerate(shoe):
+        shoe_a = _without(shoe, a)
+        for b, count_b in enumerate(shoe_a):
+            if not count_b:
+                continue
+            shoe_b = _without(shoe_a, b)
+            player = HAND_TRANSITIONS[HAND_TRANSITIONS[0][_RANKS[a]]][_RANKS[b]]
+            for up, count_up in enumerate(shoe_b):
+                if not count_up:
+                    continue
+                p = (count_a / sum(shoe)) * (count_b / sum(shoe_a)) * (count_up / sum(shoe_b))
+                frontier[player, up, _without(shoe_b, up)] += p
+
+    ev = sum(p * max(_player_evs(*key)) for key, p in frontier.items())
+
+    # Walk forward one card at a time, weighting every spot by how likely it is
+    # to be reached, and accumulate the weighted advantage of hitting.
+    advantage = defaultdict(float)
+    while frontier:
+        reached = defaultdict(float)
+        for (player, up, rest), p in frontier.items():
+            stand, hit = _player_evs(player, up, rest)
+            advantage[player, _VALUES[up]] += p * (hit - stand)
+            if hit <= stand:
+                continue
+            left = sum(rest)
+            for i, count in enumerate(rest):
+                if count:
+                    after = HAND_TRANSITIONS[player][_RANKS[i]]
+                    if after & HAND_TOTAL_MASK <= 21:
+                        reached[after, up, _without(rest, i)] += p * count / left
+        frontier = reached
+
+    decisions = {key: gain > 0 for key, gain in advantage.items()}
+    return decisions, ev
+
+
+# Table rows: hard 4..21, then soft 12..21, as (label, hand state).
+def _rows():
+    rows = [(f"hard {total}", total) for total in range(4, 22)]
+    rows += [(f"soft {total}", total | HAND_SOFT) for total in range(12, 22)]
+    return rows
+
+
+def format_table(decisions, header=()):
+    lines = [f"# {line}" for line in header]
+    lines.append("hand     " + " ".join(_UP_LABELS))
+    for label, state in _rows():
+        cells = ("H" if decisions.get((state, up), False) else "S" for up in UP_VALUES)
+        lines.append(f"{label:<8} " + " ".join(cells))
+    return "\n".join(lines) + "\n"
+
+
+# Load a table written by format_table().
+# Returns table with table[hand.state][up_value] -> DECISION_HIT / DECISION_STAND
+# for every hand state and up-card value 0..11; spots not in the file stand.
+def load_table(path: str = TABLE_PATH):
+    table = [[DECISION_STAND] * (UP_VALUES[-1] + 1) for _ in HAND_TRANSITIONS]
+    states = dict(_rows())
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith("#") or fields[0] == "hand":
+                continue
+            state = states[f"{fields[0]} {fields[1]}"]
+            for up, cell in zip(UP_VALUES, fields[2:]):
+                table[state][up] = DECISION_HIT if cell == "H" else DECISION_STAND
+    return table
+
+
+# A table in load_table()'s format that hits while the total is below threshold.
+def threshold_table(threshold: int):
+    return [
+        [DECISION_HIT if state & HAND_TOTAL_MASK < threshold else DECISION_STAND] * (UP_VALUES[-1] + 1)
+        for state in range(len(HAND_TRANSITIONS))
+    ]
+
+
+# Encode a table as the bits of a policy request (see protocol.py): one bit
+# per (hand state, up-card value), set to hit.
+def pack_table(table) -> bytes:
+    bits = 0
+    for state in range(POLICY_HAND_STATES):
+        for up in UP_VALUES:
+            bits = bits << 1 | (table[state][up] == DECISION_HIT)
+    return bits.to_bytes(POLICY_TABLE_SIZE, "big")
+
+
+# Decode policy request bits back into a table like load_table()'s.
+def unpack_table(data: bytes):
+    bits = int.from_bytes(data, "big")
+    table = [[DECISION_STAND] * (UP_VALUES[-1] + 1) for _ in range(POLICY_HAND_STATES)]
+    position = POLICY_HAND_STATES * len(UP_VALUES)
+    for state in range(POLICY_HAND_STATES):
+        for up in UP_VALUES:
+            position -= 1
+            if bits >> position & 1:
+                table[state][up] = DECISION_HIT
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Blackijecky basic-strategy solver")
+    parser.add_argument("--decks", type=int, default=1, help="decks per shoe (default: 1)")
+    args = parser.parse_args(argv)
+    if args.decks < 1:
+        parser.error("--decks must be >= 1")
+
+    decisions, ev = solve(args.decks)
+    print(format_table(decisions, header=(
+        "Blackijecky basic strategy: H = hit, S = stand.",
+        "Rows are the player's hand, columns the dealer's up-card.",
+        f"Solved for {args.decks}-deck shoes reshuffled every round, dealer hits below 17,",
+        f"no double or split. Expected value per round: {ev:+.4f}.",
+        "Generated by strategy.py; do not edit by hand.",
+    )), end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Connection deadlines on a central timer wheel.
+# Instead of a timeout on every socket, each connection holds a Deadline and
+# resets it (one clock read and one store) before it starts waiting on the
+# client. A single wheel thread visits deadlines once per expiry, re-files the
+# ones that were pushed back and fires the rest, so arming a deadline never
+# touches the wheel.
+
+import threading
+import time
+
+
+TICK = 0.1     # seconds per wheel slot: the resolution of deadlines
+SLOTS = 1024   # slots per revolution (~102 s at TICK)
+
+
+# A per-connection deadline. on_expire() runs on the wheel thread once the
+# deadline passes without reset(); it should unblock the connection (e.g. shut
+# its socket down) rather than do real work.
+class Deadline:
+    __slots__ = ("timeout", "expires", "on_expire", "expired", "cancelled")
+
+    def __init__(self, timeout: float, on_expire):
+        self.timeout = timeout
+        self.expires = time.monotonic() + timeout
+        self.on_expire = on_expire
+        self.expired = False
+        self.cancelled = False
+
+    # Restart the countdown, optionally with a new timeout.
+    def reset(self, timeout=None):
+        if timeout is not None:
+            self.timeout = timeout
+        self.expires = time.monotonic() + self.timeout
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    def __init__(self, tick: float = TICK, slots: int = SLOTS):
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._lock = threading.Lock()
+        self._origin = time.monotonic()
+        self._next = 0          # next tick to process
+        self._thread = None
+
+    # Arm a new deadline of timeout seconds. The wheel thread starts on first use.
+    def deadline(self, timeout: float, on_expire) -> Deadline:
+        entry = Deadline(timeout, on_expire)
+        with self._lock:
+            self._file(entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return entry
+
+    # Put an entry in the slot of the tick its deadline falls in (never one
+    # that has already been processed). Call with the lock held.
+    def _file(self, entry):
+        tick = max(int((entry.expires - self._origin) / self.tick) + 1, self._next)
+        self._slots[tick % len(self._slots)].append(entry)
+
+    def _run(self):
+        while True:
+            wake = self._origin + self._next * self.tick
+            delay = wake - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            now = time.monotonic()
+            due = []
+            with self._lock:
+                slot = self._slots[self._next % len(self._slots)]
+                self._slots[self._next % len(self._slots)] = []
+                self._next += 1
+                for entry in slot:
+                    if entry.cancelled:
+                        continue
+                    if entry.expires > now:
+                        self._file(entry)      # reset since it was filed, or a later revolution
+                    else:
+                        due.append(entry)
+            for entry in due:
+                entry.expired = True
+                try:
+                    entry.on_expire()
+                except Exception:
+                    pass
@@ -0,0 +1,134 @@
+# Strategy tournament: rank client policies over many simulated rounds.
+# Rounds are played in-process with the vectorized rules of simulate.py (no
+# sockets). Every strategy's rounds are cut into shards that run on a
+# ProcessPoolExecutor; shard j always draws from the RNG seeded with
+# SeedSequence(seed, spawn_key=(j,)), so results only depend on --seed and
+# --shard-size, not on the number of processes or the order of strategies.
+# All strategies share the same streams (common random numbers), which makes
+# the differences between them less noisy.
+# Example:  python tournament.py --rounds 10000000 --thresholds 12-20 --processes 8
+
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from simulate import POLICIES, simulate_rounds, table_policy, threshold_policy
+from strategy import load_table
+
+
+SHARD_SIZE = 1_000_000  # rounds per task
+Z_95 = 1.959964         # two-sided 95% normal quantile
+
+
+# Turn a strategy spec into a vectorized policy:
+# a POLICIES name, "threshold:N" (hit below N) or "table:PATH" (strategy.py table).
+def resolve_policy(spec: str):
+    kind, _, arg = spec.partition(":")
+    if kind == "threshold" and arg:
+        return threshold_policy(int(arg))
+    if kind == "table" and arg:
+        return table_policy(load_table(arg))
+    if spec in POLICIES:
+        return POLICIES[spec]
+    raise ValueError(f"Unknown strategy: {spec}")
+
+
+def _run_shard(job):
+    index, spec, shard, rounds, seed = job
+    rng_seed = np.random.SeedSequence(seed, spawn_key=(shard,))
+    return index, simulate_rounds(rounds, resolve_policy(spec), seed=rng_seed)
+
+
+# Summary of one strategy's counts: expected value per round and win rate,
+# each with the half-width of its 95% confidence interval.
+class Standing:
+    def __init__(self, spec, wins, losses, ties):
+        self.spec = spec
+        self.wins = wins
+        self.losses = losses
+        self.ties = ties
+        self.rounds = n = wins + losses + ties
+        # Per-round result is +1 / -1 / 0.
+        self.ev = (wins - losses) / n
+        self.ev_ci = Z_95 * math.sqrt(max((wins + losses) / n - self.ev ** 2, 0.0) / n)
+        self.win_rate = wins / n
+        self.win_rate_ci = Z_95 * math.sqrt(self.win_rate * (1 - self.win_rate) / n)
+
+
+# Play `rounds` rounds of every strategy in specs and return their standings,
+# best expected value first.
+def run_tournament(specs, rounds, seed=0, processes=None, shard_size=SHARD_SIZE):
+    for spec in specs:
+        resolve_policy(spec)  # fail fast, before any process starts
+
+    jobs = []
+    for index, spec in enumerate(specs):
+        for shard, start in enumerate(range(0, rounds, shard_size)):
+            jobs.append((index, spec, shard, min(shard_size, rounds - start), seed))
+
+    totals = [[0, 0, 0] for _ in specs]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        # Many small jobs per worker keep the pool balanced; order does not
+        # matter because counts are summed.
+        for index, counts in pool.map(_run_shard, jobs, chunksize=1):
+            for k in range(3):
+                totals[index][k] += counts[k]
+
+    standings = [Standing(spec, *totals[index]) for index, spec in enumerate(specs)]
+    standings.sort(key=lambda standing: standing.ev, reverse=True)
+    return standings
+
+
+def print_standings(standings, elapsed):
+    print(f"{'#':>3} {'strategy':<20} {'rounds':>12} {'win %':>16} {'loss %':>7} "
+          f"{'tie %':>6} {'EV/round':>18}")
+    for place, s in enumerate(standings, 1):
+        print(f"{place:>3} {s.spec:<20} {s.rounds:>12,} "
+              f"{100 * s.win_rate:>7.3f} ± {100 * s.win_rate_ci:<6.3f} "
+              f"{100 * s.losses / s.rounds:>7.3f} {100 * s.ties / s.rounds:>6.3f} "
+              f"{s.ev:>+8.5f} ± {s.ev_ci:<7.5f}")
+    played = sum(s.rounds for s in standings)
+    print(f"{played:,} rounds in {elapsed:.2f}s ({played / elapsed:,.0f} rounds/s); "
+          "intervals are 95%")
+
+
+def parse_thresholds(text):
+    low, _, high = text.partition("-")
+    return [f"threshold:{n}" for n in range(int(low), int(high or low) + 1)]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Blackijecky strategy tournament")
+    parser.add_argument("strategies", nargs="*",
+                        help="POLICIES names, threshold:N or table:PATH "
+                             "(default: dealer careful risk basic)")
+    parser.add_argument("--thresholds", default=None,
+                        help="also play threshold policies, e.g. 12-20")
+    parser.add_argument("--rounds", type=int, default=10_000_000,
+                        help="rounds per strategy (default: 10,000,000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    args = parser.parse_args(argv)
+    if args.rounds < 1 or args.shard_size < 1 or args.processes < 1:
+        parser.error("--rounds, --shard-size and --processes must be >= 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    specs = args.strategies or ["dealer", "careful", "risk", "basic"]
+    if args.thresholds:
+        specs += parse_thresholds(args.thresholds)
+
+    start = time.perf_counter()
+    standings = run_tournament(specs, args.rounds, args.seed, args.processes, args.shard_size)
+    print_standings(standings, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
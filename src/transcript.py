@@ -0,0 +1,285 @@
+# Round transcripts: a compact append-only binary log of every round played.
+# The log is a sequence of fixed-width RECORD_SIZE records, little-endian:
+#   session record  kind=1, run id, session id, team name
+#   round record    kind=0, result, player card count, dealer card count,
+#                   run id, session id, round number, the player's cards
+#                   then the dealer's cards as card codes (rank * 4 + suit)
+# Session ids restart with every server process, so each writer stamps its
+# records with a run id made from its pid and start time; a session is a
+# (run id, session id) pair, and appending after a restart or from several
+# processes never merges unrelated sessions.
+# Decisions are implied by the cards: every player card after the first two
+# was a hit, and a round that did not end in a player bust ended with a stand.
+# Cards beyond RECORD_CARDS (only possible with several decks) are not kept;
+# the counts are always exact.
+#
+# TranscriptWriter packs records on the game threads and hands them to a
+# background thread that writes them in batches, so a session never waits on
+# the disk. TranscriptLog memory-maps a log as a numpy record array for
+# vectorized summaries and replay.
+# Example:  python transcript.py rounds.log            (per-team summary)
+#           python transcript.py rounds.log --replay --session 3
+#           python transcript.py rounds.log --replay --run 1f2e3d4c --session 3
+
+import argparse
+import itertools
+import mmap
+import struct
+import os
+import threading
+import time
+import zlib
+from collections import deque
+
+import numpy as np
+
+from utils import RESULT_WIN, RESULT_LOSS, RESULT_TIE, format_card
+from blackijecky import HAND_TOTAL_MASK, HAND_TRANSITIONS, card_from_code
+
+
+KIND_ROUND = 0
+KIND_SESSION = 1
+
+RECORD_CARDS = 28
+ROUND_STRUCT = struct.Struct(f"<B B B B I I I {RECORD_CARDS}s")
+SESSION_STRUCT = struct.Struct("<B 3x I I 32s")
+RECORD_SIZE = ROUND_STRUCT.size  # 44 bytes, like SESSION_STRUCT
+
+ROUND_DTYPE = np.dtype([
+    ("kind", "u1"), ("result", "u1"), ("player", "u1"), ("dealer", "u1"),
+    ("run", "<u4"), ("session", "<u4"), ("round", "<u4"), ("cards", "u1", RECORD_CARDS),
+])
+SESSION_DTYPE = np.dtype([
+    ("kind", "u1"), ("pad", "u1", 3), ("run", "<u4"), ("session", "<u4"), ("team", "S32"),
+])
+
+FLUSH_INTERVAL = 0.5     # seconds between background writes
+MAX_PENDING = 1 << 20    # records queued for the writer before new ones are dropped
+
+
+# Appends transcript records to path from any number of threads.
+# Records are queued without locking and written by a daemon thread every
+# FLUSH_INTERVAL; if the disk falls MAX_PENDING records behind, further
+# records are dropped and counted in `dropped` rather than block the game.
+# close() writes whatever is still queued.
+class TranscriptWriter:
+    def __init__(self, path: str, flush_interval: float = FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.run = run_id()
+        self.dropped = 0
+        self._file = open(path, "ab")
+        self._pending = deque()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Start session `session` of team_name and return its log(result,
+    # player_cards, dealer_cards), which records the session's rounds in order.
+    def session(self, session: int, team_name: str):
+        session &= 0xFFFFFFFF
+        run = self.run
+        self._append(SESSION_STRUCT.pack(KIND_SESSION, run, session, team_name.encode()[:32]))
+        rounds = itertools.count(1)
+        pack = ROUND_STRUCT.pack
+        append = self._append
+
+        def log(result, player_cards, dealer_cards):
+            append(pack(KIND_ROUND, result, len(player_cards), len(dealer_cards),
+                        run, session, next(rounds) & 0xFFFFFFFF, bytes(player_cards + dealer_cards)))
+        return log
+
+    def _append(self, record: bytes):
+        if len(self._pending) >= MAX_PENDING:
+            self.dropped += 1
+            return
+        self._pending.append(record)
+
+    def _write_pending(self):
+        pending = self._pending
+        batch = []
+        while pending:
+            batch.append(pending.popleft())
+        if batch:
+            self._file.write(b"".join(batch))
+            self._file.flush()
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            self._write_pending()
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+        self._write_pending()
+        self._file.close()
+
+
+# Run id of a writer started now: a hash of the pid and the start time.
+def run_id() -> int:
+    return zlib.crc32(struct.pack("<I q", os.getpid(), time.time_ns()))
+
+
+# (run id, session id) of each record as one integer, the key sessions are
+# grouped by.
+def session_keys(records):
+    return (records["run"].astype(np.uint64) << np.uint64(32)) | records["session"]
+
+
+# Read-only view of a transcript log.
+# records is the whole file as a ROUND_DTYPE array backed by the mapping
+# (a trailing partial record, e.g. from a crash mid-write, is ignored);
+# rounds and sessions select the records of each kind.
+class TranscriptLog:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            size = f.seek(0, 2)
+            count = size // RECORD_SIZE
+            if count:
+                self._map = mmap.mmap(f.fileno(), count * RECORD_SIZE, access=mmap.ACCESS_READ)
+                self.records = np.frombuffer(self._map, dtype=ROUND_DTYPE)
+            else:
+                self._map = None
+                self.records = np.zeros(0, dtype=ROUND_DTYPE)
+
+    @property
+    def rounds(self):
+        return self.records[self.records["kind"] == KIND_ROUND]
+
+    @property
+    def sessions(self):
+        sessions = self.records.view(SESSION_DTYPE)
+        return sessions[sessions["kind"] == KIND_SESSION]
+
+    # Session key (see session_keys) -> team name.
+    def teams(self):
+        sessions = self.sessions
+        return {int(k): _decode_team(t) for k, t in zip(session_keys(sessions), sessions["team"])}
+
+    def close(self):
+        self.records = None
+        if self._map is not None:
+            self._map.close()
+
+
+def _decode_team(raw: bytes) -> str:
+    return raw.rstrip(b"\x00").decode(errors="replace")
+
+
+_TRANSITIONS = np.array(HAND_TRANSITIONS, dtype=np.uint8)
+
+
+# Final hand totals of every round, as (player totals, dealer totals).
+# Hands are stepped through HAND_TRANSITIONS one card column at a time, so
+# the cost is RECORD_CARDS vectorized lookups whatever the number of rounds.
+def hand_totals(rounds):
+    cards = rounds["cards"]
+    ranks = cards >> 2
+    player_end = rounds["player"].astype(np.intp)
+    dealer_end = player_end + rounds["dealer"]
+    player = np.zeros(len(rounds), dtype=np.uint8)
+    dealer = np.zeros(len(rounds), dtype=np.uint8)
+    for j in range(RECORD_CARDS):
+        column = ranks[:, j]
+        in_player = j < player_end
+        in_dealer = ~in_player & (j < dealer_end)
+        player = np.where(in_player, _TRANSITIONS[player, column], player)
+        dealer = np.where(in_dealer, _TRANSITIONS[dealer, column], dealer)
+    return player & HAND_TOTAL_MASK, dealer & HAND_TOTAL_MASK
+
+
+# Per-team totals of one or more logs: team -> dict of rounds, wins,
+# losses, ties, player_busts and dealer_busts.
+def summarize(paths):
+    summary = {}
+    for path in paths:
+        log = TranscriptLog(path)
+        try:
+            rounds = log.rounds
+            teams = log.teams()
+            player, dealer = hand_totals(rounds)
+            columns = {
+                "wins": rounds["result"] == RESULT_WIN,
+                "losses": rounds["result"] == RESULT_LOSS,
+                "ties": rounds["result"] == RESULT_TIE,
+                "player_busts": player > 21,
+                "dealer_busts": dealer > 21,
+            }
+            # Group by session with one bincount per column, then by team.
+            ids, index = np.unique(session_keys(rounds), return_inverse=True)
+            counts = {"rounds": np.bincount(index, minlength=len(ids))}
+            for name, mask in columns.items():
+                counts[name] = np.bincount(index, weights=mask, minlength=len(ids))
+            for i, session in enumerate(ids):
+                team = teams.get(int(session), "?")
+                totals = summary.setdefault(team, dict.fromkeys(counts, 0))
+                for name, column in counts.items():
+                    totals[name] += int(column[i])
+        finally:
+            log.close()
+    return summary
+
+
+def print_summary(summary, elapsed):
+    print(f"{'team':<24} {'rounds':>10} {'win %':>7} {'loss %':>7} {'tie %':>7} "
+          f"{'bust %':>7} {'dealer bust %':>14}")
+    for team, t in sorted(summary.items(), key=lambda item: -item[1]["rounds"]):
+        n = t["rounds"] or 1
+        print(f"{team:<24} {t['rounds']:>10,} {100 * t['wins'] / n:>7.2f} "
+              f"{100 * t['losses'] / n:>7.2f} {100 * t['ties'] / n:>7.2f} "
+              f"{100 * t['player_busts'] / n:>7.2f} {100 * t['dealer_busts'] / n:>14.2f}")
+    rounds = sum(t["rounds"] for t in summary.values())
+    print(f"{rounds:,} rounds in {elapsed:.3f}s ({rounds / max(elapsed, 1e-9):,.0f} rounds/s)")
+
+
+def _cards_text(codes):
+    return ", ".join(format_card(*card_from_code(code)) for code in codes)
+
+
+_RESULT_NAMES = {RESULT_WIN: "win", RESULT_LOSS: "loss", RESULT_TIE: "tie"}
+
+
+# Print the rounds of a log, optionally only those of one run and/or session.
+def replay(path, session=None, run=None):
+    log = TranscriptLog(path)
+    try:
+        teams = log.teams()
+        rounds = log.rounds
+        if session is not None:
+            rounds = rounds[rounds["session"] == session]
+        if run is not None:
+            rounds = rounds[rounds["run"] == run]
+        keys = session_keys(rounds)
+        player_totals, dealer_totals = hand_totals(rounds)
+        for r, key, player_total, dealer_total in zip(rounds, keys, player_totals, dealer_totals):
+            cards = r["cards"].tobytes()
+            player = r["player"]
+            dealer = cards[player:player + r["dealer"]]
+            print(f"run {r['run']:08x} session {r['session']} ({teams.get(int(key), '?')}) "
+                  f"round {r['round']}: player [{_cards_text(cards[:player])}] = {player_total}, "
+                  f"dealer [{_cards_text(dealer)}] = {dealer_total}, "
+                  f"{max(player - 2, 0)} hit(s) -> {_RESULT_NAMES.get(int(r['result']), '?')}")
+    finally:
+        log.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Blackijecky transcript reader")
+    parser.add_argument("logs", nargs="+", help="transcript files written by server.py --transcript")
+    parser.add_argument("--replay", action="store_true", help="print every round instead of a summary")
+    parser.add_argument("--session", type=int, default=None, help="with --replay, only this session")
+    parser.add_argument("--run", type=lambda text: int(text, 16), default=None,
+                        help="with --replay, only this run (hex, as printed)")
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        for path in args.logs:
+            replay(path, args.session, args.run)
+        return
+    start = time.perf_counter()
+    summary = summarize(args.logs)
+    print_summary(summary, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
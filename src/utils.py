@@ -1,3 +1,6 @@
+import os
+import time
+
 
 # ----- Protocol constants -----
 
@@ -8,6 +11,20 @@ MAGIC_COOKIE = 0xabcddcba
 MSG_TYPE_OFFER = 0x2
 MSG_TYPE_REQUEST = 0x3
 MSG_TYPE_PAYLOAD = 0x4
+# Extension: many game tables over one connection (see protocol.py)
+MSG_TYPE_MUX_REQUEST = 0x5
+MSG_TYPE_MUX_PAYLOAD = 0x6
+# Extension: streaming sessions beyond 255 rounds (see protocol.py)
+MSG_TYPE_STREAM_REQUEST = 0x7
+MSG_TYPE_STREAM_CREDIT = 0x8
+MSG_TYPE_STREAM_END = 0x9
+# Extension: offers that also advertise server load (see protocol.py)
+MSG_TYPE_OFFER_LOAD = 0xA
+# Extension: the server plays the client's policy (see protocol.py)
+MSG_TYPE_POLICY_REQUEST = 0xB
+# Extension: the server plays a whole batch of rounds and returns the results (see protocol.py)
+MSG_TYPE_BATCH_REQUEST = 0xC
+MSG_TYPE_BATCH_RESULTS = 0xD
 
 # Fixed sizes
 TEAM_NAME_SIZE = 32  # bytes, fixed-length name (pad with 0x00 or truncate)
@@ -116,3 +133,127 @@ def recv_exact(sock, n: int) -> bytes:
         data += chunk
     return data
 
+
+
+# Buffered, zero-copy reader of fixed-size frames from a stream socket.
+# Each recv_into pulls in as much as is already available (often several
+# frames at once), and read() hands frames out as memoryview slices of one
+# reusable buffer instead of building new bytes objects.
+# A returned view is only valid until the next call to read().
+# deadline (a timers.Deadline), when given, is reset whenever a frame has to
+# be waited for, so every frame must arrive within its timeout.
+class FrameReader:
+    def __init__(self, sock, capacity: int = 4096, deadline=None):
+        self.sock = sock
+        self.deadline = deadline
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._start = 0   # first unread byte
+        self._end = 0     # end of received data
+
+    def read(self, n: int) -> memoryview:
+        if self._end - self._start < n:
+            if self.deadline:
+                self.deadline.reset()
+            self._fill(n)
+        frame = self._view[self._start:self._start + n]
+        self._start += n
+        return frame
+
+    # Like read(), but the bytes stay unread.
+    def peek(self, n: int) -> memoryview:
+        if self._end - self._start < n:
+            if self.deadline:
+                self.deadline.reset()
+            self._fill(n)
+        return self._view[self._start:self._start + n]
+
+    # Number of bytes that can be read without receiving.
+    @property
+    def buffered(self) -> int:
+        return self._end - self._start
+
+    # Receive until at least n unread bytes are buffered. The buffer grows
+    # when a frame (e.g. a batch results body) is larger than it.
+    def _fill(self, n: int):
+        unread = self._end - self._start
+        if n > len(self._buffer):
+            self._buffer = bytearray(self._view[self._start:self._end]) + bytearray(n - unread)
+            self._view = memoryview(self._buffer)
+            self._start, self._end = 0, unread
+        if unread == 0 or self._start + n > len(self._buffer):
+            # Move the unread bytes (if any) to the front to make room.
+            self._buffer[:unread] = self._view[self._start:self._end]
+            self._start, self._end = 0, unread
+
+        while self._end - self._start < n:
+            received = self.sock.recv_into(self._view[self._end:])
+            if not received:
+                raise ConnectionError("Socket closed while reading")
+            self._end += received
+
+
+# Most buffers one sendmsg() call accepts.
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+if IOV_MAX <= 0:
+    IOV_MAX = 1024
+
+
+# Writer of outgoing frames for a stream socket.
+# With coalesce=True frames are only collected by write(), and flush() sends
+# everything collected with as few sendmsg (writev) calls as IOV_MAX allows. Otherwise every
+# frame is sent immediately and flush() has nothing to do.
+# on_send(seconds), when given, is called with the duration of every send.
+# deadline, when given, is reset before every send, like FrameReader's.
+class FrameWriter:
+    def __init__(self, sock, coalesce: bool = True, on_send=None, deadline=None):
+        self.sock = sock
+        self.coalesce = coalesce
+        self.on_send = on_send
+        self.deadline = deadline
+        self._pending = []
+
+    def write(self, frame):
+        if self.coalesce:
+            self._pending.append(frame)
+            return
+        if self.deadline:
+            self.deadline.reset()
+        if self.on_send:
+            start = time.perf_counter()
+            self.sock.sendall(frame)
+            self.on_send(time.perf_counter() - start)
+        else:
+            self.sock.sendall(frame)
+
+    # Number of frames collected since the last flush.
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self):
+        if not self._pending:
+            return
+        frames = self._pending
+        self._pending = []
+        if self.deadline:
+            self.deadline.reset()
+        if self.on_send:
+            start = time.perf_counter()
+            self._send_frames(frames)
+            self.on_send(time.perf_counter() - start)
+        else:
+            self._send_frames(frames)
+
+    # sendmsg() takes at most IOV_MAX buffers, so frames go out IOV_MAX at a
+    # time; a short write sends the rest of its slice before the next one.
+    def _send_frames(self, frames):
+        for first in range(0, len(frames), IOV_MAX):
+            batch = frames[first:first + IOV_MAX]
+            sent = self.sock.sendmsg(batch)
+            total = sum(len(frame) for frame in batch)
+            if sent < total:
+                self.sock.sendall(b"".join(batch)[sent:])
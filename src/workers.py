@@ -0,0 +1,125 @@
+# Multi-process server mode.
+# A supervisor forks worker processes that each accept on their own
+# SO_REUSEPORT listener bound to the same fixed port, so the kernel spreads
+# incoming connections across all CPU cores. Only the supervisor broadcasts
+# UDP offers, advertising the load of all workers together. Crashed workers
+# are restarted. On Ctrl-C the supervisor terminates the workers, which shut
+# down as a single-process server does (closing their transcripts).
+
+import multiprocessing
+import signal
+import socket
+import threading
+import time
+
+
+REPORT_INTERVAL = 5.0  # seconds between supervisor status lines
+COUNTER_SYNC_INTERVAL = 0.5  # seconds between worker -> supervisor counter copies
+LOAD_FIELDS = 3  # (sessions so far, active sessions, rounds so far) per worker
+SHUTDOWN_GRACE = 5.0  # seconds a terminated worker gets to shut down before it is killed
+
+
+# Create a TCP listener that can share its port with the other workers.
+def reuseport_listener(port: int, backlog: int = socket.SOMAXCONN) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("", port))
+    sock.listen(backlog)
+    return sock
+
+
+# SIGTERM handler of a worker: stop it the way Ctrl-C stops a single server.
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+# Entry point of a worker process.
+# load() is read periodically and copied into this worker's slots of the
+# shared counts array for the supervisor to report and advertise.
+# sessions_before is how many sessions earlier workers at this index served.
+def _worker_main(index, num_workers, sessions_before, port, serve, load, counts, backlog):
+    # Ctrl-C reaches the whole process group; only the supervisor acts on it.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _interrupt)
+    sock = reuseport_listener(port, backlog)
+    first = index * LOAD_FIELDS
+
+    def sync_counts():
+        while True:
+            counts[first:first + LOAD_FIELDS] = load()
+            time.sleep(COUNTER_SYNC_INTERVAL)
+
+    threading.Thread(target=sync_counts, daemon=True).start()
+    serve(sock, worker=index, workers=num_workers, sessions_before=sessions_before)
+
+
+# Run num_workers worker processes on the fixed port until interrupted.
+# serve(sock, worker=index, workers=num_workers, sessions_before=n) is the
+# connection engine each worker runs on its listener; n counts the sessions
+# of the earlier workers at that index, as last reported by them.
+# load() returns a worker's (sessions so far, active sessions, rounds so far).
+# broadcaster(port, load) is started once, in the supervisor only, with a
+# load() that sums all workers. backlog is each worker listener's.
+def supervise(port, num_workers, serve, load, broadcaster, backlog=socket.SOMAXCONN):
+    ctx = multiprocessing.get_context("fork")
+    counts = ctx.Array("Q", num_workers * LOAD_FIELDS, lock=False)
+    # Sessions and rounds served by earlier, crashed workers.
+    finished = [[0, 0] for _ in range(num_workers)]
+
+    def spawn(index):
+        first = index * LOAD_FIELDS
+        counts[first:first + LOAD_FIELDS] = [0] * LOAD_FIELDS
+        proc = ctx.Process(
+            target=_worker_main,
+            args=(index, num_workers, finished[index][0], port, serve, load, counts, backlog),
+            daemon=True,
+        )
+        proc.start()
+        return proc
+
+    def sessions(index):
+        return finished[index][0] + counts[index * LOAD_FIELDS]
+
+    def total_load():
+        active = sum(counts[i * LOAD_FIELDS + 1] for i in range(num_workers))
+        rounds = sum(finished[i][1] + counts[i * LOAD_FIELDS + 2] for i in range(num_workers))
+        return sum(sessions(i) for i in range(num_workers)), active, rounds
+
+    procs = [spawn(i) for i in range(num_workers)]
+    print(f"Supervisor started {num_workers} workers on port {port}")
+
+    udp_thread = threading.Thread(target=broadcaster, args=(port, total_load), daemon=True)
+    udp_thread.start()
+
+    next_report = time.monotonic() + REPORT_INTERVAL
+    try:
+        while True:
+            time.sleep(0.2)
+
+            for i, proc in enumerate(procs):
+                if proc.is_alive():
+                    continue
+                print(f"Worker {i} (pid {proc.pid}) exited with code {proc.exitcode}, restarting")
+                finished[i][0] += counts[i * LOAD_FIELDS]
+                finished[i][1] += counts[i * LOAD_FIELDS + 2]
+                procs[i] = spawn(i)
+
+            if time.monotonic() >= next_report:
+                next_report += REPORT_INTERVAL
+                per_worker = ", ".join(
+                    f"w{i}[pid {proc.pid}]={sessions(i)}" for i, proc in enumerate(procs)
+                )
+                total = sum(sessions(i) for i in range(num_workers))
+                print(f"Sessions per worker: {per_worker} (total {total})")
+
+    except KeyboardInterrupt:
+        print("Supervisor shutting down.")
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.join(SHUTDOWN_GRACE)
+            if proc.is_alive():
+                proc.kill()
+                proc.join()